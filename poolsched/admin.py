@@ -1,7 +1,57 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import NoReverseMatch, reverse
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
-from .models import Worker, Job, Intention, ArchJob, ArchivedIntention, Log, ScheduledIntention
+from .models import Worker, Job, Intention, ArchJob, ArchivedIntention, Log, ScheduledIntention, UserShare, Resource, \
+    ArchiveSummary
+
+# Tables estimated to have more rows than this are not counted in changelists
+APPROXIMATE_COUNT = getattr(settings, 'POOLSCHED_ADMIN_APPROXIMATE_COUNT', 10000)
+
+
+class ApproximatePaginator(Paginator):
+    """Paginator using the estimate of the database for unfiltered big tables
+
+    Counting all the rows of a huge table is a full scan in most
+    databases. With no filters, the number of rows estimated by the
+    database (PostgreSQL, MySQL) is used instead, if it is over
+    APPROXIMATE_COUNT. Filtered querysets are counted as usual.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_rows(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate > APPROXIMATE_COUNT:
+                return estimate
+        return super().count
+
+
+def estimated_rows(model, using='default'):
+    """Number of rows of the table of a model, as estimated by the database
+
+    :returns: number of rows, or None if the backend can't estimate it
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'mysql':
+        sql, params = 'SELECT table_rows FROM information_schema.tables ' \
+                      'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
 
 
 def user_name(obj):
@@ -12,7 +62,24 @@ def user_name(obj):
 
 
 def previous_count(obj):
-    return obj.previous.count()
+    # Annotated by IntentionAdmin.get_queryset
+    return obj.previous_count
+
+
+previous_count.admin_order_field = 'previous_count'
+
+
+def child_link(kind, obj_id):
+    """Link to the changelist of the child class (kind) of an object"""
+    if not kind:
+        return None
+    app_label, model_name = kind.split('.', 1)
+    name = f"{model_name}({obj_id})"
+    try:
+        url = reverse(f'admin:{app_label}_{model_name}_changelist')
+    except NoReverseMatch:
+        return name
+    return format_html("<a href='{url}?q={id}'>{name}</a>", url=url, id=obj_id, name=name)
 
 
 class RunningInAWorker(admin.SimpleListFilter):
@@ -50,6 +117,7 @@ class RunningInAWorker(admin.SimpleListFilter):
 @admin.register(Job)
 class JobAdmin(admin.ModelAdmin):
     list_display = ('id', 'created', 'worker', 'logs_file')
+    list_select_related = ('worker', 'logs')
     search_fields = ('id',)
     list_filter = ('created',)
     ordering = ('created', )
@@ -64,9 +132,12 @@ class JobAdmin(admin.ModelAdmin):
 @admin.register(ArchJob)
 class ArchJobAdmin(admin.ModelAdmin):
     list_display = ('id', 'created', 'archived', 'worker', 'worker_machine', 'logs_file')
+    list_select_related = ('worker', 'logs')
     search_fields = ('id',)
     list_filter = ('created', 'archived')
     ordering = ('archived', )
+    paginator = ApproximatePaginator
+    show_full_result_count = False
 
     def worker_machine(self, obj):
         try:
@@ -84,9 +155,21 @@ class ArchJobAdmin(admin.ModelAdmin):
 @admin.register(Intention)
 class IntentionAdmin(admin.ModelAdmin):
     list_display = ('id', 'created', 'started', 'job_id', 'worker', user_name, previous_count, 'child', 'logs')
+    list_select_related = ('user', 'job__worker')
     search_fields = ('id', 'user__first_name')
     list_filter = ('created', RunningInAWorker)
     ordering = ('created', )
+    paginator = ApproximatePaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Correlated subquery, instead of a join with GROUP BY over all the rows
+        previous = Intention.previous.through.objects.filter(from_intention=OuterRef('pk'))\
+            .order_by()\
+            .values('from_intention')\
+            .annotate(count=Count('id'))\
+            .values('count')
+        return super().get_queryset(request).annotate(previous_count=Coalesce(Subquery(previous), 0))
 
     def started(self, obj):
         try:
@@ -101,11 +184,7 @@ class IntentionAdmin(admin.ModelAdmin):
             return None
 
     def child(self, obj):
-        try:
-            child = obj.cast()
-            return f"{child._meta.model_name}({child.id})"
-        except AttributeError:
-            return None
+        return child_link(obj.kind, obj.id)
 
     def worker(self, obj):
         try:
@@ -114,19 +193,21 @@ class IntentionAdmin(admin.ModelAdmin):
             return None
 
     def logs(self, obj):
-        try:
-            url = "/logs/" + str(obj.job.logs.id)
-            return format_html("<a href='{url}'>Show</a>", url=url)
-        except AttributeError:
+        if obj.job is None or obj.job.logs_id is None:
             return None
+        url = "/logs/" + str(obj.job.logs_id)
+        return format_html("<a href='{url}'>Show</a>", url=url)
 
 
 @admin.register(ArchivedIntention)
 class ArchivedIntentionAdmin(admin.ModelAdmin):
     list_display = ('id', 'created', 'started', 'completed', user_name, 'status', 'worker', 'logs', 'child')
+    list_select_related = ('user', 'arch_job__worker')
     search_fields = ('id', 'user__first_name', 'status')
     list_filter = ('status', 'created', 'completed')
     ordering = ('-completed', )
+    paginator = ApproximatePaginator
+    show_full_result_count = False
 
     def started(self, obj):
         try:
@@ -141,23 +222,13 @@ class ArchivedIntentionAdmin(admin.ModelAdmin):
             return None
 
     def logs(self, obj):
-        try:
-            log_id = obj.arch_job.logs.id
-            url = "/logs/" + str(log_id)
-            return format_html("<a href='{url}'>Show</a>", url=url)
-        except AttributeError:
+        if obj.arch_job is None or obj.arch_job.logs_id is None:
             return None
+        url = "/logs/" + str(obj.arch_job.logs_id)
+        return format_html("<a href='{url}'>Show</a>", url=url)
 
     def child(self, obj):
-        for name in dir(obj):
-            try:
-                attr = getattr(obj, name)
-                if isinstance(attr, obj.__class__):
-                    url = "/admin/{}/{}/?q={}".format(attr._meta.app_label, attr._meta.model_name, attr.id)
-                    return format_html("<a href='{url}'>{name}</a>", url=url, name=attr._meta.model_name)
-            except:
-                pass
-        return obj
+        return child_link(obj.kind, obj.id)
 
 @admin.register(Worker)
 class WorkerAdmin(admin.ModelAdmin):
@@ -166,8 +237,12 @@ class WorkerAdmin(admin.ModelAdmin):
     list_filter = ('status', 'machine')
     ordering = ('-id', )
 
+    def get_queryset(self, request):
+        first_job = Job.objects.filter(worker=OuterRef('pk')).order_by('id').values('id')[:1]
+        return super().get_queryset(request).annotate(running_job_id=Subquery(first_job))
+
     def running_job(self, obj):
-        return obj.job_set.first()
+        return obj.running_job_id
 
 
 @admin.register(Log)
@@ -179,6 +254,7 @@ class Log(admin.ModelAdmin):
 @admin.register(ScheduledIntention)
 class ScheduledIntentionAdmin(admin.ModelAdmin):
     list_display = ('id', 'intention_class', 'kwargs', user_name, 'scheduled_at', 'depends_on', 'repeat', 'worker_name')
+    list_select_related = ('user', 'worker', 'depends_on')
     search_fields = ('id', 'intention_class', 'user__first_name')
     list_filter = ('intention_class', 'scheduled_at')
     ordering = ('-scheduled_at',)
@@ -188,3 +264,27 @@ class ScheduledIntentionAdmin(admin.ModelAdmin):
             return obj.worker.machine
         except AttributeError:
             return None
+
+
+@admin.register(UserShare)
+class UserShareAdmin(admin.ModelAdmin):
+    list_display = ('user', 'weight', 'max_jobs', 'lag')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__first_name')
+    raw_id_fields = ('user',)
+
+
+@admin.register(Resource)
+class ResourceAdmin(admin.ModelAdmin):
+    list_display = ('id', 'pool', 'name', 'capacity', 'remaining', 'limit', 'reset', 'available_at')
+    search_fields = ('pool', 'name')
+    ordering = ('pool', 'id')
+
+
+@admin.register(ArchiveSummary)
+class ArchiveSummaryAdmin(admin.ModelAdmin):
+    list_display = ('day', user_name, 'status', 'count', 'runtime')
+    list_select_related = ('user',)
+    search_fields = ('user__first_name',)
+    list_filter = ('status', 'day')
+    ordering = ('-day', )
@@ -0,0 +1,105 @@
+"""Runtime for intentions with coroutine run() methods
+
+Intentions whose run() mostly waits for APIs may define it as a
+coroutine (async def run(self, job)). Workers started with async slots
+(see SchedWorker) run them in an event loop, in a thread of their own,
+so that a single worker may run hundreds of them at the same time,
+instead of needing a thread (execution slot) for each one.
+
+Coroutines must not use the ORM directly (Django refuses to run it
+in the event loop): database calls are run with database_sync_to_async,
+in a bounded pool of threads, each with its own connection.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Threads running database calls of coroutines, at most
+ASYNC_DB_THREADS = getattr(settings, 'POOLSCHED_ASYNC_DB_THREADS', 4)
+
+# Pool of threads for database calls of coroutines (created on first use)
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+
+def _executor():
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=ASYNC_DB_THREADS, thread_name_prefix='aio-db')
+        return _db_executor
+
+
+def _with_connection(func):
+    """Run func, closing connections unusable (or too old) before and after"""
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+def database_sync_to_async(func):
+    """Coroutine function running func (which may use the ORM) in the database threads
+
+    For example: await database_sync_to_async(job.save)()
+
+    :param func: callable, run in the bounded pool of database threads
+    """
+    return sync_to_async(_with_connection(func), thread_sensitive=False, executor=_executor())
+
+
+def is_async(intention):
+    """Whether the run() of an intention is a coroutine function"""
+    return asyncio.iscoroutinefunction(getattr(intention, 'run', None))
+
+
+class AsyncRuntime:
+    """Event loop, in a thread, running coroutines submitted by other threads"""
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        """Start the event loop, in a thread of its own"""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='aio', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """Run a coroutine in the event loop
+
+        :returns: concurrent.futures.Future, with its result
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        """Stop the event loop (after coroutines still running are cancelled)"""
+        if self.thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._cancel_all(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.thread = None
+
+    async def _cancel_all(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,179 @@
+"""Archiving jobs, and the intentions they accomplished
+
+All of it is done in a single transaction, with a fixed number of
+statements, whatever the number of intentions, for intentions whose
+classes define archived_class (see Intention.archived_class).
+Runtimes of jobs completed are added to the statistics of their
+intentions (see RuntimeStat), for predicting the runtime of new ones.
+
+Archived intentions older than the retention period are compacted
+into daily summaries (see compact), so that archive tables don't
+grow forever.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import now
+
+from . import joblogs, metrics, utils
+from .models import Intention, ArchJob, ArchivedIntention, ArchiveSummary, Log, RuntimeStat
+from .models.bulk import bulk_create_inherited
+from .models.signals import bulk_maintenance, previous_deleted
+
+logger = logging.getLogger(__name__)
+
+# Days archived intentions (and jobs) are kept, before compacting them
+ARCHIVE_RETENTION = getattr(settings, 'POOLSCHED_ARCHIVE_RETENTION', 90)
+
+
+def _last_archived(arch_job, count):
+    """Ids of the last count archived intentions inserted for arch_job"""
+    ids = ArchivedIntention.objects.filter(arch_job=arch_job)\
+        .order_by('-id')\
+        .values_list('id', flat=True)[:count]
+    return list(reversed(ids))
+
+
+def archive_job(job, status):
+    """Archive a job, and its intentions, with the status specified
+
+    :param job:    job to archive
+    :param status: status for the archived intentions (see ArchivedIntention)
+    :returns:      archived job (ArchJob)
+    """
+    with transaction.atomic():
+        arch_job = ArchJob.objects.create(created=job.created, worker=job.worker, logs=job.logs)
+        intentions = Intention.objects.cast_many(job.intention_set.all())
+        logger.info(f"Archiving intentions: {[intention.id for intention in intentions]}")
+        if status == ArchivedIntention.OK:
+            runtime = (arch_job.archived - job.created).total_seconds()
+            RuntimeStat.objects.record([(intention.kind, intention.runtime_key(), runtime)
+                                        for intention in intentions])
+        by_class = defaultdict(list)
+        for intention in intentions:
+            by_class[intention.archived_class].append(intention)
+
+        # Intentions of classes with no archived_class archive themselves
+        for intention in by_class.pop(None, []):
+            intention.archive(status, arch_job)
+
+        ids = [intention.id for intention in intentions]
+        if by_class:
+            for archived_class, class_intentions in by_class.items():
+                archived = [archived_class(user_id=intention.user_id, created=intention.created,
+                                           status=status, arch_job=arch_job,
+                                           kind=archived_class._meta.label_lower,
+                                           **intention.archived_fields())
+                            for intention in class_intentions]
+                bulk_create_inherited(archived, fetch_pks=lambda count=len(archived): _last_archived(arch_job, count))
+
+            bulk_ids = [intention.id for class_intentions in by_class.values()
+                        for intention in class_intentions]
+            next_ids = list(Intention.previous.through.objects
+                            .filter(to_intention__in=bulk_ids)
+                            .exclude(from_intention__in=ids)
+                            .values_list('from_intention', flat=True).distinct())
+            # Deleting intentions deletes their links to previous intentions, too
+            with bulk_maintenance():
+                Intention.objects.filter(id__in=bulk_ids).delete()
+            previous_deleted(next_ids)
+
+        # Delete the job after archiving the intentions to avoid race conditions.
+        # Its resource holds are released by the cascade, a single DELETE (not
+        # selected first, as long as there are no receivers of their deletion)
+        job.delete()
+        count = len(intentions)
+        transaction.on_commit(lambda: metrics.archived.inc(count, status=status))
+        if arch_job.logs_id is not None:
+            log_id = arch_job.logs_id
+            transaction.on_commit(lambda: joblogs.writer.finish(log_id))
+    return arch_job
+
+
+def _compact_batch(before, batch):
+    """Summarize and delete a batch of archived intentions, in a transaction
+
+    :returns: number of archived intentions deleted
+    """
+    with transaction.atomic():
+        # Rows locked by some other compaction are left for it
+        ids = list(ArchivedIntention.objects.filter(completed__lt=before)
+                   .order_by('completed', 'id')
+                   .select_for_update(**utils.skip_locked())
+                   .values_list('id', flat=True)[:batch])
+        if not ids:
+            return 0
+        runtime = ExpressionWrapper(F('completed') - F('arch_job__created'), output_field=DurationField())
+        rows = ArchivedIntention.objects.filter(id__in=ids)\
+            .order_by()\
+            .values('user', 'status', day=TruncDate('completed'))\
+            .annotate(count=Count('id'), runtime=Sum(runtime))
+        ArchiveSummary.objects.add([dict(row, runtime=row['runtime'].total_seconds()
+                                         if row['runtime'] is not None else 0)
+                                    for row in rows])
+        # Deletes the rows of child classes, too
+        ArchivedIntention.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def _compact_jobs_batch(before, batch):
+    """Delete a batch of archived jobs with no archived intentions, and their logs
+
+    Log files are removed once the transaction commits.
+
+    :returns: number of archived jobs deleted (None if none was found)
+    """
+    with transaction.atomic():
+        jobs = list(ArchJob.objects.filter(archived__lt=before, archivedintention=None)
+                    .order_by('archived')
+                    .values_list('id', 'logs')[:batch])
+        if not jobs:
+            return None
+        _, deleted = ArchJob.objects.filter(id__in=[job_id for job_id, _ in jobs],
+                                            archivedintention=None).delete()
+        # Logs still used by some other job are kept
+        logs = Log.objects.filter(id__in=[log_id for _, log_id in jobs if log_id is not None],
+                                  job=None, archjob=None)
+        locations = [location for location in logs.values_list('location', flat=True) if location]
+        logs.delete()
+        if locations:
+            transaction.on_commit(lambda: joblogs.remove_log_files(locations))
+    return deleted.get(ArchJob._meta.label, 0)
+
+
+def compact(days=ARCHIVE_RETENTION, batch=1000):
+    """Compact archived intentions older than some days
+
+    Archived intentions completed before that are added to daily
+    summaries (see ArchiveSummary) and deleted, and then archived
+    jobs with no archived intentions left are deleted, with their
+    logs (and their files, once deleted from the database). Work is done
+    in small batches, each in its own short transaction, so this is
+    safe to run while workers are archiving jobs (only rows older
+    than the retention period are touched).
+
+    :param days:  days archived intentions and jobs are kept
+    :param batch: maximum number of rows deleted in each transaction
+    :returns:     (archived intentions, archived jobs) deleted
+    """
+    before = now() - timedelta(days=days)
+    intentions = 0
+    while True:
+        count = _compact_batch(before, batch)
+        if not count:
+            break
+        intentions += count
+    arch_jobs = 0
+    while True:
+        count = _compact_jobs_batch(before, batch)
+        if count is None:
+            break
+        arch_jobs += count
+    logger.info(f"Compacted {intentions} archived intentions, {arch_jobs} archived jobs")
+    return intentions, arch_jobs
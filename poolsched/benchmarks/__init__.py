@@ -0,0 +1,6 @@
+"""Benchmarks for poolsched
+
+Benchmarks run against a throwaway database, created (and destroyed)
+from the configured one, the same way Django does for tests.
+Run them with the `schedbench` management command.
+"""
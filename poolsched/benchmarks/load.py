@@ -0,0 +1,240 @@
+"""Synthetic load for the scheduling loop
+
+Seeds users, each of them with chains of intentions (of several types,
+with a configurable depth), and runs several workers (SchedWorker, in
+threads) until all intentions are done. Intentions just wait for a
+while when they run.
+
+Measures claims per second, time to the first job, queue wait (from the
+creation of intentions to the creation of their jobs), and database
+queries per job (claiming it, and running and archiving it). The
+measures of the phases of the workers (see phases) are reported, too.
+
+Some backends (SQLite) don't like concurrent transactions, so with them
+workers hold a lock while using the database (but not while running).
+"""
+
+import contextlib
+import threading
+import time
+
+from django.db import connection
+
+from ..models import Intention, ReadyUser
+from ..models.bulk import bulk_create_inherited
+from ..testing import KindManager, LockedWorker
+from ..wakeup import Backoff
+
+
+class BenchIntention(Intention):
+    """Intention for benchmarks, doing nothing when run
+
+    Types of intentions for the benchmark are proxies of this class
+    (see intention_types), told apart by their kind.
+    """
+
+    objects = KindManager()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    # Queue waits observed (seconds), see run()
+    waits = []
+
+    @property
+    def process_name(self):
+        return 'Benchmark'
+
+    def running_job(self):
+        return None
+
+    @classmethod
+    def next_job(cls, worker):
+        return None
+
+    def run(self, job):
+        BenchIntention.waits.append((job.created - self.created).total_seconds())
+        return True
+
+    def archive(self, status, arch_job):
+        self.delete()
+
+
+_types = {}
+
+
+def intention_types(count):
+    """Types of intentions for the benchmark (proxy models, created once)"""
+    for i in range(len(_types), count):
+        name = f'BenchIntention{i}'
+        meta = type('Meta', (), {'proxy': True, 'app_label': 'poolsched'})
+        _types[i] = type(name, (BenchIntention,), {'Meta': meta, '__module__': __name__})
+    return [_types[i] for i in range(count)]
+
+
+def seed(users, types, depth, chains, batch_size=1000):
+    """Create users, each of them with chains of intentions
+
+    The intention in each level of a chain is of the next type,
+    and has the intention in the previous level as previous intention.
+
+    :returns: number of intentions created
+    """
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    first = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    User.objects.bulk_create([User(username=f'load-{first}-{i}') for i in range(users)],
+                             batch_size=batch_size)
+    user_ids = list(User.objects.filter(id__gt=first).order_by('id').values_list('id', flat=True))
+
+    previous = []
+    for level in range(depth):
+        model = types[level % len(types)]
+        last = Intention.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        level_intentions = [model(user_id=user_id, kind=model._meta.label_lower,
+                                  pending_previous=1 if level else 0)
+                            for user_id in user_ids for _ in range(chains)]
+        bulk_create_inherited(level_intentions, batch_size=batch_size,
+                              fetch_pks=lambda: Intention.objects.filter(id__gt=last).order_by('id')
+                              .values_list('id', flat=True))
+        if previous:
+            through = Intention.previous.through
+            through.objects.bulk_create([through(from_intention_id=intention.id, to_intention_id=prev.id)
+                                         for intention, prev in zip(level_intentions, previous)],
+                                        batch_size=batch_size)
+        previous = level_intentions
+    for i in range(0, len(user_ids), batch_size):
+        ReadyUser.objects.mark(user_ids[i:i + batch_size])
+    return len(user_ids) * chains * depth
+
+
+class BenchWorker(LockedWorker):
+    """Worker counting its jobs, and the queries for them"""
+
+    def setup(self, db_lock, run_time):
+        self.db_lock = db_lock
+        self.run_time = run_time
+        self.started = None
+        self.first_job = None
+        self.jobs = 0
+        self.claim_queries = 0
+        self.run_queries = 0
+        self.count_lock = threading.Lock()
+        # Scheduled intentions are not part of the benchmark
+        self.dispatcher.dispatch = lambda: None
+
+    def _count(self, attr):
+        def wrapper(execute, sql, params, many, context):
+            with self.count_lock:
+                setattr(self, attr, getattr(self, attr) + 1)
+            return execute(sql, params, many, context)
+        return connection.execute_wrapper(wrapper)
+
+    def _claim_job(self, free, **kwargs):
+        with self._count('claim_queries'):
+            job = super()._claim_job(free, **kwargs)
+        if job is not None:
+            self.jobs += 1
+            if self.first_job is None:
+                self.first_job = time.perf_counter() - self.started
+        return job
+
+    def run_job(self, job):
+        time.sleep(self.run_time)
+        with self._count('run_queries'):
+            return super().run_job(job)
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run(users=100, types=3, depth=3, chains=1, workers=4, slots=1, batch=1,
+        run_time=0, poll_max=None):
+    """Run the benchmark
+
+    :param users:    number of users
+    :param types:    number of types of intentions
+    :param depth:    intentions in each chain (depth of the DAG)
+    :param chains:   chains of intentions per user
+    :param workers:  number of workers (each one in a thread)
+    :param slots:    execution slots per worker
+    :param batch:    maximum number of jobs claimed at once by a worker
+    :param run_time: time (seconds) each intention waits when run
+    :param poll_max: maximum time (seconds) idle workers sleep (default: setting)
+    :returns:        report (dict), with the parameters and the results
+    """
+    params = {'users': users, 'types': types, 'depth': depth, 'chains': chains, 'workers': workers,
+              'slots': slots, 'batch': batch, 'run_time': run_time, 'poll_max': poll_max}
+    intention_classes = intention_types(types)
+    intentions = seed(users, intention_classes, depth, chains)
+    BenchIntention.waits = []
+
+    db_lock = threading.RLock() if connection.vendor == 'sqlite' else contextlib.nullcontext()
+    sched_workers = []
+    for _ in range(workers):
+        worker = BenchWorker(intention_order=intention_classes, slots=slots, batch=batch)
+        worker.setup(db_lock, run_time)
+        if poll_max is not None:
+            worker.backoff = Backoff(max=poll_max)
+        sched_workers.append(worker)
+    started = time.perf_counter()
+    for worker in sched_workers:
+        worker.started = started
+
+    def loop(worker):
+        try:
+            worker.loop(finish=True)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=loop, args=(worker,), name=f'bench-{i}')
+               for i, worker in enumerate(sched_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    jobs = sum(worker.jobs for worker in sched_workers)
+    first_jobs = [worker.first_job for worker in sched_workers if worker.first_job is not None]
+    waits = BenchIntention.waits
+    results = {
+        'intentions': intentions,
+        'jobs': jobs,
+        'remaining': Intention.objects.count(),
+        'elapsed_s': elapsed,
+        'claims_per_s': jobs / elapsed if elapsed else None,
+        'first_job_s': min(first_jobs) if first_jobs else None,
+        'queue_wait_p50_s': _percentile(waits, 0.5),
+        'queue_wait_p99_s': _percentile(waits, 0.99),
+        'claim_queries_per_job': sum(w.claim_queries for w in sched_workers) / jobs if jobs else None,
+        'run_queries_per_job': sum(w.run_queries for w in sched_workers) / jobs if jobs else None,
+    }
+    phases = {}
+    for worker in sched_workers:
+        for phase, measures in worker.phases.report().items():
+            total = phases.setdefault(phase, {'count': 0, 'total_s': 0, 'queries': 0, 'rows': 0})
+            for name in total:
+                total[name] += measures[name]
+    return {'benchmark': 'load', 'vendor': connection.vendor, 'params': params, 'results': results,
+            'phases': phases}
+
+
+def compare(report, baseline):
+    """Compare the results of a report with those of a baseline report
+
+    :returns: {result: {'value', 'baseline', 'ratio'}}, for numeric results
+    """
+    comparison = {}
+    for name, value in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if isinstance(value, (int, float)) and isinstance(base, (int, float)):
+            comparison[name] = {'value': value, 'baseline': base,
+                                'ratio': value / base if base else None}
+    return comparison
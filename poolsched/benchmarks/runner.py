@@ -0,0 +1,47 @@
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+
+from django.db import connection
+
+
+@contextlib.contextmanager
+def test_database(keepdb=False, threads=False):
+    """Create a throwaway database for the benchmark, destroy it afterwards
+
+    :param threads: the database will be used from several threads
+        (SQLite in-memory databases are replaced by a temporary file)
+    """
+
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    with contextlib.ExitStack() as stack:
+        if threads and connection.vendor == 'sqlite' \
+                and connection.creation.is_in_memory_db(old_test_name or ':memory:'):
+            tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+            test_settings['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+        try:
+            yield connection
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+            test_settings['NAME'] = old_test_name
+
+
+def timed(func, repeat=100):
+    """Run func repeat times, and return latency stats (milliseconds)"""
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean_ms': statistics.mean(samples),
+        'p50_ms': samples[len(samples) // 2],
+        'p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
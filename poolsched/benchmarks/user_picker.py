@@ -0,0 +1,68 @@
+"""Latency of picking users with ready intentions
+
+Compares the picker based on the ReadyUser set with the previous
+implementation (distinct count on the intentions join, and an
+OFFSET query per user), for growing numbers of users.
+"""
+
+from random import sample
+
+from django.contrib.auth import get_user_model
+
+from ..models import Intention, ReadyUser
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+
+def legacy_pick(max=1):
+    """Previous implementation of SchedWorker._get_random_user_ready"""
+
+    User = get_user_model()
+    q = User.objects.filter(intention__isnull=False,
+                            intention__previous=None,
+                            intention__job=None).distinct()
+    count = q.count()
+    try:
+        users = [q[i] for i in sample(range(count), min(max, count))]
+    except IndexError:
+        users = []
+    return users
+
+
+def _seed(first, last, batch_size=1000):
+    """Create users [first, last), each of them with a ready intention"""
+
+    User = get_user_model()
+    users = User.objects.bulk_create([User(username=f'bench-{i}') for i in range(first, last)],
+                                     batch_size=batch_size)
+    if not users or users[0].id is None:
+        # The database doesn't return ids for bulk inserts
+        users = User.objects.filter(username__startswith='bench-').order_by('id')[first:last]
+    user_ids = [user.id for user in users]
+    Intention.objects.bulk_create([Intention(user_id=user_id) for user_id in user_ids],
+                                  batch_size=batch_size)
+    for i in range(0, len(user_ids), batch_size):
+        ReadyUser.objects.mark(user_ids[i:i + batch_size])
+
+
+def run(timed, sizes=None, max_users=4, repeat=100, legacy=True):
+    """Run the benchmark, for each number of users in sizes
+
+    :param timed: function to time a callable (see runner.timed)
+    :param sizes: list of numbers of users
+    :param max_users: users picked per call
+    :param repeat: calls timed per size
+    :param legacy: time the previous implementation, too
+    :returns: list of results (dicts), one per size
+    """
+    results = []
+    seeded = 0
+    for size in sorted(sizes or DEFAULT_SIZES):
+        _seed(seeded, size)
+        seeded = size
+        result = {'users': size,
+                  'ready_user': timed(lambda: ReadyUser.objects.pick(max=max_users), repeat)}
+        if legacy:
+            result['legacy'] = timed(lambda: legacy_pick(max=max_users), repeat)
+        results.append(result)
+    return results
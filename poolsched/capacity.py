@@ -0,0 +1,59 @@
+"""Live capacity of the pool of workers, for admitting new jobs
+
+Workers send heartbeats (see Worker.heartbeat). Capacity is computed
+from workers with recent heartbeats (live workers), and refreshed at
+most every few seconds, so that the admission check doesn't need to
+count rows in the database on every iteration of the worker loop.
+"""
+
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils.timezone import now
+
+from .models import Worker, Job
+
+# Seconds between heartbeats of a worker
+HEARTBEAT = getattr(settings, 'POOLSCHED_HEARTBEAT', 10)
+# Workers with no heartbeat for this long (seconds) are not live
+HEARTBEAT_TIMEOUT = getattr(settings, 'POOLSCHED_HEARTBEAT_TIMEOUT', 60)
+# Seconds between refreshes of the capacity
+CAPACITY_REFRESH = getattr(settings, 'POOLSCHED_CAPACITY_REFRESH', 5)
+# Maximum number of jobs assigned to workers, per live slot
+JOBS_PER_SLOT = getattr(settings, 'POOLSCHED_JOBS_PER_SLOT', 5)
+
+
+def live_workers():
+    """Workers with recent heartbeats"""
+    return Worker.objects.filter(heartbeat__gte=now() - timedelta(seconds=HEARTBEAT_TIMEOUT))
+
+
+class Capacity:
+    """Cached view of live slots, and jobs assigned to workers"""
+
+    def __init__(self, refresh=CAPACITY_REFRESH, jobs_per_slot=JOBS_PER_SLOT):
+        self.refresh_every = refresh
+        self.jobs_per_slot = jobs_per_slot
+        self.refreshed = None
+        self.slots = 0
+        self.assigned = 0
+
+    def refresh(self, force=False):
+        """Refresh from the database, if it is time to"""
+        if not force and self.refreshed is not None \
+                and monotonic() - self.refreshed < self.refresh_every:
+            return
+        self.slots = live_workers().aggregate(slots=Sum('slots'))['slots'] or 0
+        self.assigned = Job.objects.exclude(worker=None).count()
+        self.refreshed = monotonic()
+
+    def claimed(self, jobs):
+        """Account for jobs assigned since the last refresh"""
+        self.assigned += jobs
+
+    def admits(self):
+        """Is there room for assigning new jobs to workers?"""
+        self.refresh()
+        return self.assigned < self.jobs_per_slot * self.slots
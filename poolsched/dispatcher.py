@@ -0,0 +1,63 @@
+"""Dispatching scheduled intentions, from a single (elected) worker
+
+Only the worker holding the scheduler lease (see models.Lease) creates
+scheduled intentions. It keeps in memory when the next scheduled
+intention is due, so that it doesn't query scheduled intentions until
+then (but for refreshing that time every now and then, in case new
+scheduled intentions were added). Other workers just try to take the
+lease every now and then, in case the dispatcher died.
+"""
+
+import logging
+from time import monotonic
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from .models import Lease, ScheduledIntention
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'scheduler'
+# Duration of the scheduler lease (seconds)
+SCHEDULER_LEASE = getattr(settings, 'POOLSCHED_SCHEDULER_LEASE', 30)
+# Seconds between refreshes of the lease, and of the next due time
+SCHEDULER_REFRESH = getattr(settings, 'POOLSCHED_SCHEDULER_REFRESH', 10)
+
+
+class Dispatcher:
+    """Create scheduled intentions when due, if holding the lease"""
+
+    def __init__(self, worker, lease=SCHEDULER_LEASE, refresh=SCHEDULER_REFRESH):
+        self.worker = worker
+        self.lease = lease
+        self.refresh_every = refresh
+        self.refreshed = None
+        self.leader = False
+        self.next_due = None
+
+    def refresh(self):
+        """Acquire or renew the lease, and refresh the next due time, if it is time to"""
+        if self.refreshed is not None and monotonic() - self.refreshed < self.refresh_every:
+            return
+        leader = Lease.objects.acquire(LEASE_NAME, self.worker, self.lease)
+        if leader != self.leader:
+            logger.info(f"Scheduler dispatcher: {'acquired' if leader else 'lost'}")
+        self.leader = leader
+        if self.leader:
+            self.next_due = ScheduledIntention.objects.next_due()
+        self.refreshed = monotonic()
+
+    def dispatch(self):
+        """Create scheduled intentions due (if this worker is the dispatcher)"""
+        self.refresh()
+        if not self.leader or self.next_due is None or self.next_due > now():
+            return
+        ScheduledIntention.objects.create_intentions(self.worker)
+        self.next_due = ScheduledIntention.objects.next_due()
+
+    def release(self):
+        """Release the lease, so that other worker can take it"""
+        if self.leader:
+            Lease.objects.release(LEASE_NAME, self.worker)
+            self.leader = False
@@ -0,0 +1,480 @@
+"""Buffered writing, compression, and reading of the logs of jobs
+
+Job threads don't write their logs: they just format records, and
+put them in a queue. A background thread (the writer) gets records
+from the queue, and writes them in batches to the log files, so that
+jobs don't wait for the disk. As it writes a log, the writer maintains
+a sidecar index (path + '.idx') with the offset of a line every few
+lines, so that any line can be found without reading all the log.
+
+When a job is archived, its log is compressed in another background
+thread (see LogWriter.finish and compress_log), so that the writer
+(and the jobs, when its queue is full) never wait for it. Compressed logs are gzip files made of independent members,
+each one for a chunk of whole lines of the log (so that parts of the log
+can be read without decompressing all of it), with an index of the chunks
+in a sidecar file: one line per chunk, with its first line, and its offsets
+in the original log and in the compressed file.
+
+Both kinds of logs are read with LogReader.
+"""
+
+import atexit
+import concurrent.futures
+import gzip
+import logging
+import mmap
+import os
+import queue
+import threading
+from bisect import bisect_right
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of records waiting to be written (jobs wait when full)
+LOG_QUEUE = getattr(settings, 'POOLSCHED_LOG_QUEUE', 10000)
+# Maximum number of records written at once
+LOG_BATCH = getattr(settings, 'POOLSCHED_LOG_BATCH', 1000)
+# Seconds between flushes of log files to disk (when records are arriving)
+LOG_FLUSH = getattr(settings, 'POOLSCHED_LOG_FLUSH', 1)
+# Compress logs of jobs when archived
+LOG_COMPRESS = getattr(settings, 'POOLSCHED_LOG_COMPRESS', True)
+# Size of the chunks of compressed logs (bytes, uncompressed)
+LOG_CHUNK = getattr(settings, 'POOLSCHED_LOG_CHUNK', 1024 * 1024)
+
+# Lines between entries of the index of plain logs
+LOG_INDEX_LINES = getattr(settings, 'POOLSCHED_LOG_INDEX_LINES', 1000)
+
+INDEX_SUFFIX = '.idx'
+
+
+def log_path(location):
+    """Path of a log file, from its location (see Log.location)"""
+    return os.path.abspath(os.path.join(settings.JOB_LOGS, location))
+
+
+def read_index(path):
+    """Entries of the index of a log file (tuples of integers)
+
+    :param path: path of the log file (not of the index)
+    """
+    try:
+        with open(path + INDEX_SUFFIX) as file:
+            return [tuple(int(value) for value in line.split()) for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def compress_file(path, chunk=LOG_CHUNK):
+    """Compress a log file, as gzip members of about chunk bytes (uncompressed)
+
+    Chunks are made of whole lines. The compressed file (path + '.gz'),
+    and its index, are written, and then the original file (and its
+    index) are removed.
+
+    :param path:  path of the log file
+    :param chunk: size of chunks (uncompressed)
+    :returns:     path of the compressed file
+    """
+    compressed = path + '.gz'
+    index = []
+    with open(path, 'rb') as original, open(compressed, 'wb') as output:
+        lines, offset = 0, 0
+        while True:
+            data = original.read(chunk)
+            if not data:
+                break
+            if not data.endswith(b'\n'):
+                data += original.readline()
+            index.append((lines, offset, output.tell()))
+            output.write(gzip.compress(data))
+            lines += data.count(b'\n')
+            offset += len(data)
+            if not data.endswith(b'\n'):
+                # Last line, with no end of line
+                lines += 1
+        index.append((lines, offset, output.tell()))
+    with open(compressed + INDEX_SUFFIX, 'w') as output:
+        output.writelines(' '.join(str(value) for value in entry) + '\n' for entry in index)
+    os.remove(path)
+    if os.path.exists(path + INDEX_SUFFIX):
+        os.remove(path + INDEX_SUFFIX)
+    return compressed
+
+
+def compress_log(log_id):
+    """Compress the file of a log, and record it in the log
+
+    :param log_id: id of the Log
+    """
+    from .models import Log
+
+    log = Log.objects.filter(id=log_id).first()
+    if log is None or log.codec or not log.location:
+        return
+    path = log_path(log.location)
+    if not os.path.exists(path):
+        return
+    compressed = compress_file(path)
+    Log.objects.filter(id=log_id).update(location=log.location + '.gz', codec=Log.Codec.GZIP,
+                                         size=os.path.getsize(compressed))
+
+
+def remove_log_files(locations):
+    """Remove the files of logs (and their indexes), if they exist
+
+    :param locations: locations of the logs (see Log.location)
+    """
+    for location in locations:
+        path = log_path(location)
+        for file_path in (path, path + INDEX_SUFFIX):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Error removing log file {file_path}: {e}")
+
+
+def finish_log(log_id, compress=LOG_COMPRESS):
+    """Compress the file of a finished log (see compress_log), or just record its size
+
+    :param log_id:   id of the Log
+    :param compress: compress the file
+    """
+    from .models import Log
+
+    if compress:
+        compress_log(log_id)
+        return
+    location = Log.objects.filter(id=log_id, codec=Log.Codec.NONE).values_list('location', flat=True).first()
+    if location and os.path.exists(log_path(location)):
+        Log.objects.filter(id=log_id).update(size=os.path.getsize(log_path(location)))
+
+
+class LogFile:
+    """Log file open for writing, with its index of lines"""
+
+    def __init__(self, path, every=LOG_INDEX_LINES):
+        self.every = every
+        self.file = open(path, 'ab')
+        self.index = open(path + INDEX_SUFFIX, 'a')
+        self.offset = self.file.tell()
+        self.lines = self._count_lines(path)
+
+    def _count_lines(self, path):
+        """Lines already in the file (opened again), from the last index entry"""
+        if self.offset == 0:
+            return 0
+        lines, offset = ([(0, 0)] + read_index(path))[-1]
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            for data in iter(lambda: file.read(LOG_CHUNK), b''):
+                lines += data.count(b'\n')
+        return lines
+
+    def write(self, data):
+        """Write data (bytes), adding index entries for lines crossed"""
+        newlines = data.count(b'\n')
+        if (self.lines + newlines) // self.every > self.lines // self.every:
+            position, lines = -1, self.lines
+            for _ in range(newlines):
+                position = data.find(b'\n', position + 1)
+                lines += 1
+                if lines % self.every == 0:
+                    self.index.write(f"{lines} {self.offset + position + 1}\n")
+        self.lines += newlines
+        self.offset += len(data)
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class LogWriter:
+    """Background writer of log files
+
+    Operations are queued, and done in order by the writer thread:
+    writing text to a file, closing a file, or just telling all
+    previous operations were done (flush). Logs of finished jobs are
+    compressed by another thread (the finisher), which waits for the
+    writer to close them, but is never waited for by the writer.
+    """
+
+    WRITE, CLOSE, FLUSH, STOP = range(4)
+
+    def __init__(self, maxsize=LOG_QUEUE, batch=LOG_BATCH, flush=LOG_FLUSH):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch = batch
+        self.flush_every = flush
+        self.files = {}
+        self.thread = None
+        self.lock = threading.Lock()
+        self.finisher = None
+        self.finishing = set()
+
+    def start(self):
+        """Start the writer thread, if not started yet"""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='logwriter', daemon=True)
+                self.thread.start()
+
+    def _put(self, op, path, arg=None):
+        self.start()
+        self.queue.put((op, path, arg))
+
+    def _wait(self, op, path=None):
+        done = threading.Event()
+        self._put(op, path, done)
+        done.wait()
+
+    def write(self, path, text):
+        """Queue text to be written to a file"""
+        self._put(self.WRITE, path, text)
+
+    def close(self, path, wait=False):
+        """Close a file, when all text queued for it is written
+
+        :param wait: wait until it is closed (and all operations queued before)
+        """
+        if wait:
+            self._wait(self.CLOSE, path)
+        else:
+            self._put(self.CLOSE, path)
+
+    def finish(self, log_id):
+        """Compress a log (or record its size), in the finisher thread (see finish_log)"""
+        with self.lock:
+            if self.finisher is None:
+                self.finisher = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                      thread_name_prefix='logfinisher')
+            future = self.finisher.submit(self._finish, log_id)
+            self.finishing.add(future)
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        with self.lock:
+            self.finishing.discard(future)
+
+    def flush(self):
+        """Wait until all operations queued, and logs being finished, are done"""
+        self._wait(self.FLUSH)
+        with self.lock:
+            finishing = list(self.finishing)
+        concurrent.futures.wait(finishing)
+
+    def stop(self):
+        """Do all operations queued, finish logs, and stop the threads"""
+        with self.lock:
+            finisher, self.finisher = self.finisher, None
+        if finisher is not None:
+            finisher.shutdown(wait=True)
+        if self.thread is not None and self.thread.is_alive():
+            self._wait(self.STOP)
+            self.thread.join()
+
+    def _get_batch(self):
+        """Get a batch of operations (waiting for the first one)"""
+        try:
+            ops = [self.queue.get(timeout=self.flush_every)]
+        except queue.Empty:
+            return []
+        while len(ops) < self.batch:
+            try:
+                ops.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return ops
+
+    def _file(self, path):
+        file = self.files.get(path)
+        if file is None:
+            file = self.files[path] = LogFile(path)
+        return file
+
+    def _close(self, path):
+        file = self.files.pop(path, None)
+        if file is not None:
+            file.close()
+
+    def _run(self):
+        running = True
+        while running:
+            for op, path, arg in self._get_batch():
+                try:
+                    if op == self.WRITE:
+                        self._file(path).write(arg.encode('utf-8', errors='replace'))
+                    elif op == self.CLOSE:
+                        self._close(path)
+                    elif op == self.STOP:
+                        running = False
+                except Exception:
+                    logger.exception(f"Error in log writer: {op}, {path}")
+                if isinstance(arg, threading.Event):
+                    for file in self.files.values():
+                        file.flush()
+                    arg.set()
+            for file in self.files.values():
+                file.flush()
+        for path in list(self.files):
+            self._close(path)
+
+    def _finish(self, log_id):
+        from .models import Log
+
+        try:
+            location = Log.objects.filter(id=log_id).values_list('location', flat=True).first()
+            if location:
+                # Wait for records still queued for the log to be written
+                self.close(log_path(location), wait=True)
+            finish_log(log_id)
+        except Exception:
+            logger.exception(f"Error finishing log {log_id}")
+        finally:
+            connection.close()
+
+
+# Writer for all the job logs in this process
+writer = LogWriter()
+atexit.register(writer.stop)
+
+
+class JobLogHandler(logging.Handler):
+    """Handler for the log of a job, writing through the log writer"""
+
+    def __init__(self, filename, log_writer=None):
+        super().__init__()
+        self.filename = os.path.abspath(filename)
+        self.writer = log_writer or writer
+
+    def emit(self, record):
+        if self.writer.thread is not None and record.thread == self.writer.thread.ident:
+            # Records from the writer itself could block it, with the queue full
+            return
+        try:
+            self.writer.write(self.filename, self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        """Close the file, once all records are written
+
+        Not waiting for it: the writer may be busy with other logs.
+        """
+        try:
+            self.writer.close(self.filename)
+        finally:
+            super().close()
+
+
+class LogReader:
+    """Reader of lines of a log (plain or compressed)
+
+    Lines are found with the index of the log, and read with mmap
+    (plain logs) or by decompressing only the chunks needed
+    (compressed logs), so that reading some lines of a huge log
+    is fast, and needs little memory.
+    """
+
+    def __init__(self, path, codec=''):
+        self.path = path
+        self.codec = codec
+
+    @classmethod
+    def for_log(cls, log):
+        """Reader for a Log"""
+        return cls(log_path(log.location), log.codec)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def count(self):
+        """Number of lines in the log"""
+        if self.codec:
+            index = read_index(self.path)
+            if index:
+                return index[-1][0]
+            with gzip.open(self.path, 'rb') as file:
+                return sum(1 for _ in file)
+        lines, offset = ([(0, 0)] + read_index(self.path))[-1]
+        with open(self.path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return 0
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for start in range(offset, size, LOG_CHUNK):
+                    lines += data[start:start + LOG_CHUNK].count(b'\n')
+                if data[size - 1:size] != b'\n':
+                    lines += 1
+        return lines
+
+    def lines(self, offset=0, limit=1000):
+        """Lines of the log, starting in line offset (0 is the first line)
+
+        :param offset: number of the first line
+        :param limit:  maximum number of lines
+        :returns:      list of lines (str, with their ends of line)
+        """
+        if limit <= 0:
+            return []
+        if self.codec:
+            return self._compressed_lines(offset, limit)
+        return self._plain_lines(offset, limit)
+
+    def tail(self, count):
+        """Last count lines of the log
+
+        :returns: tuple (number of the first line, list of lines)
+        """
+        offset = max(self.count() - count, 0)
+        return offset, self.lines(offset, count)
+
+    def _plain_lines(self, offset, limit):
+        index = [(0, 0)] + read_index(self.path)
+        line, position = index[bisect_right(index, (offset, float('inf'))) - 1]
+        with open(self.path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                while line < offset:
+                    position = data.find(b'\n', position)
+                    if position == -1:
+                        return []
+                    position += 1
+                    line += 1
+                lines = []
+                while len(lines) < limit and position < len(data):
+                    end = data.find(b'\n', position)
+                    end = len(data) if end == -1 else end + 1
+                    lines.append(data[position:end].decode('utf-8', errors='replace'))
+                    position = end
+        return lines
+
+    def _compressed_lines(self, offset, limit):
+        index = read_index(self.path)
+        if not index:
+            # No index: decompress from the start
+            with gzip.open(self.path, 'rb') as file:
+                return [line.decode('utf-8', errors='replace')
+                        for line in islice(file, offset, offset + limit)]
+        lines = []
+        chunk = max(bisect_right(index, (offset, float('inf'), float('inf'))) - 1, 0)
+        with open(self.path, 'rb') as file:
+            while len(lines) < limit and chunk < len(index) - 1:
+                first, _, start = index[chunk]
+                end = index[chunk + 1][2]
+                file.seek(start)
+                data = gzip.decompress(file.read(end - start)).splitlines(keepends=True)
+                lines += [line.decode('utf-8', errors='replace')
+                          for line in data[max(offset - first, 0):][:limit - len(lines)]]
+                chunk += 1
+        return lines
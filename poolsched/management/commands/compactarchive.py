@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from poolsched import archive
+
+
+class Command(BaseCommand):
+    help = 'Summarize archived intentions older than the retention period, and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=archive.ARCHIVE_RETENTION,
+                            help='Days archived intentions and jobs are kept '
+                                 f'(default: POOLSCHED_ARCHIVE_RETENTION, {archive.ARCHIVE_RETENTION})')
+        parser.add_argument('--batch', type=int, default=1000,
+                            help='Rows deleted in each transaction (default: 1000)')
+
+    def handle(self, *args, **options):
+        intentions, arch_jobs = archive.compact(days=options['days'], batch=options['batch'])
+        self.stdout.write(f'{intentions} archived intentions, {arch_jobs} archived jobs compacted')
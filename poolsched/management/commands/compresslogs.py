@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from poolsched import joblogs
+from poolsched.models import ArchJob
+
+
+class Command(BaseCommand):
+    help = 'Compress the logs of archived jobs, not compressed yet'
+
+    def handle(self, *args, **options):
+        logs = ArchJob.objects.filter(logs__codec='')\
+            .exclude(logs=None)\
+            .values_list('logs', flat=True)
+        for count, log_id in enumerate(logs.iterator(), 1):
+            joblogs.compress_log(log_id)
+            if count % 1000 == 0:
+                self.stdout.write(f'{count} logs compressed')
@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from poolsched.benchmarks import runner, user_picker, load
+
+
+class Command(BaseCommand):
+    help = 'Run poolsched benchmarks against a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=['user_picker', 'load'])
+        parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                            help='Number of users for each run (user_picker)')
+        parser.add_argument('--repeat', type=int, default=100,
+                            help='Number of timed calls for each run (user_picker)')
+        parser.add_argument('--no-legacy', action='store_true',
+                            help='Do not time the previous implementation (user_picker)')
+        parser.add_argument('--users', type=int, default=100,
+                            help='Number of users (load)')
+        parser.add_argument('--types', type=int, default=3,
+                            help='Number of types of intentions (load)')
+        parser.add_argument('--depth', type=int, default=3,
+                            help='Intentions in each chain of intentions (load)')
+        parser.add_argument('--chains', type=int, default=1,
+                            help='Chains of intentions per user (load)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of workers (load)')
+        parser.add_argument('--slots', type=int, default=1,
+                            help='Execution slots per worker (load)')
+        parser.add_argument('--batch', type=int, default=1,
+                            help='Maximum number of jobs claimed at once (load)')
+        parser.add_argument('--run-time', type=float, default=0,
+                            help='Seconds each intention runs (load)')
+        parser.add_argument('--poll-max', type=float, default=None,
+                            help='Maximum seconds idle workers sleep (load)')
+        parser.add_argument('--compare', default=None,
+                            help='Report (JSON file) to compare results with (load)')
+        parser.add_argument('--output', default=None,
+                            help='Write the report (JSON) to this file')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Reuse the benchmark database, if it exists')
+
+    def handle(self, *args, **options):
+        if options['benchmark'] == 'load':
+            with runner.test_database(keepdb=options['keepdb'], threads=True):
+                results = load.run(users=options['users'], types=options['types'],
+                                   depth=options['depth'], chains=options['chains'],
+                                   workers=options['workers'], slots=options['slots'],
+                                   batch=options['batch'], run_time=options['run_time'],
+                                   poll_max=options['poll_max'])
+            if options['compare']:
+                with open(options['compare']) as file:
+                    results['comparison'] = load.compare(results, json.load(file))
+        else:
+            with runner.test_database(keepdb=options['keepdb']):
+                results = user_picker.run(runner.timed,
+                                          sizes=options['sizes'],
+                                          repeat=options['repeat'],
+                                          legacy=not options['no_legacy'])
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report)
+        self.stdout.write(report)
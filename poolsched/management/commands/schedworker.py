@@ -5,5 +5,17 @@ from poolsched import schedworker
 class Command(BaseCommand):
     help = 'Run the scheduler worker'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1,
+                            help='Maximum number of new jobs claimed at once')
+        parser.add_argument('--slots', type=int, default=1,
+                            help='Number of jobs run at the same time')
+        parser.add_argument('--async-slots', type=int, default=0,
+                            help='Number of jobs with a coroutine run() run at the same time, in an event loop')
+        parser.add_argument('--metrics-port', type=int, default=None,
+                            help='Port for serving metrics of the worker (Prometheus format)')
+
     def handle(self, *args, **options):
-        schedworker.SchedWorker(run=True)
+        schedworker.SchedWorker(run=True, batch=options['batch'],
+                                slots=options['slots'], metrics_port=options['metrics_port'],
+                                async_slots=options['async_slots'])
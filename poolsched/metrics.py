@@ -0,0 +1,219 @@
+"""Metrics of the scheduler, in Prometheus text exposition format
+
+Counters and histograms are aggregated in the memory of each process,
+so updating them is cheap (no database access). Workers may serve them
+with a small HTTP server (see start_http_server). The web process (where
+they are always zero) serves instead gauges about the queue (intentions
+waiting, users ready, jobs) with a view (see views.metrics), which are
+computed from the database, but cached for some seconds, so that scrapes
+(and the summary of the API, see views.api_summary) don't scan tables
+each time.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+
+from django.conf import settings
+from django.utils.timezone import now
+
+# Seconds between refreshes of the gauges computed from the database
+METRICS_CACHE = getattr(settings, 'POOLSCHED_METRICS_CACHE', 15)
+# Buckets for durations (seconds)
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800, 3600, 4 * 3600, 12 * 3600)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(pairs):
+    """Labels of a sample: {name="value",...}"""
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    """Metric, with values for each combination of labels"""
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Lines of samples, for the exposition format"""
+        with self.lock:
+            values = dict(self.values)
+        return [f'{self.name}{_labels(list(zip(self.labelnames, key)))} {value}'
+                for key, value in sorted(values.items())]
+
+    def render(self):
+        return '\n'.join([f'# HELP {self.name} {self.help}',
+                          f'# TYPE {self.name} {self.type}'] + self.samples())
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def replace(self, values):
+        """Replace all values: {tuple of label values: value}"""
+        with self.lock:
+            self.values = dict(values)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0, 0))
+            counts = [bucket_count + (value <= bound) for bucket_count, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(labels + [("le", bound)])} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels(labels + [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(labels)} {count}')
+        return lines
+
+
+# Metrics aggregated in this process
+claim_attempts = Counter('poolsched_claim_attempts_total',
+                         'Attempts to create a job for an intention, or to assign a job to a worker',
+                         ['site', 'result'])
+lock_failures = Counter('poolsched_lock_failures_total',
+                        'Rows found locked (or lock errors) while claiming', ['site'])
+queue_wait = Histogram('poolsched_queue_wait_seconds',
+                       'Time from the creation of an intention to the creation of its job', ['kind'])
+run_duration = Histogram('poolsched_run_duration_seconds',
+                         'Time running jobs (each run, until completed or waiting)', ['kind'])
+archived = Counter('poolsched_archived_intentions_total',
+                   'Intentions archived, by status', ['status'])
+slot_busy = Counter('poolsched_slot_busy_seconds_total',
+                    'Time execution slots were running jobs', ['worker'])
+slot_idle = Counter('poolsched_slot_idle_seconds_total',
+                    'Time execution slots were idle', ['worker'])
+
+PROCESS_METRICS = [claim_attempts, lock_failures, queue_wait, run_duration, archived, slot_busy, slot_idle]
+
+# Gauges computed from the database (see refresh_queue)
+queue_depth = Gauge('poolsched_queue_depth', 'Intentions with no job, by kind', ['kind'])
+ready_users = Gauge('poolsched_ready_users', 'Users with (maybe) ready intentions')
+jobs = Gauge('poolsched_jobs', 'Jobs, by state (running in a worker, or waiting for one)', ['state'])
+
+QUEUE_METRICS = [queue_depth, ready_users, jobs]
+
+_queue_refreshed = None
+# When the gauges were refreshed (wall clock)
+_queue_refreshed_at = None
+_queue_lock = threading.Lock()
+
+
+def refresh_queue(force=False):
+    """Refresh the gauges about the queue, if it is time to"""
+    global _queue_refreshed, _queue_refreshed_at
+    from django.db.models import Count, Q
+    from .models import Intention, Job, ReadyUser
+
+    with _queue_lock:
+        if not force and _queue_refreshed is not None and monotonic() - _queue_refreshed < METRICS_CACHE:
+            return
+        depth = Intention.objects.filter(job=None).order_by()\
+            .values_list('kind').annotate(count=Count('id'))
+        queue_depth.replace({(kind,): count for kind, count in depth})
+        ready_users.set(ReadyUser.objects.count())
+        states = Job.objects.aggregate(running=Count('id', filter=Q(worker__isnull=False)),
+                                       waiting=Count('id', filter=Q(worker=None)))
+        jobs.replace({(state,): count for state, count in states.items()})
+        _queue_refreshed = monotonic()
+        _queue_refreshed_at = now()
+
+
+def queue_summary():
+    """Gauges about the queue (refreshed if it is time to, see refresh_queue)
+
+    :returns: ({'queue_depth': {kind: count}, 'ready_users': count,
+               'jobs': {state: count}}, time refreshed)
+    """
+    refresh_queue()
+    with _queue_lock:
+        summary = {
+            'queue_depth': {kind: count for (kind,), count in sorted(queue_depth.values.items())},
+            'ready_users': ready_users.values.get((), 0),
+            'jobs': {state: count for (state,), count in sorted(jobs.values.items())},
+        }
+        return summary, _queue_refreshed_at
+
+
+def render(queue=True, process=True):
+    """Metrics, in the text exposition format
+
+    :param queue:   include the gauges computed from the database
+    :param process: include the metrics aggregated in this process
+    """
+    metrics = PROCESS_METRICS if process else []
+    if queue:
+        refresh_queue()
+        metrics = metrics + QUEUE_METRICS
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = render(queue=False).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, addr=''):
+    """Serve the metrics of this process (not the queue gauges), in a thread
+
+    :returns: the server (call shutdown() to stop it)
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-17 01:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from random import random
+
+
+def populate_ready_users(apps, schema_editor):
+    Intention = apps.get_model('poolsched', 'Intention')
+    ReadyUser = apps.get_model('poolsched', 'ReadyUser')
+    users = Intention.objects.filter(previous=None, job=None)\
+        .exclude(user=None)\
+        .values_list('user', flat=True)\
+        .distinct()
+    ReadyUser.objects.bulk_create([ReadyUser(user_id=user, rank=random()) for user in users],
+                                  batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('poolsched', '0002_scheduledintention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadyUser',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ready', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('rank', models.FloatField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(populate_ready_users, migrations.RunPython.noop),
+    ]
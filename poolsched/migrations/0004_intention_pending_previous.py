@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_pending_previous(apps, schema_editor):
+    Intention = apps.get_model('poolsched', 'Intention')
+    pending = Intention.previous.through.objects\
+        .filter(from_intention=OuterRef('pk'))\
+        .order_by()\
+        .values('from_intention')\
+        .annotate(count=Count('id'))\
+        .values('count')
+    Intention.objects.filter(previous__isnull=False)\
+        .update(pending_previous=Coalesce(Subquery(pending), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0003_readyuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='intention',
+            name='pending_previous',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='intention',
+            index=models.Index(fields=['user', 'pending_previous', 'job'], name='intention_ready_idx'),
+        ),
+        migrations.RunPython(count_pending_previous, migrations.RunPython.noop),
+    ]
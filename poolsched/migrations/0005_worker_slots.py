@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0004_intention_pending_previous'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worker',
+            name='slots',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
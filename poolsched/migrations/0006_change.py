@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0005_worker_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('I', 'Intention created'), ('S', 'Scheduled intention changed'), ('A', 'Job archived'), ('J', 'Job waiting')], max_length=1)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0006_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worker',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:19
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils.timezone import now
+
+
+def lease_assigned_jobs(apps, schema_editor):
+    """Give jobs already assigned some time, for their workers to renew them"""
+    Job = apps.get_model('poolsched', 'Job')
+    Job.objects.exclude(worker=None).update(lease_expires=now() + timedelta(minutes=10))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0007_worker_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True),
+        ),
+        migrations.RunPython(lease_assigned_jobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0008_job_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='intention',
+            name='kind',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0009_intention_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lease',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('expires', models.DateTimeField(blank=True, default=None, null=True)),
+                ('holder', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='poolsched.worker')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0010_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='codec',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('gzip', 'gzip')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='size',
+            field=models.BigIntegerField(blank=True, default=None, null=True),
+        ),
+    ]
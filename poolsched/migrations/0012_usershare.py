@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:43
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('poolsched', '0011_log_size_codec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserShare',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='share', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('weight', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('max_jobs', models.PositiveIntegerField(blank=True, default=None, null=True)),
+                ('lag', models.FloatField(default=0)),
+            ],
+        ),
+    ]
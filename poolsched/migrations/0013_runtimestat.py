@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0012_usershare'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RuntimeStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=100)),
+                ('key', models.CharField(blank=True, default='', max_length=250)),
+                ('count', models.BigIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('variance', models.FloatField(default=0)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='runtimestat',
+            constraint=models.UniqueConstraint(fields=('kind', 'key'), name='runtimestat_kind_key'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0013_runtimestat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Resource',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pool', models.CharField(max_length=100)),
+                ('name', models.CharField(blank=True, default='', max_length=100)),
+                ('capacity', models.PositiveIntegerField(default=1)),
+                ('limit', models.PositiveIntegerField(blank=True, default=None, null=True)),
+                ('remaining', models.IntegerField(blank=True, default=None, null=True)),
+                ('reset', models.DateTimeField(blank=True, default=None, null=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResourceHold',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resource_holds', to='poolsched.job')),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='poolsched.resource')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='jobs',
+            field=models.ManyToManyField(blank=True, related_name='resources', through='poolsched.ResourceHold', to='poolsched.Job'),
+        ),
+        migrations.AddConstraint(
+            model_name='resourcehold',
+            constraint=models.UniqueConstraint(fields=('resource', 'job'), name='resourcehold_resource_job'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['pool', 'available_at'], name='resource_available_idx'),
+        ),
+    ]
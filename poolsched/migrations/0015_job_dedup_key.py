@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0014_resource'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='dedup_key',
+            field=models.CharField(blank=True, default=None, max_length=200, null=True, unique=True),
+        ),
+    ]
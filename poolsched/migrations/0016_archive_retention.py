@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('poolsched', '0015_job_dedup_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('OK', 'Success'), ('ER', 'Error')], default='OK', max_length=2)),
+                ('count', models.BigIntegerField(default=0)),
+                ('runtime', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='archjob',
+            name='archived',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='archivedintention',
+            index=models.Index(fields=['completed'], name='archived_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedintention',
+            index=models.Index(fields=['status', 'completed'], name='archived_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedintention',
+            index=models.Index(fields=['user', 'completed'], name='archived_user_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivesummary',
+            name='user',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='archivesummary',
+            constraint=models.UniqueConstraint(fields=('day', 'user', 'status'), name='archivesummary_day_user'),
+        ),
+    ]
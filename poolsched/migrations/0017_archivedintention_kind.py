@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0016_archive_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedintention',
+            name='kind',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
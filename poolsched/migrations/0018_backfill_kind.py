@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def backfill_kind(apps, root_name):
+    """Set the kind of rows of a root model saved with no kind
+
+    Rows in the table of a child model (deepest first) get the kind
+    of that model, and the rest the kind of the root model. Kinds of
+    proxy models (with no table) can't be told.
+    """
+    root = apps.get_model('poolsched', root_name)
+    children = [model for model in apps.get_models()
+                if root in model._meta.get_parent_list() and not model._meta.proxy]
+    children.sort(key=lambda model: len(model._meta.get_parent_list()), reverse=True)
+    for model in children:
+        root.objects.filter(kind='', pk__in=model._base_manager.values('pk'))\
+            .update(kind=model._meta.label_lower)
+    root.objects.filter(kind='').update(kind=root._meta.label_lower)
+
+
+def backfill_kinds(apps, schema_editor):
+    backfill_kind(apps, 'Intention')
+    backfill_kind(apps, 'ArchivedIntention')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0017_archivedintention_kind'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_kinds, migrations.RunPython.noop),
+    ]
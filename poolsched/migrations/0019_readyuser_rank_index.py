@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0018_backfill_kind'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='readyuser',
+            name='rank',
+            field=models.FloatField(),
+        ),
+        migrations.AddIndex(
+            model_name='readyuser',
+            index=models.Index(fields=['rank', 'user'], name='readyuser_rank_idx'),
+        ),
+    ]
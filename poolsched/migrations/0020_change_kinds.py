@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poolsched', '0019_readyuser_rank_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='change',
+            name='kind',
+            field=models.CharField(choices=[('I', 'Intention created or deleted'), ('S', 'Scheduled intention changed'), ('A', 'Job archived'), ('J', 'Job waiting'), ('C', 'Jobs claimed'), ('L', 'Leases renewed')], max_length=1),
+        ),
+    ]
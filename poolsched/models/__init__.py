@@ -2,6 +2,16 @@ from .intentions import Intention, ArchivedIntention
 from .jobs import Job, ArchJob, Log
 from .workers import Worker
 from .scheduler import ScheduledIntention
+from .ready import ReadyUser, UserShare
+from .changes import Change
+from .graph import IntentionGraph
+from .leases import Lease
+from .runtimes import RuntimeStat
+from .resources import Resource, ResourceHold
+from .summaries import ArchiveSummary
+from . import signals  # noqa: F401
 
 
-__all__ = ['Intention', 'Job', 'ArchJob', 'Worker', 'ArchivedIntention', 'Log', 'ScheduledIntention']
+__all__ = ['Intention', 'Job', 'ArchJob', 'Worker', 'ArchivedIntention', 'Log', 'ScheduledIntention', 'ReadyUser', 'UserShare',
+           'Change', 'IntentionGraph', 'Lease', 'RuntimeStat',
+           'Resource', 'ResourceHold', 'ArchiveSummary']
@@ -0,0 +1,74 @@
+"""Bulk inserts for models with multi-table inheritance
+
+Django's bulk_create() doesn't support child models with multi-table
+inheritance (such as the child classes of Intention, or of
+ArchivedIntention), because it needs the ids of the parent rows for
+inserting the child rows. These helpers insert the rows of each table
+in the inheritance chain in batches.
+"""
+
+from django.db import connections, router
+
+BATCH_SIZE = 500
+
+
+def _batches(objs, batch_size):
+    for i in range(0, len(objs), batch_size):
+        yield objs[i:i + batch_size]
+
+
+def bulk_create_inherited(objs, fetch_pks=None, batch_size=BATCH_SIZE):
+    """Insert objects of a child model (all of the same class) in bulk
+
+    Rows for the root model are inserted first, and their ids are
+    set in the objects, so that rows for the tables of the rest of
+    the models in the chain can be inserted pointing to them.
+
+    On backends that can't return the ids of rows inserted in bulk
+    (MySQL), fetch_pks is called after inserting the root rows, and
+    should return their ids, in the same order they were inserted.
+    If it is None, root rows are inserted one by one.
+
+    :param objs:       list of (unsaved) objects, of the same class (maybe a proxy)
+    :param fetch_pks:  callable returning the ids of the root rows inserted
+    :param batch_size: maximum number of rows per INSERT statement
+    :returns:          list of objects, with their ids set
+    """
+    if not objs:
+        return objs
+    model = type(objs[0])._meta.concrete_model
+    using = router.db_for_write(model)
+    connection = connections[using]
+    # Models in the chain, from the root to the model itself
+    chain = list(reversed(model._meta.get_parent_list())) + [model]
+    root = chain[0]
+    root_fields = [field for field in root._meta.local_concrete_fields
+                   if field is not root._meta.pk]
+    returning = [root._meta.pk]
+
+    if connection.features.can_return_rows_from_bulk_insert:
+        for batch in _batches(objs, batch_size):
+            rows = root._base_manager._insert(batch, fields=root_fields,
+                                              returning_fields=returning, using=using)
+            for obj, row in zip(batch, rows):
+                setattr(obj, root._meta.pk.attname, row[0])
+    elif fetch_pks is not None:
+        for batch in _batches(objs, batch_size):
+            root._base_manager._insert(batch, fields=root_fields, using=using)
+        for obj, pk in zip(objs, fetch_pks()):
+            setattr(obj, root._meta.pk.attname, pk)
+    else:
+        for obj in objs:
+            rows = root._base_manager._insert([obj], fields=root_fields,
+                                              returning_fields=returning, using=using)
+            setattr(obj, root._meta.pk.attname, rows[0][0])
+
+    for level in chain[1:]:
+        for obj in objs:
+            setattr(obj, level._meta.pk.attname, getattr(obj, root._meta.pk.attname))
+        for batch in _batches(objs, batch_size):
+            level._base_manager._insert(batch, fields=level._meta.local_concrete_fields, using=using)
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = using
+    return objs
@@ -0,0 +1,58 @@
+from django.db import models, transaction
+from django.utils.timezone import now
+
+
+class ChangeManager(models.Manager):
+
+    def record(self, kind):
+        """Record a change, when the current transaction (if any) is committed
+
+        :param kind: kind of change (see Change.Kind)
+        """
+        transaction.on_commit(lambda: self.create(kind=kind))
+
+    def last_id(self, exclude=()):
+        """Id of the last change recorded (None if there are no changes)
+
+        :param exclude: kinds of changes not considered
+        """
+        changes = self.exclude(kind__in=exclude) if exclude else self
+        return changes.order_by('-id').values_list('id', flat=True).first()
+
+    def prune(self, keep=10000):
+        """Delete old changes, keeping the most recent ones
+
+        :param keep: number of (most recent) changes to keep
+        """
+        last = self.last_id()
+        if last is not None:
+            self.filter(id__lte=last - keep).delete()
+
+
+class Change(models.Model):
+    """Change feed: something changed that could produce new jobs
+
+    Workers tail this table, checking for new changes (ids higher
+    than the last one they saw), before running the (more expensive)
+    queries to look for new jobs. Changes of jobs and intentions that
+    can't produce new jobs (QUIET) are recorded too, but don't wake
+    up workers: the last change tells if anything changed (see the
+    ETags of the views).
+    """
+
+    class Kind(models.TextChoices):
+        INTENTION = 'I', "Intention created or deleted"
+        SCHEDULED = 'S', "Scheduled intention changed"
+        ARCHIVE = 'A', "Job archived"
+        JOB = 'J', "Job waiting"
+        CLAIM = 'C', "Jobs claimed"
+        LEASE = 'L', "Leases renewed"
+
+    # Kinds of changes not waking up workers
+    QUIET = [Kind.CLAIM, Kind.LEASE]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=1, choices=Kind.choices)
+    created = models.DateTimeField(default=now)
+
+    objects = ChangeManager()
@@ -0,0 +1,195 @@
+"""Submitting graphs of intentions (intentions and their previous ones) in bulk
+
+A graph is built in memory with IntentionGraph.add(), and then
+submitted with IntentionGraph.submit(), which:
+
+* finds intentions already in the database, with the same fields
+  (as get_or_create() would do), with one query per class and batch,
+* inserts the new intentions in batches (see bulk_create_inherited),
+* inserts the links to their previous intentions in batches,
+* updates the pending previous intentions, and the users ready,
+  and records a single change in the change feed.
+"""
+
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import connections, models, router, transaction
+
+from .bulk import bulk_create_inherited, BATCH_SIZE
+from .changes import Change
+from .intentions import Intention
+from .ready import ReadyUser
+
+
+class IntentionNode:
+    """Intention in a graph, maybe not created yet
+
+    After the graph is submitted, intention is the intention for this
+    node (just created, or found in the database), and created tells
+    whether it was created.
+    """
+
+    def __init__(self, model, fields, key):
+        self.model = model
+        self.fields = fields
+        self.key = key
+        self.previous = []
+        self.intention = None
+        self.created = False
+
+    def __repr__(self):
+        return f'IntentionNode({self.model.__name__}, {self.fields})'
+
+
+def _value_key(value):
+    if isinstance(value, models.Model):
+        return value.pk
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def _last_created(kind, after, count):
+    """Ids of the last count intentions of kind inserted, with ids after after"""
+    ids = Intention.objects.filter(kind=kind, id__gt=after)\
+        .order_by('-id')\
+        .values_list('id', flat=True)[:count]
+    return list(reversed(ids))
+
+
+class IntentionGraph:
+    """Graph of intentions to create, linked to their previous intentions
+
+    Example (intention2 runs after intention1):
+
+        graph = IntentionGraph()
+        node1 = graph.add(IRaw, user=user, repo=repo)
+        node2 = graph.add(IEnrich, previous=[node1], user=user, repo=repo)
+        graph.submit()
+        intention2 = node2.intention
+    """
+
+    def __init__(self):
+        self._nodes = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _key(self, model, fields):
+        """Key for (deduplicating) intentions of model, with these fields
+
+        Fields are normalized to their column (attname), so that
+        user=some_user and user_id=some_user.id produce the same key.
+        """
+        items = []
+        for name, value in fields.items():
+            field = model._meta.get_field(name)
+            items.append((field.attname, _value_key(value)))
+        return (model, tuple(sorted(items)))
+
+    def add(self, model, previous=(), **fields):
+        """Add an intention to the graph (if not in it already)
+
+        :param model:    class of the intention (child of Intention)
+        :param previous: previous intentions: nodes of this graph,
+                         or intentions already in the database
+        :param fields:   field values of the intention (not lookups)
+        :returns:        node for the intention (IntentionNode)
+        """
+        key = self._key(model, fields)
+        node = self._nodes.get(key)
+        if node is None:
+            node = IntentionNode(model, fields, key)
+            self._nodes[key] = node
+        self.link(node, *previous)
+        return node
+
+    def link(self, node, *previous):
+        """Add previous intentions to a node
+
+        :param node:     node of this graph
+        :param previous: nodes of this graph, or intentions in the database
+        """
+        for prev in previous:
+            if prev is not None and prev not in node.previous:
+                node.previous.append(prev)
+
+    def _existing(self, model):
+        """Intentions of model (not of its children, or other proxies)"""
+        existing = model.objects.all()
+        if model._meta.proxy or not model._meta.parents:
+            # Rows in the same table could be of other kinds
+            existing = existing.filter(kind=model._meta.label_lower)
+        return existing
+
+    def _find_existing(self, nodes, batch_size):
+        """Find intentions already in the database, for nodes of a model"""
+        model = nodes[0].model
+        searchable = [node for node in nodes if node.fields]
+        for i in range(0, len(searchable), batch_size):
+            batch = {node.key: node for node in searchable[i:i + batch_size]}
+            query = reduce(or_, (models.Q(**node.fields) for node in batch.values()))
+            for intention in self._existing(model).filter(query).order_by('id'):
+                for node in batch.values():
+                    if node.intention is None and \
+                            all(getattr(intention, attname) == value for attname, value in node.key[1]):
+                        node.intention = intention
+
+    def submit(self, batch_size=BATCH_SIZE):
+        """Create the intentions in the graph, and their links, in bulk
+
+        Intentions already in the database are not created again,
+        but they get the links to previous intentions in the graph.
+
+        :param batch_size: maximum number of rows per statement
+        :returns:          list of intentions created
+        """
+        by_model = defaultdict(list)
+        for node in self._nodes.values():
+            by_model[node.model].append(node)
+
+        with transaction.atomic():
+            created = []
+            after = None
+            if not connections[router.db_for_write(Intention)].features.can_return_rows_from_bulk_insert:
+                # Ids of new intentions are fetched back after inserting them
+                # (see _last_created): intentions inserted meanwhile by others
+                # are not seen (writes are serialized in SQLite, and rows of
+                # other transactions are not visible after this read in MySQL)
+                after = Intention.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            for model, nodes in by_model.items():
+                self._find_existing(nodes, batch_size)
+                new = [node for node in nodes if node.intention is None]
+                for node in new:
+                    node.intention = model(kind=model._meta.label_lower,
+                                           pending_previous=len(node.previous),
+                                           **node.fields)
+                    node.created = True
+                bulk_create_inherited(
+                    [node.intention for node in new], batch_size=batch_size,
+                    fetch_pks=lambda kind=model._meta.label_lower, count=len(new):
+                        _last_created(kind, after, count))
+                created += [node.intention for node in new]
+
+            through = Intention.previous.through
+            links = []
+            updated = set()
+            for node in self._nodes.values():
+                for prev in node.previous:
+                    prev = prev.intention if isinstance(prev, IntentionNode) else prev
+                    links.append(through(from_intention_id=node.intention.id, to_intention_id=prev.id))
+                    if not node.created:
+                        updated.add(node.intention.id)
+            through.objects.bulk_create(links, batch_size=batch_size, ignore_conflicts=True)
+            if updated:
+                Intention.objects.filter(pk__in=updated).refresh_pending()
+
+            if created:
+                users = {intention.user_id for intention in created if intention.pending_previous == 0}
+                transaction.on_commit(lambda: ReadyUser.objects.mark(users))
+                Change.objects.record(Change.Kind.INTENTION)
+        return created
@@ -1,16 +1,145 @@
+from collections import defaultdict
 from logging import getLogger
 
+from django.apps import apps
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models, transaction, OperationalError, IntegrityError
+from django.db import connection, models, transaction, OperationalError, IntegrityError
+from django.db.models import Count, F, OuterRef, Q, Subquery, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
 from django.conf import settings
 
 from . import jobs
+from .changes import Change
 from .jobs import Log
-from .. import utils
+from .resources import Resource
+from .. import utils, metrics
 
 logger = getLogger(__name__)
 
 
+class IntentionQuerySet(models.QuerySet):
+
+    def ready(self):
+        """Intentions with no pending previous intentions, and no job"""
+        return self.filter(pending_previous=0, job=None)
+
+    def refresh_pending(self):
+        """Recompute the number of pending previous intentions
+
+        Previous intentions are pending while they exist (they are
+        deleted when archived). A single UPDATE for all intentions
+        in the queryset.
+        """
+        through = Intention.previous.through
+        pending = through.objects.filter(from_intention=OuterRef('pk'))\
+            .order_by()\
+            .values('from_intention')\
+            .annotate(count=Count('id'))\
+            .values('count')
+        return self.update(pending_previous=Coalesce(Subquery(pending), 0))
+
+
+class IntentionManager(models.Manager.from_queryset(IntentionQuerySet)):
+
+    def selectable_intentions(self, user, max=1):
+        """Ready intentions for a user, oldest first
+
+        Usually redefined by the managers of child classes, for
+        checking the resources they need.
+        """
+        return self.ready().filter(user=user).order_by('created')[:max]
+
+    def selectable_by_user(self, users, max=1):
+        """Ready intentions for several users, oldest first, as selectable_intentions
+
+        A single query for all the users (up to max intentions for each
+        one, with a window function), unless the database doesn't support
+        window functions, or selectable_intentions is redefined: then,
+        it is called for each user.
+
+        :param users: list of User objects (None for intentions with no user)
+        :param max:   maximum number of intentions for each user
+        :returns:     dict, with lists of intentions by user id
+        """
+        user_ids = [user.id if user is not None else None for user in users]
+        if type(self).selectable_intentions is not IntentionManager.selectable_intentions\
+                or not connection.features.supports_over_clause:
+            return {user_id: list(self.selectable_intentions(user=user, max=max))
+                    for user_id, user in zip(user_ids, users)}
+        condition = Q(user__in=[user_id for user_id in user_ids if user_id is not None])
+        if None in user_ids:
+            condition |= Q(user=None)
+        qn = connection.ops.quote_name
+        ranked = self.ready().filter(condition)\
+            .annotate(user_rank=Window(RowNumber(), partition_by=[F('user')],
+                                       order_by=[F('created').asc(), F('id').asc()]))\
+            .values('id', 'user_rank')
+        sql, params = ranked.query.sql_with_params()
+        first = RawSQL(f"SELECT {qn('id')} FROM ({sql}) {qn('ranked')} WHERE {qn('user_rank')} <= %s",
+                       (*params, max))
+        intentions = {user_id: [] for user_id in user_ids}
+        for intention in self.filter(id__in=first).order_by('created', 'id'):
+            intentions[intention.user_id].append(intention)
+        return intentions
+
+    def claim_jobs(self, intentions, worker, max=1):
+        """Create jobs for up to max intentions, in a single transaction
+
+        Intentions are locked with SKIP LOCKED, so that those
+        being claimed by other workers are just skipped, instead
+        of making this worker give up. Jobs are created by each
+        intention (create_job), so that child classes can still
+        hold the resources they need.
+
+        :param intentions: candidate intentions (maybe of several child classes)
+        :param worker:     Worker claiming the jobs
+        :param max:        maximum number of jobs to create
+        :returns:          list of jobs created for the worker
+        """
+        candidates = {intention.id: intention for intention in intentions}
+        if not candidates:
+            return []
+        jobs_created = []
+        with transaction.atomic():
+            locked = list(Intention.objects.filter(id__in=candidates, job=None)
+                          .order_by('created')
+                          .select_for_update(**utils.skip_locked())
+                          .values_list('id', flat=True))
+            for intention_id in locked:
+                job = candidates[intention_id].create_job(worker)
+                if job is not None:
+                    jobs_created.append(job)
+                    if len(jobs_created) >= max:
+                        break
+            if locked:
+                # Jobs created, or intentions attached to jobs (see create_job)
+                Change.objects.record(Change.Kind.CLAIM)
+        return jobs_created
+
+    def cast_many(self, intentions):
+        """Cast intentions (maybe of several kinds) to their child classes
+
+        Children are fetched with a single query per kind, instead of
+        (at least) one query per intention.
+
+        :param intentions: iterable of intentions (eg, a queryset)
+        :returns:          list of casted intentions, in the same order
+        """
+        intentions = list(intentions)
+        pks_by_kind = defaultdict(list)
+        for intention in intentions:
+            if intention.kind and intention.kind != intention._meta.label_lower:
+                pks_by_kind[intention.kind].append(intention.pk)
+        casted = {}
+        for kind, pks in pks_by_kind.items():
+            model = Intention.intention_class(kind)
+            if model is not None:
+                casted.update(model._base_manager.in_bulk(pks))
+        return [casted[intention.pk] if intention.pk in casted else intention.cast()
+                for intention in intentions]
+
+
 class Intention(models.Model):
     """Intention: Something you want to achieve
 
@@ -31,15 +160,89 @@ class Intention(models.Model):
         default=None, blank=True, symmetrical=False
     )
 
+    # Number of previous intentions still pending (not archived).
+    # Maintained when previous intentions are added or removed,
+    # so that ready intentions are found with an indexed lookup.
+    pending_previous = models.PositiveIntegerField(default=0)
+
     created = models.DateTimeField(auto_now_add=True)
 
+    # Kind of intention: label of its (child) class, such as
+    # 'poolsched_github.ighraw'. Set when the intention is saved.
+    kind = models.CharField(max_length=100, default='', blank=True, db_index=True)
+
+    objects = IntentionManager()
+
     class Meta:
         abstract = False
+        indexes = [
+            models.Index(fields=['user', 'pending_previous', 'job'], name='intention_ready_idx'),
+        ]
 
     @property
     def process_name(self):
         raise NotImplementedError
 
+    # Phase of the analysis: intentions of later (higher) phases go
+    # first, when several of them are ready (see SchedWorker._get_intentions)
+    phase = 0
+
+    def resource_pools(self):
+        """Pools of resources the job of this intention needs (see Resource)
+
+        The job holds a resource of each pool, reserved when it is
+        created. Usually redefined by child classes (eg, the pool of
+        GitHub tokens of the user).
+        """
+        return []
+
+    def dedup_key(self):
+        """Key of what the job of this intention does (see jobs.dedup_key)
+
+        Intentions with the same key are attached to the same job,
+        instead of getting a new one (see create_job). Usually redefined
+        by child classes (eg, kind and repository). None: no coalescing.
+        """
+        return None
+
+    def runtime_key(self):
+        """Key for the statistics of the runtime of this intention (see RuntimeStat)
+
+        Usually redefined by child classes (eg, the repository of the
+        intention). With no key (''), only those of its kind are kept.
+        """
+        return ''
+
+    # Class for archived intentions of this class (child of ArchivedIntention).
+    # If defined, intentions are archived in bulk, with the fields in
+    # archived_fields(). Else, archive() is called for each intention.
+    archived_class = None
+
+    def archived_fields(self):
+        """Fields specific to archived_class, for archiving this intention
+
+        Usually redefined by child classes defining archived_class
+        """
+        return {}
+
+    def archive(self, status, arch_job):
+        """Archive this intention (create an archived intention, delete it)
+
+        Usually redefined by child classes, unless they define archived_class
+        """
+        if self.archived_class is None:
+            raise NotImplementedError
+        archived = self.archived_class.objects.create(user=self.user, created=self.created,
+                                                      status=status, arch_job=arch_job,
+                                                      **self.archived_fields())
+        self.delete()
+        return archived
+
+    def save(self, *args, **kwargs):
+        if not self.kind:
+            self.kind = self._meta.label_lower
+        super().save(*args, **kwargs)
+
     def _create_previous(self):
         """Create all needed previous intentions (no previous intention needed)
 
@@ -48,14 +251,18 @@ class Intention(models.Model):
         return []
 
     def deep_previous(self):
-        """Create, recursively, all previous intentions"""
+        """Create, recursively, all previous intentions
+
+        For creating many intentions at once, see IntentionGraph.
+        """
 
         intentions = self._create_previous()
-        for intention in intentions:
-            intentions += intention.create_deep()
+        for intention in list(intentions):
+            intentions += intention.deep_previous()
         return intentions
 
-    _subfields_list = None
+    # Intention classes (children at any depth, and proxies), by kind
+    _registry = None
 
     def queryset(self):
         return self.__class__.objects.filter(id=self.id)
@@ -64,6 +271,10 @@ class Intention(models.Model):
         """Create a new job for this intention and worker
         Adds the job to the intention, too.
 
+        If there is a job with the same dedup_key, the intention is
+        attached to it instead (even if it is being created by another
+        worker at the same time), and None is returned.
+
         If the worker didn't create the job, return None
 
         :param worker: Worker willing to create the job.
@@ -72,24 +283,73 @@ class Intention(models.Model):
         try:
             with transaction.atomic():
                 try:
-                    intention = self.queryset().select_for_update(nowait=True).get()
+                    intention = self.queryset().select_for_update(**utils.skip_locked()).get()
                 except OperationalError:
                     logger.warning('Intention locked in create_job()')
+                    metrics.lock_failures.inc(site='create_job')
+                    metrics.claim_attempts.inc(site='create_job', result='locked')
                     return None
                 except ObjectDoesNotExist:
-                    # The object could be already analyzed
+                    # The object could be already analyzed, or locked
+                    # by some other worker creating its job (skipped)
+                    if self.queryset().exists():
+                        metrics.lock_failures.inc(site='create_job')
+                        metrics.claim_attempts.inc(site='create_job', result='locked')
+                    else:
+                        metrics.claim_attempts.inc(site='create_job', result='missing')
                     return None
 
                 # We have to check this now that we have the intention
                 if intention.job:
                     # Job NOT created by the worker
+                    metrics.claim_attempts.inc(site='create_job', result='taken')
+                    return None
+
+                # Some job is already doing the same
+                key = self.dedup_key()
+                if key is not None and self._attach(key):
                     return None
 
-                job = jobs.Job.objects.create(worker=worker)
+                # Hold and check: reserve the resources needed, if still available
+                pools = self.resource_pools()
+                reserved = Resource.objects.reserve(pools) if pools else []
+                if reserved is None:
+                    metrics.claim_attempts.inc(site='create_job', result='no_resources')
+                    return None
+
+                try:
+                    with transaction.atomic(savepoint=key is not None):
+                        job = jobs.Job.objects.create(worker=worker, lease_expires=jobs.lease_expiration(),
+                                                      dedup_key=key)
+                except IntegrityError:
+                    # Some other worker created a job doing the same meanwhile
+                    if key is not None and self._attach(key):
+                        return None
+                    raise
+                if reserved:
+                    Resource.objects.hold(reserved, job)
                 self.job = job
-                self.save()
+                self.save(update_fields=['job'])
         except IntegrityError:
+            metrics.claim_attempts.inc(site='create_job', result='error')
+            return None
+        metrics.claim_attempts.inc(site='create_job', result='created')
+        metrics.queue_wait.observe((job.created - self.created).total_seconds(), kind=self.kind)
+        return job
+
+    def _attach(self, key):
+        """Attach the intention to the job with a dedup_key, if any
+
+        :returns: the job, or None if there is no job with that key
+        """
+        # Locking read: sees jobs committed by others meanwhile (even under
+        # REPEATABLE READ), and they can't be archived while attaching to them
+        job = jobs.Job.objects.select_for_update().filter(dedup_key=key).first()
+        if job is None:
             return None
+        self.job = job
+        self.save(update_fields=['job'])
+        metrics.claim_attempts.inc(site='create_job', result='attached')
         return job
 
     def update_job_worker(self, worker):
@@ -109,40 +369,69 @@ class Intention(models.Model):
         return None
 
     @classmethod
-    def _subfields(cls):
-        """Get all fields corresponding to child classes
+    def intention_class(cls, kind):
+        """Get the intention class for a kind (None if unknown)
 
-        We only run this the first time it is actually called"""
+        The registry of classes is built the first time it is needed,
+        and rebuilt if some kind is not found in it.
+        """
+        if Intention._registry is None or kind not in Intention._registry:
+            Intention._registry = {model._meta.label_lower: model
+                                   for model in apps.get_models()
+                                   if issubclass(model, Intention)}
+        return Intention._registry.get(kind)
 
-        if cls._subfields_list is None:
-            cls._subfields_list = \
-                [child._meta.model_name for child in cls.__subclasses__()]
-        return cls._subfields_list
+    @classmethod
+    def kinds(cls):
+        """Get the kinds of the intentions of a class (its own, and those of its children)"""
+        cls.intention_class(cls._meta.label_lower)
+        return sorted(kind for kind, model in Intention._registry.items() if issubclass(model, cls))
 
     def cast(self):
-        """Cast to the children, if any
+        """Cast to the child class of the intention (its kind), if any
+
+        :return: children model, or self, if it is already of its kind
+        """
+        if self._state.adding or self.kind == self._meta.label_lower:
+            return self
+        if not self.kind:
+            return self._cast_unknown_kind()
+        model = self.intention_class(self.kind)
+        if model is None:
+            logger.debug(f"Casting as intention (unknown kind): {self}, {self.kind}")
+            return self
+        try:
+            return model._base_manager.get(pk=self.pk)
+        except ObjectDoesNotExist:
+            logger.debug(f"Casting as intention (error?): {self}, {self.kind}")
+            return self
 
-        Based on https://stackoverflow.com/a/22302235/2075265
+    def _cast_unknown_kind(self):
+        """Cast an intention saved with no kind (before kinds existed)
 
-        :return: children model, or self, if it is a child
+        Child classes are probed (deepest first), and the kind is saved.
         """
-        for field in self._subfields():
-            try:
-                attr = getattr(self, field)
-            except Exception:
-                # Some subfield is not an attribute, check the rest
-                pass
-            else:
-                # Child attribute found
-                return attr
-        # Exception raised, or all subfield attributes are None
-        logger.debug(f"Casting as intention (error?): {self}, {self.__class__}")
-        return self
+        intention_class = self.intention_class(self._meta.label_lower)
+        children = [model for model in Intention._registry.values()
+                    if issubclass(model, intention_class) and model is not intention_class
+                    and not model._meta.proxy]
+        children.sort(key=lambda model: len(model._meta.get_parent_list()), reverse=True)
+        casted = self
+        for model in children:
+            child = model._base_manager.filter(pk=self.pk).first()
+            if child is not None:
+                casted = child
+                break
+        casted.kind = casted._meta.label_lower
+        Intention.objects.filter(pk=self.pk).update(kind=casted.kind)
+        return casted
 
     def _create_log_handler(self, job):
         job.logs = Log.objects.create(location=f"job-{job.id}.log")
         job.save()
-        handler = utils.file_formatter(f"{settings.JOB_LOGS}/job-{job.id}.log")
+        handler = utils.job_log_handler(f"{settings.JOB_LOGS}/job-{job.id}.log")
+        # Several jobs may be running in this process, in other slots
+        handler.addFilter(utils.JobFilter(job))
         return handler
 
 
@@ -161,7 +450,22 @@ class ArchivedIntention(models.Model):
     status = models.CharField(max_length=2, choices=STATUS_CHOICES, default=OK)
     arch_job = models.ForeignKey(jobs.ArchJob, on_delete=models.SET_NULL,
                             default=None, null=True, blank=True)
+    # Child class (app_label.model_name, as Intention.kind), '' if archived before kinds
+    kind = models.CharField(max_length=100, default='', blank=True)
+
+    class Meta:
+        # For the usual queries of the admin, and retention (see archive.compact)
+        indexes = [
+            models.Index(fields=['completed'], name='archived_completed_idx'),
+            models.Index(fields=['status', 'completed'], name='archived_status_idx'),
+            models.Index(fields=['user', 'completed'], name='archived_user_idx'),
+        ]
 
     @property
     def process_name(self):
         raise NotImplementedError
+
+    def save(self, *args, **kwargs):
+        if not self.kind:
+            self.kind = self._meta.label_lower
+        super().save(*args, **kwargs)
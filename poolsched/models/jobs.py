@@ -1,15 +1,85 @@
+import hashlib
 import logging
+from datetime import timedelta
 
+from django.conf import settings
 from django.db import models, transaction, OperationalError, IntegrityError
 from django.utils.timezone import now
 
 from . import workers
+from .changes import Change
+from .. import utils, metrics
 
 logger = logging.getLogger(__name__)
 
+# Seconds a job stays assigned to a worker, unless the worker renews it
+JOB_LEASE = getattr(settings, 'POOLSCHED_JOB_LEASE', 120)
+# Maximum length of keys for coalescing jobs
+DEDUP_KEY_LENGTH = 200
+
+
+def lease_expiration():
+    return now() + timedelta(seconds=JOB_LEASE)
+
+
+def dedup_key(*parts):
+    """Key for coalescing jobs doing the same (see Intention.dedup_key)
+
+    Parts are joined with ':' (with no surrounding spaces), and keys
+    too long for Job.dedup_key are replaced by their SHA-1 digest.
+
+    :param parts: parts of the key (eg, kind of intention and repository)
+    """
+    key = ':'.join(str(part).strip() for part in parts)
+    if len(key) > DEDUP_KEY_LENGTH:
+        key = 'sha1:' + hashlib.sha1(key.encode()).hexdigest()
+    return key
+
 
 class Log(models.Model):
+
+    class Codec(models.TextChoices):
+        NONE = '', "None"
+        GZIP = 'gzip', "gzip"
+
     location = models.CharField(max_length=255, default=None, null=True)
+    # Size of the file (bytes), once it is complete
+    size = models.BigIntegerField(default=None, null=True, blank=True)
+    # Compression of the file (see joblogs)
+    codec = models.CharField(max_length=10, choices=Codec.choices, default=Codec.NONE, blank=True)
+
+
+class JobManager(models.Manager):
+
+    def renew_leases(self, worker):
+        """Renew the leases of all jobs assigned to a worker"""
+        renewed = self.filter(worker=worker).update(lease_expires=lease_expiration())
+        if renewed:
+            Change.objects.record(Change.Kind.LEASE)
+        return renewed
+
+    def reap(self):
+        """Return jobs with expired leases to the pool of waiting jobs
+
+        Workers not renewing the leases of their jobs are considered
+        dead (eg, their container was killed), and marked as down.
+
+        :returns: number of jobs returned to the pool
+        """
+        with transaction.atomic():
+            expired = self.filter(worker__isnull=False, lease_expires__lt=now())\
+                .select_for_update(**utils.skip_locked())
+            expired = list(expired.values_list('id', 'worker'))
+            if not expired:
+                return 0
+            worker_ids = {worker_id for _, worker_id in expired}
+            logger.warning(f"Reaping jobs {[job_id for job_id, _ in expired]} from workers {worker_ids}")
+            workers.Worker.objects.filter(id__in=worker_ids).update(status=workers.Worker.Status.DOWN)
+            self.filter(id__in=[job_id for job_id, _ in expired])\
+                .update(worker=None, lease_expires=None)
+        # Jobs waiting for some worker to run them
+        Change.objects.record(Change.Kind.JOB)
+        return len(expired)
 
 
 class Job(models.Model):
@@ -28,6 +98,13 @@ class Job(models.Model):
                                default=None, null=True, blank=True)
     logs = models.ForeignKey(Log, on_delete=models.SET_NULL,
                              default=None, null=True)
+    # The worker owns the job until this time (unless it renews the lease)
+    lease_expires = models.DateTimeField(default=None, null=True, blank=True, db_index=True)
+    # What the job does (see dedup_key): intentions doing the same are attached to it
+    dedup_key = models.CharField(max_length=DEDUP_KEY_LENGTH, default=None, null=True, blank=True,
+                                 unique=True)
+
+    objects = JobManager()
 
     def queryset(self):
         """Function used to retrieve a queryset of this object
@@ -36,19 +113,34 @@ class Job(models.Model):
         return self.__class__.objects.filter(id=self.id)
 
     def assign_worker(self, worker):
-        """Assign a new worker if the Job has no worker"""
+        """Assign a new worker if the Job has no worker
+
+        If some other worker is assigning it (the job is locked),
+        it is skipped, and None is returned.
+        """
         try:
             with transaction.atomic():
-                job = self.queryset().select_for_update(nowait=True).get()
+                job = self.queryset().select_for_update(**utils.skip_locked()).first()
+                if job is None:
+                    logger.debug(f'Job locked in next_job()')
+                    metrics.lock_failures.inc(site='assign_worker')
+                    metrics.claim_attempts.inc(site='assign_worker', result='locked')
+                    return None
                 if job.worker:
+                    metrics.claim_attempts.inc(site='assign_worker', result='taken')
                     return None
                 self.worker = worker
+                self.lease_expires = lease_expiration()
                 self.save()
+                metrics.claim_attempts.inc(site='assign_worker', result='assigned')
                 return job
         except OperationalError:
             logger.warning(f'Job locked in next_job()')
+            metrics.lock_failures.inc(site='assign_worker')
+            metrics.claim_attempts.inc(site='assign_worker', result='locked')
             return None
         except IntegrityError:
+            metrics.claim_attempts.inc(site='assign_worker', result='error')
             return None
 
 
@@ -58,7 +150,7 @@ class ArchJob(models.Model):
     # When the original job was created
     created = models.DateTimeField(blank=True)
     # When it was archived (entered this table)
-    archived = models.DateTimeField(default=now, blank=True)
+    archived = models.DateTimeField(default=now, blank=True, db_index=True)
     # Worker archiving it
     worker = models.ForeignKey(workers.Worker, on_delete=models.SET_NULL,
                                default=None, null=True, blank=True)
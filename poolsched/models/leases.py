@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q
+from django.utils.timezone import now
+
+
+class LeaseManager(models.Manager):
+
+    def acquire(self, name, worker, seconds):
+        """Acquire (or renew) a lease for a worker
+
+        A single conditional UPDATE: the lease is taken if it is free,
+        expired, or already held by the worker.
+
+        :param name:    name of the lease
+        :param worker:  Worker acquiring the lease
+        :param seconds: duration of the lease
+        :returns:       True if the worker holds the lease
+        """
+        current = now()
+        acquired = self.filter(name=name)\
+            .filter(Q(holder=None) | Q(holder=worker) | Q(expires__lt=current))\
+            .update(holder=worker, expires=current + timedelta(seconds=seconds))
+        if not acquired and not self.filter(name=name).exists():
+            try:
+                with transaction.atomic():
+                    self.create(name=name, holder=worker,
+                                expires=current + timedelta(seconds=seconds))
+            except IntegrityError:
+                # Some other worker created it meanwhile
+                return False
+            return True
+        return acquired > 0
+
+    def release(self, name, worker):
+        """Release a lease, if held by the worker"""
+        self.filter(name=name, holder=worker).update(holder=None, expires=None)
+
+
+class Lease(models.Model):
+    """Lease on some task that only one worker should do at a time
+
+    The holder keeps the lease while it renews it before it expires.
+    If it dies, some other worker will take it after it expires.
+    """
+
+    name = models.CharField(max_length=50, primary_key=True)
+    holder = models.ForeignKey('poolsched.Worker', on_delete=models.SET_NULL,
+                               default=None, null=True, blank=True)
+    expires = models.DateTimeField(default=None, null=True, blank=True)
+
+    objects = LeaseManager()
@@ -0,0 +1,169 @@
+from django.db import models
+from django.db.models import Case, Count, Exists, F, FloatField, Min, OuterRef, Value, When
+from django.conf import settings
+from django.core.validators import MinValueValidator
+
+# Users fetched by pick() over those wanted, for skipping those at their cap
+PICK_EXTRA = getattr(settings, 'POOLSCHED_PICK_EXTRA', 4)
+
+
+class ReadyUserManager(models.Manager):
+
+    def virtual_time(self):
+        """Lowest pass among users with ready intentions (None if none)"""
+        return self.aggregate(time=Min('rank'))['time']
+
+    def mark(self, user_ids):
+        """Add users to the set of users with ready intentions
+
+        Users already in the set are left untouched, so this is
+        safe to call whenever an intention could have become ready.
+        New users join with the lowest pass in the set (plus the lag
+        they had when they left it, see UserShare), so they are among
+        the next users picked.
+
+        :param user_ids: iterable of User ids (None values are ignored)
+        """
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        if not user_ids:
+            return
+        time = self.virtual_time() or 0
+        lags = dict(UserShare.objects.filter(user_id__in=user_ids, lag__gt=0)
+                    .values_list('user_id', 'lag'))
+        self.bulk_create([self.model(user_id=user_id, rank=time + lags.get(user_id, 0))
+                          for user_id in user_ids],
+                         ignore_conflicts=True)
+
+    def pick(self, max=1, kinds=None):
+        """Pick the users with ready intentions with the lowest pass
+
+        Stride scheduling: users are picked by their pass (rank), walking
+        the index on (rank, user) for a few more rows than max, whatever
+        the number of users, and their pass advances, when they get jobs,
+        inversely to their weight (see charge). Users holding as many
+        jobs as their cap (see UserShare) are skipped (only the rows
+        fetched are checked), and their pass is moved to the lowest pass
+        picked, so that they don't bank time while waiting.
+
+        With kinds, only users with ready intentions of those kinds are
+        picked (eg, for a worker claiming jobs for its sync slots only),
+        so that users with ready intentions of other kinds don't hold
+        the lowest passes for it. Their pass is left as it is.
+
+        :param max:   maximum number of users
+        :param kinds: kinds of intentions wanted (None: any kind)
+        :returns:     list of User objects (with their rank and weight)
+        """
+        from .intentions import Intention
+        from .jobs import Job
+
+        ready = self.all()
+        if kinds is not None:
+            ready = ready.filter(Exists(Intention.objects.ready()
+                                        .filter(user=OuterRef('user'), kind__in=kinds)))
+        rows = list(ready.select_related('user__share').order_by('rank', 'user')[:max + PICK_EXTRA])
+        shares = {row.user_id: getattr(row.user, 'share', None) for row in rows}
+        caps = {user_id: share.max_jobs for user_id, share in shares.items()
+                if share is not None and share.max_jobs is not None}
+        held = {}
+        if caps:
+            held = dict(Job.objects.filter(intention__user__in=caps)
+                        .order_by()
+                        .values('intention__user')
+                        .annotate(count=Count('id', distinct=True))
+                        .values_list('intention__user', 'count'))
+        users = []
+        for row in rows:
+            if row.user_id in caps and held.get(row.user_id, 0) >= caps[row.user_id]:
+                continue
+            user = row.user
+            user.rank = row.rank
+            user.weight = shares[row.user_id].weight if shares[row.user_id] is not None else 1
+            users.append(user)
+            if len(users) >= max:
+                break
+        if users and users[0].rank > rows[0].rank:
+            ready.filter(rank__lt=users[0].rank).update(rank=users[0].rank)
+        return users
+
+    def charge(self, users, counts):
+        """Advance the pass of users, for the jobs they were given
+
+        The pass of each user advances by the number of jobs divided
+        by its weight, in a single UPDATE.
+
+        :param users:  users, as returned by pick()
+        :param counts: {user id: number of jobs}
+        """
+        strides = {user.id: counts[user.id] / max(user.weight, 1)
+                   for user in users if user is not None and counts.get(user.id)}
+        if not strides:
+            return
+        self.filter(user_id__in=strides)\
+            .update(rank=F('rank') + Case(*[When(user_id=user_id, then=Value(stride))
+                                            for user_id, stride in strides.items()],
+                                          default=Value(0.0), output_field=FloatField()))
+
+    def discard(self, user):
+        """Remove a user from the set, if it has no ready intentions
+
+        The user is removed first, and checked afterwards, so that
+        an intention becoming ready meanwhile is not lost. How far
+        its pass was from the lowest pass is kept as its lag.
+
+        :param user: User object
+        :returns:    whether the user is still in the set (it has ready intentions)
+        """
+        from .intentions import Intention
+
+        rank = self.filter(user=user).values_list('rank', flat=True).first()
+        if rank is None:
+            return False
+        self.filter(user=user).delete()
+        time = self.virtual_time()
+        lag = max(rank - time, 0) if time is not None else 0
+        if not UserShare.objects.filter(user=user).update(lag=lag) and lag:
+            UserShare.objects.create(user=user, lag=lag)
+        if Intention.objects.ready().filter(user=user).exists():
+            self.mark([user.id])
+            return True
+        return False
+
+
+class ReadyUser(models.Model):
+    """User with (maybe) ready intentions
+
+    Set of users with intentions with no previous intentions pending,
+    and no job. Users are added when some intention could have become
+    ready, and removed lazily, when a worker finds them with nothing
+    ready to run.
+    """
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                primary_key=True, related_name='ready')
+    # Pass of the user (stride scheduling): users with the lowest pass are picked first
+    rank = models.FloatField()
+
+    objects = ReadyUserManager()
+
+    class Meta:
+        # For picking users in order (see ReadyUserManager.pick)
+        indexes = [
+            models.Index(fields=['rank', 'user'], name='readyuser_rank_idx'),
+        ]
+
+
+class UserShare(models.Model):
+    """Share of the pool for a user
+
+    Users with no share have weight 1, and no cap.
+    """
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                primary_key=True, related_name='share')
+    # Users get jobs in proportion to their weights
+    weight = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    # Maximum number of jobs at the same time (None: no cap)
+    max_jobs = models.PositiveIntegerField(default=None, null=True, blank=True)
+    # Pass of the user over the lowest pass, when it left the set of ready users
+    lag = models.FloatField(default=0)
@@ -0,0 +1,217 @@
+import threading
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Count, Min
+from django.utils.timezone import now
+
+from .. import utils
+
+# Seconds the earliest time resources of each pool are available is cached
+RESOURCE_CACHE = getattr(settings, 'POOLSCHED_RESOURCE_CACHE', 10)
+
+
+class EarliestCache:
+    """Earliest time some resource of each pool is available (None: no resources)
+
+    Cached in each process, so that selecting intentions doesn't
+    query the resources they need each time.
+    """
+
+    def __init__(self, seconds=RESOURCE_CACHE):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.pools = {}
+
+    def get(self, pools):
+        """Cached times for pools (those not cached, or expired, are missing)"""
+        current = monotonic()
+        with self.lock:
+            return {pool: self.pools[pool][0] for pool in pools
+                    if pool in self.pools and self.pools[pool][1] > current}
+
+    def set(self, times):
+        expires = monotonic() + self.seconds
+        with self.lock:
+            self.pools.update({pool: (time, expires) for pool, time in times.items()})
+
+    def discard(self, pools):
+        with self.lock:
+            for pool in pools:
+                self.pools.pop(pool, None)
+
+    def clear(self):
+        with self.lock:
+            self.pools = {}
+
+
+earliest_cache = EarliestCache()
+
+
+class ResourceManager(models.Manager):
+
+    def earliest(self, pools):
+        """Earliest time some resource of each pool is available (cached)
+
+        :param pools: iterable of names of pools
+        :returns:     {pool: time, or None if the pool has no resources}
+        """
+        pools = set(pools)
+        times = earliest_cache.get(pools)
+        missing = pools - set(times)
+        if missing:
+            found = dict(self.filter(pool__in=missing).order_by()
+                         .values_list('pool').annotate(time=Min('available_at')))
+            fetched = {pool: found.get(pool) for pool in missing}
+            earliest_cache.set(fetched)
+            times.update(fetched)
+        return times
+
+    def available(self, intentions):
+        """Intentions whose resources may be available now
+
+        Intentions needing pools with no resource available (as told
+        by the cache, see earliest) are skipped, with (at most) a single
+        query for all of them.
+
+        :param intentions: list of intentions
+        :returns:          list of intentions, in the same order
+        """
+        needs = [(intention, intention.resource_pools()) for intention in intentions]
+        pools = {pool for _, intention_pools in needs for pool in intention_pools}
+        if not pools:
+            return intentions
+        times = self.earliest(pools)
+        current = now()
+        return [intention for intention, intention_pools in needs
+                if all(times[pool] is not None and times[pool] <= current for pool in intention_pools)]
+
+    def reserve(self, pools, cost=1):
+        """Choose a resource of each pool, if all of them are available
+
+        Must be called within a transaction: resources are locked (skipping
+        those locked by other workers), and should be held by a job (see
+        hold) before the transaction finishes. Resources are available if
+        they are held by less jobs than their capacity, and they have at
+        least cost tokens (or their bucket was reset).
+
+        :param pools: names of pools
+        :param cost:  tokens needed from each resource
+        :returns:     list of resources (one per pool), or None if some pool
+                      has no resource available
+        """
+        pools = list(dict.fromkeys(pools))
+        current = now()
+        candidates = list(self.filter(pool__in=pools, available_at__lte=current)
+                          .order_by('available_at', 'id')
+                          .select_for_update(**utils.skip_locked()))
+        held = dict(ResourceHold.objects.filter(resource__in=candidates).order_by()
+                    .values_list('resource').annotate(count=Count('id')))
+        chosen = {}
+        for resource in candidates:
+            if resource.pool in chosen or held.get(resource.id, 0) >= resource.capacity:
+                continue
+            resource.refill(current)
+            if resource.limit is None or resource.remaining >= cost:
+                chosen[resource.pool] = resource
+        if len(chosen) < len(pools):
+            # Pools with resources (not locked) all of them at capacity, or with
+            # no tokens, are not worth trying again for a while. Pools with no
+            # resources found may just have them locked by other workers.
+            exhausted = {resource.pool for resource in candidates} - set(chosen)
+            earliest_cache.set({pool: current + timedelta(seconds=earliest_cache.seconds)
+                                for pool in exhausted})
+            return None
+        return [chosen[pool] for pool in pools]
+
+    def hold(self, resources, job, cost=1):
+        """Hold resources (see reserve) for a job, taking cost tokens from them"""
+        ResourceHold.objects.bulk_create([ResourceHold(resource=resource, job=job)
+                                          for resource in resources])
+        buckets = [resource for resource in resources if resource.limit is not None]
+        for resource in buckets:
+            resource.use(cost)
+        if buckets:
+            self.bulk_update(buckets, ['remaining', 'reset', 'available_at'])
+            earliest_cache.discard({resource.pool for resource in buckets})
+
+    def release(self, job):
+        """Release the resources held by a job (done when the job is deleted, too)"""
+        ResourceHold.objects.filter(job=job).delete()
+
+
+class Resource(models.Model):
+    """Resource needed by jobs (such as an API token)
+
+    Resources are grouped in pools of interchangeable resources
+    (such as the GitHub tokens of a user). Intentions tell the pools
+    they need (see Intention.resource_pools), and their jobs hold a
+    resource of each pool while they exist. Each resource may be held
+    by a number of jobs at the same time (capacity), and may have a
+    token bucket, refilled at some time (as told by the API).
+    """
+
+    # Pool of the resource (eg, 'github:42', for GitHub tokens of user 42)
+    pool = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, default='', blank=True)
+    # Maximum number of jobs holding the resource at the same time
+    capacity = models.PositiveIntegerField(default=1)
+    # Token bucket (no bucket if limit is None): tokens after being
+    # refilled, tokens remaining, and when it will be refilled
+    limit = models.PositiveIntegerField(default=None, null=True, blank=True)
+    remaining = models.IntegerField(default=None, null=True, blank=True)
+    reset = models.DateTimeField(default=None, null=True, blank=True)
+    # Earliest time the resource is available (when its bucket is
+    # refilled, if exhausted), for finding available resources with
+    # an indexed lookup
+    available_at = models.DateTimeField(default=now)
+    jobs = models.ManyToManyField('poolsched.Job', through='ResourceHold',
+                                  related_name='resources', blank=True)
+
+    objects = ResourceManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pool', 'available_at'], name='resource_available_idx'),
+        ]
+
+    def refill(self, current):
+        """Refill the bucket, if it is time to"""
+        if self.limit is not None and (self.remaining is None
+                                       or (self.reset is not None and self.reset <= current)):
+            self.remaining = self.limit
+            self.reset = None
+
+    def use(self, cost):
+        """Take tokens from the bucket (unavailable until refilled, if exhausted)"""
+        self.remaining -= cost
+        if self.remaining < cost and self.reset is not None:
+            self.available_at = self.reset
+
+    def update_bucket(self, remaining, reset=None):
+        """Update the bucket, with the tokens remaining and reset time told by the API
+
+        :param remaining: tokens remaining
+        :param reset:     time when the bucket will be refilled (None: unknown)
+        """
+        self.remaining = remaining
+        self.reset = reset
+        self.available_at = reset if remaining <= 0 and reset is not None else now()
+        Resource.objects.filter(id=self.id)\
+            .update(remaining=self.remaining, reset=self.reset, available_at=self.available_at)
+        earliest_cache.discard([self.pool])
+
+
+class ResourceHold(models.Model):
+    """Resource held by a job"""
+
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='holds')
+    job = models.ForeignKey('poolsched.Job', on_delete=models.CASCADE, related_name='resource_holds')
+    created = models.DateTimeField(default=now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['resource', 'job'], name='resourcehold_resource_job'),
+        ]
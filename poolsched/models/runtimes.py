@@ -0,0 +1,129 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import models
+from django.db.models import ExpressionWrapper, F, Value
+from django.db.models.functions import Greatest
+from django.utils.timezone import now
+
+# Weight of new samples, once there are enough of them (exponential moving average)
+RUNTIME_ALPHA = getattr(settings, 'POOLSCHED_RUNTIME_ALPHA', 0.05)
+# Samples needed for using the statistics of a key (else, those of the kind are used)
+RUNTIME_MIN_SAMPLES = getattr(settings, 'POOLSCHED_RUNTIME_MIN_SAMPLES', 3)
+# Runtime (seconds) assumed for intentions with no statistics
+RUNTIME_DEFAULT = getattr(settings, 'POOLSCHED_RUNTIME_DEFAULT', 60)
+
+
+class RuntimeStatManager(models.Manager):
+
+    def _key(self, key):
+        """Key of the statistics for a runtime key (truncated to fit)"""
+        return (key or '')[:self.model._meta.get_field('key').max_length]
+
+    def record(self, samples):
+        """Add runtimes of intentions to their statistics
+
+        Each sample is added to the statistics of its kind, and to those
+        of its key (if any). Missing statistics are created (ignoring
+        those created meanwhile by other workers), and then updated in
+        the database, with no savepoint (this is called while archiving):
+        a query for each kind and key, whatever the number of samples.
+
+        :param samples: iterable of (kind, key, seconds)
+        """
+        runtimes = defaultdict(list)
+        for kind, key, seconds in samples:
+            runtimes[(kind, '')].append(seconds)
+            if key:
+                runtimes[(kind, self._key(key))].append(seconds)
+        if not runtimes:
+            return
+        self.bulk_create([self.model(kind=kind, key=key) for kind, key in runtimes],
+                         ignore_conflicts=True)
+        for (kind, key), values in runtimes.items():
+            self.filter(kind=kind, key=key).update(**self.model.added(values))
+
+    def predict(self, intentions):
+        """Predicted runtime of intentions, from the statistics of their keys
+
+        The statistics of the kind are used for keys with few samples.
+        A single query for all the intentions.
+
+        :param intentions: list of intentions
+        :returns:          list of runtimes (seconds), None for unknown ones
+        """
+        keys = [(intention.kind, self._key(intention.runtime_key())) for intention in intentions]
+        if not keys:
+            return []
+        stats = {(stat.kind, stat.key): stat
+                 for stat in self.filter(kind__in={kind for kind, _ in keys},
+                                         key__in={key for _, key in keys} | {''})}
+        predictions = []
+        for kind, key in keys:
+            stat = stats.get((kind, key))
+            if stat is None or stat.count < RUNTIME_MIN_SAMPLES:
+                stat = stats.get((kind, ''))
+            predictions.append(stat.mean if stat is not None else None)
+        return predictions
+
+
+class RuntimeStat(models.Model):
+    """Rolling statistics of the runtime of intentions, by kind and key
+
+    Runtimes are the time from the creation of the job to its
+    archival (see archive.archive_job). Statistics are updated
+    incrementally: a cumulative mean and variance (Welford) for the
+    first samples, which become exponential moving averages (with
+    weight RUNTIME_ALPHA) when there are more of them, so that old
+    runtimes are eventually forgotten.
+    """
+
+    # Kind of the intentions (see Intention.kind)
+    kind = models.CharField(max_length=100)
+    # Key of the intentions (see Intention.runtime_key), '' for all of the kind
+    key = models.CharField(max_length=250, default='', blank=True)
+    count = models.BigIntegerField(default=0)
+    # Mean and variance of the runtimes (seconds)
+    mean = models.FloatField(default=0)
+    variance = models.FloatField(default=0)
+    updated = models.DateTimeField(default=now)
+
+    objects = RuntimeStatManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='runtimestat_kind_key'),
+        ]
+
+    @staticmethod
+    def added(samples):
+        """Values for updating statistics with some runtimes (seconds)
+
+        The runtimes are merged as a whole: as add() for each of them
+        while the statistics are cumulative, and with the weight of as
+        many samples after that. Values are expressions of the current
+        ones, with those used by others first: some backends (MySQL)
+        update columns in order, using the new values of those updated before.
+        """
+        count = len(samples)
+        mean = sum(samples) / count
+        variance = sum((seconds - mean) ** 2 for seconds in samples) / count
+        weight = Greatest(ExpressionWrapper(Value(float(count)) / (F('count') + count),
+                                            output_field=models.FloatField()),
+                          Value(1 - (1 - RUNTIME_ALPHA) ** count), output_field=models.FloatField())
+        delta = ExpressionWrapper(Value(mean) - F('mean'), output_field=models.FloatField())
+        return {
+            'variance': (1 - weight) * (F('variance') + weight * delta * delta) + weight * variance,
+            'mean': F('mean') + weight * delta,
+            'count': F('count') + count,
+            'updated': now(),
+        }
+
+    def add(self, seconds):
+        """Add a runtime (seconds) to the statistics"""
+        self.count += 1
+        weight = max(1 / self.count, RUNTIME_ALPHA)
+        delta = seconds - self.mean
+        self.mean += weight * delta
+        self.variance = (1 - weight) * (self.variance + weight * delta * delta)
+        self.updated = now()
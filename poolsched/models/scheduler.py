@@ -1,28 +1,109 @@
 import datetime
 import logging
-import importlib
+from collections import defaultdict
+from functools import lru_cache
 
 from django.db import models
+from django.db.models import Min
 from django.conf import settings
+from django.utils.module_loading import import_string
 from django.utils.timezone import now
 
+from .graph import IntentionGraph
+
 logger = logging.getLogger(__name__)
 
+# Seconds after which scheduled intentions that could not be created are retried
+SCHEDULE_RETRY = getattr(settings, 'POOLSCHED_SCHEDULE_RETRY', 3600)
+
+
+@lru_cache(maxsize=None)
+def intention_class(path):
+    """Class for a path to an intention class (cached)
+
+    :param path: path of the class (eg 'cauldron_apps.poolsched_github.models.IGHRaw')
+    """
+    return import_string(path)
+
 
 class SchedulerManager(models.Manager):
+
+    def due(self):
+        """Scheduled intentions due, not taken by any worker"""
+        return self.filter(worker=None)\
+            .exclude(scheduled_at=None)\
+            .filter(scheduled_at__lt=now())
+
+    def next_due(self):
+        """Time when the next scheduled intention is due (None if none)"""
+        return self.filter(worker=None).aggregate(next=Min('scheduled_at'))['next']
+
+    def children_tree(self, scheduled):
+        """Children of scheduled intentions, at any depth
+
+        One query per level of the tree (for all the scheduled
+        intentions at once), instead of one per scheduled intention.
+
+        :param scheduled: list of scheduled intentions
+        :returns:         dictionary {id of parent: [children]}
+        """
+        children = defaultdict(list)
+        parents = [sched.id for sched in scheduled]
+        seen = set(parents)
+        while parents:
+            level = [child for child in self.filter(depends_on__in=parents) if child.id not in seen]
+            for child in level:
+                children[child.depends_on_id].append(child)
+                seen.add(child.id)
+            parents = [child.id for child in level]
+        return children
+
+    def _submit(self, roots, children):
+        """Create the intentions of some scheduled intentions (and their children) as a graph
+
+        The graph is submitted in its own transaction (or savepoint),
+        so nothing is created if it fails.
+        """
+        graph = IntentionGraph()
+        for intention in roots:
+            intention._add_to_graph(graph, [], children)
+        graph.submit()
+
     def create_intentions(self, worker):
-        """Create all ready scheduled intentions"""
+        """Create all ready scheduled intentions
+
+        All of them (and their children) are created in bulk,
+        as a single graph of intentions. If that fails, each of them
+        is created separately, so that a wrong one (eg, with a wrong
+        class or arguments) doesn't stop the rest. Those failing
+        are retried after SCHEDULE_RETRY seconds.
+        """
 
         # Update intentions to the worker name
-        self.filter(worker=None)\
-            .exclude(scheduled_at=None)\
-            .filter(scheduled_at__lt=now())\
-            .update(worker=worker)
+        self.due().update(worker=worker)
         # Get all the intentions for this worker
         intentions = self.filter(worker=worker)
         try:
-            for intention in intentions:
-                intention.create_intention()
+            scheduled = list(intentions)
+            if scheduled:
+                children = self.children_tree(scheduled)
+                failed = []
+                try:
+                    self._submit(scheduled, children)
+                except Exception:
+                    logger.warning('Error creating the scheduled intentions, creating them one by one.')
+                    for intention in scheduled:
+                        try:
+                            self._submit([intention], children)
+                        except Exception:
+                            logger.exception(f'Error creating scheduled intention {intention.id}.')
+                            failed.append(intention)
+                retry = now() + datetime.timedelta(seconds=SCHEDULE_RETRY)
+                for intention in failed:
+                    intention.scheduled_at = retry
+                rescheduled = [intention for intention in scheduled
+                               if intention not in failed and intention.reschedule(save=False)]
+                self.bulk_update(rescheduled + failed, ['scheduled_at'])
         except Exception as e:
             # Too broad exception to avoid stopping scheduled intentions
             logger.exception(f'Error creating the scheduled intentions.')
@@ -73,21 +154,37 @@ class ScheduledIntention(models.Model):
         Initialize a new intention with the defined arguments.
 
         If is any other intention depends on this one, create it.
+        All of them are created in bulk (see IntentionGraph).
 
         If this is a repeating intention, reschedule it again.
         """
-        logger.info(f'Creating intention {self.intention_class}({self.kwargs})')
-
-        module_name, class_name = self.intention_class.rsplit('.', 1)
-        module = importlib.import_module(module_name)
-        iclass = getattr(module, class_name)
-        intention, _ = iclass.objects.get_or_create(**self.kwargs)
-        intention.previous.add(parent_intention)
+        graph = IntentionGraph()
+        self._add_to_graph(graph, [parent_intention],
+                           ScheduledIntention.objects.children_tree([self]))
+        graph.submit()
+        self.reschedule()
 
-        children = self.children_intentions.all()
-        for child in children:
-            child.create_intention(parent_intention=intention)
+    def reschedule(self, save=True):
+        """Schedule again, if this is a repeating intention
 
-        if self.scheduled_at and self.repeat:
-            self.scheduled_at += datetime.timedelta(hours=self.repeat)
+        :param save: save the new time (or leave it for a bulk update)
+        :returns:    True if rescheduled
+        """
+        if not (self.scheduled_at and self.repeat):
+            return False
+        self.scheduled_at += datetime.timedelta(hours=self.repeat)
+        if save:
             self.save()
+        return True
+
+    def _add_to_graph(self, graph, previous, children):
+        """Add the intention, and those depending on it, to graph
+
+        :param children: tree of children (see SchedulerManager.children_tree)
+        """
+        logger.info(f'Creating intention {self.intention_class}({self.kwargs})')
+
+        iclass = intention_class(self.intention_class)
+        node = graph.add(iclass, previous=previous, **self.kwargs)
+        for child in children.get(self.id, []):
+            child._add_to_graph(graph, [node], children)
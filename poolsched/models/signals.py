@@ -0,0 +1,163 @@
+"""Keep derived scheduling state in sync with intentions and jobs"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import class_prepared, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .intentions import Intention
+from .jobs import Job, ArchJob
+from .ready import ReadyUser
+from .scheduler import ScheduledIntention
+from .changes import Change
+
+
+_local = threading.local()
+
+
+@contextmanager
+def bulk_maintenance():
+    """Skip maintenance for each deleted intention
+
+    For code deleting intentions in bulk, which has to maintain
+    the state of the intentions after them (see previous_deleted).
+    """
+    _local.bulk = True
+    try:
+        yield
+    finally:
+        _local.bulk = False
+
+
+def previous_deleted(intention_ids):
+    """Intentions were deleted: update those after them
+
+    Should be called after deleting intentions within bulk_maintenance(),
+    with the ids of the intentions after them (see Intention.next_ids()).
+    """
+    _previous_changed(intention_ids)
+
+
+def _mark_ready_on_commit(user_ids):
+    user_ids = list(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: ReadyUser.objects.mark(user_ids))
+
+
+def _previous_changed(intention_ids):
+    """Previous intentions changed for some intentions: update them"""
+    if not intention_ids:
+        return
+    intentions = Intention.objects.filter(pk__in=intention_ids)
+    intentions.refresh_pending()
+    _mark_ready_on_commit(set(intentions.ready().values_list('user', flat=True)))
+
+
+def intention_created(sender, instance, created, raw=False, **kwargs):
+    """A new intention may be ready (child classes are senders too, see _connect)"""
+    if created and not raw:
+        if instance.pending_previous == 0 and instance.job_id is None:
+            _mark_ready_on_commit([instance.user_id])
+        Change.objects.record(Change.Kind.INTENTION)
+
+
+@receiver(m2m_changed, sender=Intention.previous.through)
+def previous_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Previous intentions were linked or unlinked"""
+    if action == 'pre_clear' and reverse:
+        # Intentions after this one, about to lose it
+        instance._poolsched_next = list(
+            Intention.objects.filter(previous=instance).values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        _previous_changed(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        _previous_changed(getattr(instance, '_poolsched_next', []) if reverse else [instance.pk])
+
+
+def _intention_sender(sender):
+    """Deletions of Intention rows are sent by Intention, or by its proxies
+
+    (for child classes, they are sent for their parent Intention, too)
+    """
+    return issubclass(sender, Intention) and sender._meta.concrete_model is Intention
+
+
+def intention_deleting(sender, instance, **kwargs):
+    """Remember intentions after a deleted (usually archived) one"""
+    if getattr(_local, 'bulk', False):
+        return
+    instance._poolsched_next = list(
+        Intention.objects.filter(previous=instance).values_list('id', flat=True))
+
+
+def intention_deleted(sender, instance, **kwargs):
+    """Intentions after a deleted (usually archived) one may be ready"""
+    _previous_changed(getattr(instance, '_poolsched_next', []))
+    if not getattr(_local, 'bulk', False):
+        Change.objects.record(Change.Kind.INTENTION)
+
+
+def _connect(model):
+    """Connect the receivers for intentions to an intention class
+
+    Receivers are connected to each class (instead of to any sender),
+    so that other models still get fast deletes, and saves with no calls.
+    """
+    if not issubclass(model, Intention) or model._meta.abstract:
+        return
+    post_save.connect(intention_created, sender=model)
+    if _intention_sender(model):
+        pre_delete.connect(intention_deleting, sender=model)
+        post_delete.connect(intention_deleted, sender=model)
+
+
+@receiver(class_prepared)
+def intention_class_prepared(sender, **kwargs):
+    """Intention classes defined later (eg, in other apps) get the receivers too"""
+    _connect(sender)
+
+
+def _intention_classes(model=Intention):
+    """Intention classes already defined"""
+    classes = [model]
+    for subclass in model.__subclasses__():
+        classes += _intention_classes(subclass)
+    return classes
+
+
+for intention_class in _intention_classes():
+    _connect(intention_class)
+
+
+@receiver(pre_delete, sender=Job)
+def job_deleted(sender, instance, **kwargs):
+    """Intentions still pointing to a deleted job will lose it"""
+    users = set(Intention.objects.filter(job=instance, pending_previous=0).values_list('user', flat=True))
+    _mark_ready_on_commit(users)
+    if users:
+        Change.objects.record(Change.Kind.JOB)
+
+
+@receiver(post_save, sender=Job)
+def job_saved(sender, instance, created, raw=False, **kwargs):
+    """A job without worker is waiting for some worker to run it
+
+    (jobs created are recorded as claimed, see IntentionManager.claim_jobs)
+    """
+    if not created and not raw:
+        Change.objects.record(Change.Kind.JOB if instance.worker_id is None else Change.Kind.CLAIM)
+
+
+@receiver(post_save, sender=ArchJob)
+def job_archived(sender, instance, created, raw=False, **kwargs):
+    """Intentions after the archived ones may be ready, and there is room for new jobs"""
+    if created and not raw:
+        Change.objects.record(Change.Kind.ARCHIVE)
+
+
+@receiver(post_save, sender=ScheduledIntention)
+def scheduled_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Change.objects.record(Change.Kind.SCHEDULED)
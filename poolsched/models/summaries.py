@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
+
+from .intentions import ArchivedIntention
+
+
+class ArchiveSummaryManager(models.Manager):
+
+    def add(self, rows):
+        """Add counts and runtimes of archived intentions to the summaries
+
+        Summaries are locked, and updated in bulk. Missing ones are
+        created (ignoring those created meanwhile by others), so that
+        concurrent calls don't lose counts.
+
+        :param rows: iterable of dicts with day, user (id), status, count and runtime (seconds)
+        """
+        rows = {(row['day'], row['user'], row['status']): row for row in rows}
+        if not rows:
+            return
+        with transaction.atomic():
+            summaries = self._lock(rows)
+            missing = [key for key in rows if key not in summaries]
+            if missing:
+                self.bulk_create([self.model(day=day, user_id=user, status=status)
+                                  for day, user, status in missing],
+                                 ignore_conflicts=True)
+                summaries.update(self._lock(missing))
+            for key, summary in summaries.items():
+                summary.count += rows[key]['count']
+                summary.runtime += rows[key]['runtime'] or 0
+            self.bulk_update(list(summaries.values()), ['count', 'runtime'])
+
+    def _lock(self, keys):
+        """Lock the summaries for some (day, user id, status)
+
+        :returns: {(day, user id, status): summary}, the first one of each key
+        """
+        condition = Q()
+        for day, user, status in keys:
+            condition |= Q(day=day, user_id=user, status=status)
+        summaries = {}
+        for summary in self.select_for_update().filter(condition).order_by('id'):
+            summaries.setdefault((summary.day, summary.user_id, summary.status), summary)
+        return summaries
+
+
+class ArchiveSummary(models.Model):
+    """Archived intentions of a day, by user and status
+
+    Archived intentions older than the retention period are added
+    to these summaries before they are deleted (see archive.compact).
+    There may be several summaries for the same day and status with
+    no user (eg, after deleting users): add them up when reading.
+    """
+
+    day = models.DateField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                             default=None, null=True, blank=True)
+    status = models.CharField(max_length=2, choices=ArchivedIntention.STATUS_CHOICES,
+                              default=ArchivedIntention.OK)
+    # Number of archived intentions
+    count = models.BigIntegerField(default=0)
+    # Total runtime of their jobs (seconds, see RuntimeStat)
+    runtime = models.FloatField(default=0)
+
+    objects = ArchiveSummaryManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user', 'status'], name='archivesummary_day_user'),
+        ]
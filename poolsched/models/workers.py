@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils.timezone import now
 
 
 class Worker(models.Model):
@@ -10,3 +11,12 @@ class Worker(models.Model):
     status = models.CharField(max_length=1, choices=Status.choices,
                               default=Status.DOWN)
     machine = models.CharField(max_length=30, default='Unknown')
+    # Number of jobs the worker runs at the same time
+    slots = models.PositiveSmallIntegerField(default=1)
+    # Last time the worker told it was alive
+    heartbeat = models.DateTimeField(default=None, null=True, blank=True, db_index=True)
+
+    def beat(self):
+        """Tell the worker is alive"""
+        self.heartbeat = now()
+        Worker.objects.filter(id=self.id).update(heartbeat=self.heartbeat, status=Worker.Status.UP)
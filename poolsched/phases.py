@@ -0,0 +1,173 @@
+"""Instrumentation of the phases of the worker loop
+
+Each phase of an iteration of the worker loop (creating scheduled
+intentions, looking for waiting jobs, the admission check, getting new
+jobs, running and archiving jobs, heartbeats) runs within Phases.phase(),
+which measures its wall time, the queries it runs, and the rows they
+touch (as told by the database driver), and passes them to hooks.
+
+The default hook aggregates them, for a report per worker, logged every
+POOLSCHED_PHASE_REPORT seconds, or when the worker gets SIGUSR1. More
+hooks can be added with POOLSCHED_PHASE_HOOKS (dotted paths of callables
+receiving phase, seconds, queries, rows).
+
+The loop can also be profiled with cProfile, from the start (setting
+POOLSCHED_PROFILE), or between two SIGUSR2 signals. Profiles are written
+to POOLSCHED_PROFILE_DIR. Only the thread running the loop is profiled
+(not the execution slots).
+"""
+
+import cProfile
+import logging
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter, strftime
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reports of phases in the log (0: no periodic reports)
+PHASE_REPORT = getattr(settings, 'POOLSCHED_PHASE_REPORT', 300)
+# More hooks for phases (dotted paths)
+PHASE_HOOKS = getattr(settings, 'POOLSCHED_PHASE_HOOKS', [])
+# Profile the worker loop from the start
+PROFILE = getattr(settings, 'POOLSCHED_PROFILE', False)
+# Directory for profiles
+PROFILE_DIR = getattr(settings, 'POOLSCHED_PROFILE_DIR', tempfile.gettempdir())
+
+
+class PhaseStats:
+    """Aggregated measures of a phase"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+        self.max_seconds = 0
+        self.queries = 0
+        self.rows = 0
+
+    def add(self, seconds, queries, rows):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.queries += queries
+        self.rows += rows
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_s': self.seconds,
+            'mean_ms': self.seconds * 1000 / self.count if self.count else None,
+            'max_ms': self.max_seconds * 1000,
+            'queries': self.queries,
+            'queries_per_call': self.queries / self.count if self.count else None,
+            'rows': self.rows,
+        }
+
+
+class Phases:
+    """Measures of the phases of a worker"""
+
+    def __init__(self, hooks=None):
+        self.lock = threading.Lock()
+        self.stats = defaultdict(PhaseStats)
+        if hooks is None:
+            hooks = [import_string(path) for path in PHASE_HOOKS]
+        self.hooks = [self.aggregate] + list(hooks)
+
+    @contextmanager
+    def phase(self, name):
+        """Measure a phase (phases may be nested: measures are included in both)"""
+        measures = {'queries': 0, 'rows': 0}
+
+        def count(execute, sql, params, many, context):
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                measures['queries'] += 1
+                rowcount = context['cursor'].rowcount
+                if rowcount is not None and rowcount > 0:
+                    measures['rows'] += rowcount
+
+        start = perf_counter()
+        try:
+            with connection.execute_wrapper(count):
+                yield
+        finally:
+            seconds = perf_counter() - start
+            for hook in self.hooks:
+                try:
+                    hook(name, seconds, measures['queries'], measures['rows'])
+                except Exception:
+                    logger.exception(f"Error in phase hook {hook}")
+
+    def aggregate(self, phase, seconds, queries, rows):
+        """Default hook: aggregate measures, for the report"""
+        with self.lock:
+            self.stats[phase].add(seconds, queries, rows)
+
+    def report(self, reset=False):
+        """Aggregated measures, for each phase
+
+        :param reset: start aggregating again
+        :returns:     {phase: measures (dict)}
+        """
+        with self.lock:
+            report = {phase: stats.as_dict() for phase, stats in sorted(self.stats.items())}
+            if reset:
+                self.stats = defaultdict(PhaseStats)
+        return report
+
+    def format_report(self, reset=False):
+        """Report, as text (a line per phase), for the log"""
+        lines = []
+        for phase, measures in self.report(reset=reset).items():
+            lines.append(f"{phase}: {measures['count']} calls, {measures['total_s']:.3f} s "
+                         f"(mean {measures['mean_ms']:.1f} ms, max {measures['max_ms']:.1f} ms), "
+                         f"{measures['queries']} queries, {measures['rows']} rows")
+        return '\n'.join(lines)
+
+
+class Profiler:
+    """Profiler (cProfile) for the thread running the worker loop"""
+
+    def __init__(self, name, directory=PROFILE_DIR):
+        self.name = name
+        self.directory = directory
+        self.profile = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self):
+        if self.profile is None:
+            logger.info("Profiling the worker loop")
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop(self):
+        """Stop profiling, and write the profile
+
+        :returns: path of the profile (None if not profiling)
+        """
+        if self.profile is None:
+            return None
+        self.profile.disable()
+        path = os.path.join(self.directory, f"{self.name}-{strftime('%Y%m%d-%H%M%S')}.prof")
+        self.profile.dump_stats(path)
+        self.profile = None
+        logger.info(f"Profile of the worker loop written to {path}")
+        return path
+
+    def toggle(self):
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
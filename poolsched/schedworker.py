@@ -5,24 +5,29 @@ When you instantiate a Worker, it is important to define an intention order,
 otherwise, it won't take any jobs.
 
 The precedence of a job should be governed by the following rules:
-- Job that is in the last phase of the analysis
-- Job that needs little time to run
+- Job that is in the last phase of the analysis (see Intention.phase)
+- Job that needs little time to run (predicted by RuntimeStat)
 - Job that doesn't use a token
 
 """
 
 import logging
+import signal
+import threading
 import traceback
 import socket
-from time import sleep
-from random import sample
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import sleep, monotonic
 
+from django.conf import settings
+from django.db import connection
 from django.forms.models import model_to_dict
-from django.contrib.auth import get_user_model
+from django.utils.timezone import now
 
-from .models import Worker, Job, ArchJob, ArchivedIntention, ScheduledIntention
-
-User = get_user_model()
+from . import utils, wakeup, capacity, archive, dispatcher, metrics, phases, aioruntime
+from .models import Worker, Job, Intention, ArchivedIntention, ReadyUser, RuntimeStat, Resource, Change
+from .models.runtimes import RUNTIME_DEFAULT
 
 # Default global level to DEBUG. Control level with handlers
 logging.getLogger().setLevel(logging.DEBUG)
@@ -30,204 +35,569 @@ logging.getLogger().setLevel(logging.DEBUG)
 logger = logging.getLogger(__name__)
 LOG_LEVEL = logging.INFO
 
+# Ready intentions of each user compared, for choosing the best ones to run
+CANDIDATES = getattr(settings, 'POOLSCHED_CANDIDATES', 4)
+
 
 class SchedWorker:
     """Workers for which jobs are scheduled"""
 
-    def _get_random_user_ready(self, max=1):
-        """Get random user ids, for users with ready Intentions.
+    def _get_users_ready(self, max=1, kinds=None):
+        """Get the next users, for users with ready Intentions.
 
         Ready intentions are those that are in READY status (do not have
         pending previous intentions), and still don't have a job.
+        Users are picked from the set of users with ready intentions
+        (see ReadyUser), in proportion to their weights, and skipping
+        those holding as many jobs as their cap (see UserShare).
 
-        :param max: maximum number of users
-        :returns:   list of User objects
+        :param max:   maximum number of users
+        :param kinds: kinds of the ready intentions (None: any kind)
+        :returns:     list of User objects
         """
-        q = User.objects.filter(intention__isnull=False,
-                                intention__previous=None,
-                                intention__job=None).distinct()
-        count = q.count()
-        try:
-            users = [q[i] for i in sample(range(count), min(max, count))]
-        except IndexError:
-            users = []
-        return users
+        return ReadyUser.objects.pick(max=max, kinds=kinds)
+
+    def _kinds(self, intention_order=None):
+        """Kinds of the intentions of an intention order (see Intention.kinds)
+
+        :param intention_order: intention order (default: that of the worker)
+        :returns:               list of kinds, or None for any kind
+        """
+        intention_order = intention_order or self.intention_order
+        if Intention in intention_order:
+            return None
+        return sorted({kind for intention_type in intention_order for kind in intention_type.kinds()})
 
-    def _get_intentions(self, users, max=1):
+    def _get_intentions(self, users, max=1, intention_order=None):
         """Get intentions suitable to run, for a list of users
 
-        This is called by a worker looking for new jobs
+        This is called by a worker looking for new jobs. Some candidate
+        intentions are selected for all the users at once, for each
+        intention type (following the intention order, see
+        IntentionManager.selectable_by_user). Then users are checked in
+        order (see ReadyUser.pick): candidates whose resources are
+        exhausted are skipped (see Resource.objects.available), and the
+        best of the rest are taken (see _order_intentions).
 
         :user_ids: list of User ids to check intentions
         :param max: maximum number of intentions to return
+        :param intention_order: intention order (default: that of the worker)
         """
 
+        limit = max if max > CANDIDATES else CANDIDATES
+        # Candidates of all the users, with a query for each intention type
+        candidates = defaultdict(list)
+        pending = list(users)
+        for intention_type in intention_order or self.intention_order:
+            if not pending:
+                break
+            selected = intention_type.objects.selectable_by_user(pending, max=limit)
+            for user_id, user_intentions in selected.items():
+                candidates[user_id].extend(user_intentions)
+            pending = [user for user in pending
+                       if len(candidates[user.id if user is not None else None]) < limit]
         intentions = []
         for user in users:
             logger.debug(user)
-            for intention_type in self.intention_order:
-                intentions.extend(intention_type.objects.selectable_intentions(user=user, max=max))
-                if len(intentions) >= max:
-                    break
+            user_intentions = candidates[user.id if user is not None else None]
+            if not user_intentions and ReadyUser.objects.discard(user):
+                # Still ready, but nothing selectable now: let other users go first
+                ReadyUser.objects.charge([user], {user.id: 1})
+            available = Resource.objects.available(user_intentions)
+            if user_intentions and not available:
+                # Waiting for resources: let other users go first
+                ReadyUser.objects.charge([user], {user.id: 1})
+            intentions.extend(self._order_intentions(available))
             if len(intentions) >= max:
                 break
         return intentions[0:max]
 
-    def _new_job(self, intentions):
-        """Create a new job for this worker, given a list of intentions
+    def _order_intentions(self, intentions):
+        """Order intentions, the best to run first
+
+        Intentions of later phases go first (see Intention.phase).
+        Then, those with the highest response ratio: (time waiting +
+        predicted runtime) / predicted runtime (see RuntimeStat), which
+        favours short jobs, without starving long ones.
+
+        :param intentions: list of intentions
+        :returns:          list of intentions, ordered
+        """
+        if len(intentions) < 2:
+            return intentions
+        current = now()
+
+        def priority(item):
+            intention, predicted = item
+            runtime = max(predicted if predicted is not None else RUNTIME_DEFAULT, 1)
+            waiting = (current - intention.created).total_seconds()
+            return -intention.phase, -(waiting + runtime) / runtime
+
+        predictions = RuntimeStat.objects.predict(intentions)
+        return [intention for intention, _ in sorted(zip(intentions, predictions), key=priority)]
+
+    def _new_jobs(self, intentions, max=1):
+        """Create new jobs for this worker, given a list of intentions
 
         This relies on the intention having both `running_job` and
         `create_job` methods.
         * If there is a running job of a similar intention
-        (eg, one for the same repo), assign it to the intention,
-        and go for the next intention.
-        * If there is no running job, try to create a new job,
-        return it if success, else go fot the next intention
-        * If no job can be created, return None.
+        (eg, one for the same repo), skip the intention. Intentions
+        with a dedup_key are just attached to that job when claimed,
+        with no need of checking running_job().
+        * Jobs for the rest of intentions are claimed at once
+        (see IntentionManager.claim_jobs), skipping those
+        being claimed by other workers.
+
+        :param intentions: list of intentions
+        :param max:        maximum number of jobs
+        :returns:          list of jobs, with worker assigned
+        """
+
+        candidates = [intention for intention in intentions
+                      if intention.dedup_key() is not None or intention.running_job() is None]
+        return Intention.objects.claim_jobs(candidates, self.worker, max=max)
+
+    def _new_job(self, intentions):
+        """Create a new job for this worker, given a list of intentions
 
         :param intentions: list of intentions
         :returns:          job, with worker assigned, or None
         """
 
-        job = None
-        for intention in intentions:
-            job = intention.running_job()
-            if job is None:
-                # Create job and assign the worker
-                job = intention.create_job(self.worker)
-                break
-            else:
-                # There is a job but not for this worker
-                job = None
-        return job
+        jobs = self._new_jobs(intentions, max=1)
+        return jobs[0] if jobs else None
 
-    def get_new_job(self, max_users=2, max_intentions=1):
-        """Get a new job to run in this worker
+    def get_new_jobs(self, max_users=2, max_intentions=1, max_jobs=1, intention_order=None):
+        """Get a batch of new jobs to run in this worker
 
-        Get a list of users (randomly), then a list of intentions
-        for them, finally produce a job for one of the intentions.
+        Get a list of users (by their share), then a list of intentions
+        for them, finally produce jobs for some of the intentions.
         It is convenient to have more than one user in the
         list of users whose intentions will be checked,
         just in case some intentions are ready but not ready
         to go, because of lack of tokens or something else,
         of they are already addressed by some running job
         (which will get the intention).
-        If no job can be obtained this way, None is returned
+        If no job can be obtained this way, an empty list is returned
 
         :param max_users: maximum number of users with intentions ready to check
         :param max_intentions: maximum number of intentions to check
-        :returns: job ready to run, or None
+        :param max_jobs: maximum number of jobs to get
+        :param intention_order: intention order (default: that of the worker)
+        :returns: list of jobs ready to run
         """
 
-        users = self._get_random_user_ready(max=max_users)
+        users = self._get_users_ready(max=max_users, kinds=self._kinds(intention_order))
         logger.debug("get_job() users: " + str(users))
-        intentions = self._get_intentions(users=users, max=max_intentions)
+        intentions = self._get_intentions(users=users, max=max_intentions, intention_order=intention_order)
         logger.debug("get_job() intentions: " + str(intentions))
-        job = self._new_job(intentions)
-        if job is not None:
+        # Users pay for the intentions they got, even if no job is finally created
+        ReadyUser.objects.charge(users, Counter(intention.user_id for intention in intentions))
+        jobs = self._new_jobs(intentions, max=max_jobs)
+        for job in jobs:
             logger.debug("get_job() job: " + str(model_to_dict(job)))
-        return job
+        return jobs
+
+    def get_new_job(self, max_users=2, max_intentions=1):
+        """Get a new job to run in this worker
+
+        See get_new_jobs().
 
-    def next_job(self):
-        """Get the next job to run, among those WAITING"""
+        :param max_users: maximum number of users with intentions ready to check
+        :param max_intentions: maximum number of intentions to check
+        :returns: job ready to run, or None
+        """
+
+        jobs = self.get_new_jobs(max_users=max_users, max_intentions=max_intentions)
+        return jobs[0] if jobs else None
+
+    def next_job(self, intention_order=None):
+        """Get the next job to run, among those WAITING
+
+        :param intention_order: intention order (default: that of the worker)
+        """
         job = None
-        for intention_type in self.intention_order:
+        for intention_type in intention_order or self.intention_order:
             job = intention_type.next_job(self.worker)
             if job:
                 break
         return job
 
-    def run_job(self, job):
+    def _intention(self, job):
+        """Intention to run for a job (casted)"""
+        logger.info(f"Job to run: {model_to_dict(job)}")
+        intention = job.intention_set.first().cast()
+        logger.info(f"Intention to run (casted): {model_to_dict(intention)}")
+        return intention
+
+    def _ran(self, job, completed):
+        """Archive the job, if completed, or leave it waiting"""
+        if completed:
+            self.archive(job, ArchivedIntention.OK)
+        else:
+            # Job waiting, some worker will resume it
+            job.worker = None
+            job.lease_expires = None
+            job.save()
+
+    def run_job(self, job, intention=None):
         """Run the job
 
         This will run some code defined by the intention.
         If the job is finished, it is archived and the intention marked as DONE
 
-        :param job: Job object to run
-        :return:    Job object after running
+        :param job:       Job object to run
+        :param intention: intention to run (casted), if already known
+        :return:          Job object after running
         """
 
+        with utils.running_job(job):
+            try:
+                if intention is None:
+                    intention = self._intention(job)
+                started = monotonic()
+                try:
+                    completed = intention.run(job)
+                finally:
+                    metrics.run_duration.observe(monotonic() - started, kind=intention.kind)
+                self._ran(job, completed)
+            except Job.StopException as e:
+                logger.info(f"Intention stopped before completing: {job}")
+                self._failed(job)
+            except Exception as e:
+                logger.error(f"Other exception (error?): {job}, {e}")
+                traceback.print_exc()
+                self._failed(job)
+        return job
+
+    def _failed(self, job):
+        """Archive a job as failed, or release it if that fails too
+
+        If archiving fails (eg, the database failed when the job ran),
+        it is not retried: the job is left waiting, for some worker to
+        resume it.
+        """
         try:
-            logger.info(f"Job to run: {model_to_dict(job)}")
-            intention = job.intention_set.first()
-            logger.info(f"Intention to run (casted): {model_to_dict(intention)} ({model_to_dict(intention.cast())})")
-            completed = intention.cast().run(job)
-            if completed:
-                self.archive(job, ArchivedIntention.OK)
-            else:
-                job.worker = None
-                job.save()
-        except Job.StopException as e:
-            logger.info(f"Intention stopped before completing: {job}")
             self.archive(job, ArchivedIntention.ERROR)
         except Exception as e:
-            logger.error(f"Other exception (error?): {job}, {e}")
-            traceback.print_exc()
-            self.archive(job, ArchivedIntention.ERROR)
+            logger.error(f"Error archiving job, releasing it: {job}, {e}")
+            Job.objects.filter(id=job.id).update(worker=None, lease_expires=None)
+            Change.objects.record(Change.Kind.JOB)
+
+    async def run_job_async(self, job, intention):
+        """Run the job, for intentions with a coroutine run() (see aioruntime)
+
+        As run_job, but awaiting run() in the event loop, and doing
+        the database work in the database threads.
+
+        :param job:       Job object to run
+        :param intention: intention to run (casted)
+        :return:          Job object after running
+        """
+        to_async = aioruntime.database_sync_to_async
+        # Each coroutine runs in a task, with a context of its own
+        with utils.running_job(job):
+            try:
+                started = monotonic()
+                try:
+                    completed = await intention.run(job)
+                finally:
+                    metrics.run_duration.observe(monotonic() - started, kind=intention.kind)
+                await to_async(self._ran)(job, completed)
+            except Job.StopException as e:
+                logger.info(f"Intention stopped before completing: {job}")
+                await to_async(self._failed)(job)
+            except Exception as e:
+                logger.error(f"Other exception (error?): {job}, {e}")
+                traceback.print_exc()
+                await to_async(self._failed)(job)
         return job
 
     def archive(self, job, status):
-        """Archive job and intentions with the status specified"""
-        intentions = list(job.intention_set.all())
+        """Archive job and intentions with the status specified
+
+        See archive.archive_job()
+        """
         logger.info("Archiving job: " + str(model_to_dict(job)))
-        arch_job = ArchJob(created=job.created, worker=job.worker, logs=job.logs)
-        arch_job.save()
-        for intention in intentions:
-            logger.info("Archiving intention: " + str(model_to_dict(intention)))
-            intention.cast().archive(status, arch_job)
-        # delete the job after archiving the intentions to avoid race conditions
-        job.delete()
+        with self.phases.phase('archive'):
+            archive.archive_job(job, status)
 
     def configure_logging(self):
-        """Configure logging for poolsched module"""
+        """Configure logging for poolsched module
+
+        The handler is added once per process, even with several workers
+        (the format names the last one).
+        """
         name = f"worker_{self.worker.id}"
         scheduler_log = logging.getLogger('poolsched')
-        formatter = logging.Formatter(f"[%(levelname)s - {name} - %(asctime)s] - %(message)s")
-        handler = logging.StreamHandler()
+        formatter = logging.Formatter(f"[%(levelname)s - {name} - %(threadName)s - %(asctime)s] - %(message)s")
+        handler = next((handler for handler in scheduler_log.handlers
+                        if getattr(handler, 'worker_handler', False)), None)
+        if handler is None:
+            handler = logging.StreamHandler()
+            handler.worker_handler = True
+            handler.setLevel(LOG_LEVEL)
+            scheduler_log.addHandler(handler)
         handler.setFormatter(formatter)
-        handler.setLevel(LOG_LEVEL)
-        scheduler_log.addHandler(handler)
 
-    def __init__(self, run=False, finish=False, intention_order=None):
-        """Start the party
+    def _run_in_slot(self, job, intention=None):
+        """Run the job in an execution slot (a thread of the pool)"""
+
+        started = monotonic()
+        try:
+            with self.phases.phase('run_job'):
+                if intention is None:
+                    return self.run_job(job)
+                return self.run_job(job, intention)
+        finally:
+            metrics.slot_busy.inc(monotonic() - started, worker=self.worker.id)
+            # Each slot has its own connection to the database
+            connection.close()
+
+    def _submit(self, executor, job):
+        """Run the job in an execution slot, or in the event loop
+
+        Jobs of intentions with a coroutine run() go to the event loop,
+        if this worker has async slots.
+
+        :returns: future, and whether it runs in the event loop
+        """
+        if self.runtime is not None:
+            intention = self._intention(job)
+            if aioruntime.is_async(intention):
+                return self.runtime.submit(self.run_job_async(job, intention)), True
+            return executor.submit(self._run_in_slot, job, intention), False
+        return executor.submit(self._run_in_slot, job), False
+
+    def _free_slots(self, running, running_async):
+        """Free slots of each kind: {False: execution slots, True: async slots}
+
+        :param running:       futures of jobs running
+        :param running_async: those running in the event loop
+        """
+        return {False: max(self.slots - len(running - running_async), 0),
+                True: max(self.async_slots - len(running_async), 0)}
+
+    def _claim_orders(self, free):
+        """Kinds of jobs to claim (those with free slots), with their intention order
+
+        Jobs of intentions with a coroutine run() run in the event loop
+        (async slots), and the rest in execution slots, so each kind is
+        claimed only while it has free slots, not to queue jobs in the
+        executor (or the event loop) waiting for a slot.
+
+        :param free: free slots of each kind (see _free_slots)
+        :returns:    list of (whether run in the event loop, intention order)
+        """
+        if self.runtime is None:
+            return [(False, None)] if free[False] > 0 else []
+        orders = []
+        for in_loop in (False, True):
+            order = [intention_type for intention_type in self.intention_order
+                     if aioruntime.is_async(intention_type) == in_loop]
+            if order and free[in_loop] > 0:
+                orders.append((in_loop, order))
+        return orders
+
+    def _claim_job(self, free, in_loop=False, intention_order=None):
+        """Get a job to run, if there are not too many jobs running
+
+        :param free:            number of free slots in this worker (for the kind of jobs)
+        :param in_loop:         kind of jobs: run in the event loop, or in execution slots
+        :param intention_order: intention order for that kind (default: that of the worker)
+        :returns:               job, or None
+        """
+        claimed = self.claimed[in_loop]
+        if claimed:
+            return claimed.popleft()
+        if self.idle[in_loop]:
+            if not self.feed.changed():
+                # Nothing found last time, and nothing changed since then
+                return None
+            self.idle = dict.fromkeys(self.idle, False)
+        # Get next job, among those available to run
+        with self.phases.phase('next_job'):
+            job = self.next_job(intention_order)
+        logger.debug(f"Job obtained from next_job(): {job}")
+        if job is None:
+            # No job available (but maybe there are available intentions)
+            with self.phases.phase('admission'):
+                admits = self.capacity.admits()
+            logger.debug(f"Jobs in workers (live slots): {self.capacity.assigned} ({self.capacity.slots})")
+            if admits:
+                # Get new jobs for worker, if we don't have too many
+                max_jobs = max(self.batch, free)
+                with self.phases.phase('get_new_jobs'):
+                    jobs = self.get_new_jobs(max_users=4, max_intentions=max_jobs, max_jobs=max_jobs,
+                                             intention_order=intention_order)
+                logger.debug(f"Jobs obtained from get_new_jobs(): {jobs}")
+                self.capacity.claimed(len(jobs))
+                if jobs:
+                    job = jobs[0]
+                    claimed.extend(jobs[1:])
+        self.idle[in_loop] = job is None
+        return job
+
+    def heartbeat(self):
+        """Tell this worker is alive, and renew the leases of its jobs
+
+        Also return to the pool jobs whose leases expired (their
+        workers are probably dead)
+        """
+        self.worker.beat()
+        Job.objects.renew_leases(self.worker)
+        Job.objects.reap()
+        self.last_beat = monotonic()
+
+    def _instrumentation(self):
+        """Report phases, or toggle profiling, if requested or due"""
+        if self.report_requested or \
+                (phases.PHASE_REPORT and monotonic() - self.last_report >= phases.PHASE_REPORT):
+            logger.info(f"Phases of the worker loop:\n{self.phases.format_report()}")
+            self.report_requested = False
+            self.last_report = monotonic()
+        if self.profile_requested:
+            self.profile_requested = False
+            self.profiler.toggle()
+
+    def _install_signals(self):
+        """SIGUSR1: report phases, SIGUSR2: start or stop profiling"""
+        if threading.current_thread() is not threading.main_thread() or not hasattr(signal, 'SIGUSR1'):
+            return
+
+        def request_report(signum, frame):
+            self.report_requested = True
+
+        def request_profile(signum, frame):
+            self.profile_requested = True
+
+        signal.signal(signal.SIGUSR1, request_report)
+        signal.signal(signal.SIGUSR2, request_profile)
+
+    def loop(self, finish=False):
+        """Claim jobs, and run them in the execution slots
+
+        All slots share this claim loop: whenever some slot is free,
+        a job is claimed for it.
 
-        :param run: run the loop, or not (default: False)
         :param finish: finish when there are no more jobs
-        :param intention_order: list of subclasses of intentions to be picked
-        by the worker in the defined order
         """
-        logger.info("Starting scheduler worker...")
-        worker_location = socket.gethostname()
-        self.intention_order = intention_order or []
-        self.worker = Worker.objects.create(status=Worker.Status.UP, machine=worker_location)
-        self.configure_logging()
+        if phases.PROFILE:
+            self.profiler.start()
+        if self.runtime is not None:
+            self.runtime.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix='slot') as executor:
+                self._loop(executor, finish)
+        finally:
+            if self.runtime is not None:
+                self.runtime.stop()
+            self.profiler.stop()
+            logger.info(f"Phases of the worker loop:\n{self.phases.format_report()}")
+            self.dispatcher.release()
+            Worker.objects.filter(id=self.worker.id).update(status=Worker.Status.DOWN)
+
+    def _loop(self, executor, finish):
+        """Loop until finished, submitting jobs to the executor"""
         wait_task_msg = True
-        while run:
-            # Create scheduled intentions
-            ScheduledIntention.objects.create_intentions(self.worker)
-            if wait_task_msg:
-                logger.info("Waiting for new tasks...")
-                wait_task_msg = False
-            # Get next job, among those available to run
-            job = self.next_job()
-            logger.debug(f"Job obtained from next_job(): {job}")
-            if job is None:
-                # No job available (but maybe there are available intentions)
-                # TODO: Change the way we get the number of workers
-                worker_jobs = Job.objects.exclude(worker=None).count()
-                workers_no = Worker.objects.count()
-                logger.debug(f"Jobs in worker (workers): {worker_jobs} ({workers_no})")
-                if worker_jobs < (5 * workers_no):
-                    # Get a new job for worker, if we don't have too many
-                    job = self.get_new_job(max_users=4)
-                    logger.debug(f"Job obtained from get_new_job(): {job}")
+        running = set()
+        # Those running in the event loop
+        running_async = set()
+        last_tick = monotonic()
+        while True:
+            tick = monotonic()
+            metrics.slot_idle.inc(self._free_slots(running, running_async)[False] * (tick - last_tick),
+                                  worker=self.worker.id)
+            last_tick = tick
+            self._instrumentation()
+            if monotonic() - self.last_beat >= capacity.HEARTBEAT:
+                with self.phases.phase('heartbeat'):
+                    self.heartbeat()
+            for future in [future for future in running if future.done()]:
+                running.remove(future)
+                running_async.discard(future)
+                if future.exception() is not None:
+                    logger.error(f"Error in execution slot: {future.exception()}")
+            job = None
+            free = self._free_slots(running, running_async)
+            orders = self._claim_orders(free)
+            if orders:
+                # Create scheduled intentions (if this worker is the dispatcher)
+                with self.phases.phase('create_intentions'):
+                    self.dispatcher.dispatch()
+                if wait_task_msg:
+                    logger.info("Waiting for new tasks...")
+                    wait_task_msg = False
+                for in_loop, order in orders:
+                    job = self._claim_job(free[in_loop], in_loop=in_loop, intention_order=order)
+                    if job is not None:
+                        break
             if job is not None:
+                self.backoff.reset()
                 if job.worker == self.worker:
                     logger.debug(f"About to run job: {job}")
-                    self.run_job(job)
+                    future, in_loop = self._submit(executor, job)
+                    running.add(future)
+                    if in_loop:
+                        running_async.add(future)
                     wait_task_msg = True
+            elif running:
+                # Wait for some slot to be free
+                wait(running, timeout=self.backoff.next(), return_when=FIRST_COMPLETED)
             else:
                 if finish:
-                    if worker_jobs == 0:
+                    # No jobs in any worker, and no intentions that could get one
+                    self.capacity.refresh(force=True)
+                    if self.capacity.assigned == 0 and not Intention.objects.ready().exists():
                         break
-                sleep(3)
+                sleep(self.backoff.next())
+
+    def __init__(self, run=False, finish=False, intention_order=None, batch=1, slots=1,
+                 metrics_port=None, async_slots=0):
+        """Start the party
+
+        :param run: run the loop, or not (default: False)
+        :param finish: finish when there are no more jobs
+        :param intention_order: list of subclasses of intentions to be picked
+        by the worker in the defined order
+        :param batch: maximum number of new jobs claimed at once
+        :param slots: number of jobs run at the same time (each in a thread)
+        :param metrics_port: port for serving metrics of this worker (None: don't serve)
+        :param async_slots: number of jobs of intentions with a coroutine run()
+        run at the same time, in an event loop (see aioruntime)
+        """
+        logger.info("Starting scheduler worker...")
+        worker_location = socket.gethostname()
+        self.intention_order = intention_order or []
+        self.batch = batch
+        self.slots = slots
+        self.async_slots = async_slots
+        # Event loop for jobs of intentions with a coroutine run(), if any
+        self.runtime = aioruntime.AsyncRuntime() if async_slots else None
+        # Jobs claimed by this worker, still to run, by kind
+        # (run in the event loop, or in execution slots)
+        self.claimed = {False: deque(), True: deque()}
+        # Live capacity of the pool, for admitting new jobs
+        self.capacity = capacity.Capacity()
+        # Wake up (look for new jobs) only when something changed
+        self.feed = wakeup.ChangeFeed()
+        self.backoff = wakeup.Backoff()
+        # Nothing found last time, by kind
+        self.idle = {False: False, True: False}
+        self.worker = Worker.objects.create(status=Worker.Status.UP, machine=worker_location,
+                                            slots=slots + async_slots, heartbeat=now())
+        self.last_beat = monotonic()
+        # Create scheduled intentions, if elected for that
+        self.dispatcher = dispatcher.Dispatcher(self.worker)
+        # Measures of the phases of the loop, and profiling (see phases)
+        self.phases = phases.Phases()
+        self.profiler = phases.Profiler(f"worker-{self.worker.id}")
+        self.report_requested = self.profile_requested = False
+        self.last_report = monotonic()
+        self._install_signals()
+        self.configure_logging()
+        if metrics_port is not None:
+            metrics.start_http_server(metrics_port)
+        if run:
+            self.loop(finish=finish)
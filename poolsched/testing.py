@@ -0,0 +1,46 @@
+"""Helpers for running workers in tests and benchmarks"""
+
+import threading
+
+from .models.intentions import IntentionManager
+from .schedworker import SchedWorker
+
+
+class KindManager(IntentionManager):
+    """Intentions of the kind of the (proxy) model only"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(kind=self.model._meta.label_lower)
+
+
+class LockedWorker(SchedWorker):
+    """Worker doing its database work holding a lock
+
+    Some backends (SQLite) don't like concurrent transactions (here, from
+    the loops of several workers, or from the loop of a worker and its
+    execution slots or database threads), so they are serialized with
+    db_lock. Intentions run (run()) not holding it.
+    """
+
+    # Shared by all the workers, unless set for some of them
+    db_lock = threading.RLock()
+
+    def heartbeat(self):
+        with self.db_lock:
+            super().heartbeat()
+
+    def _claim_job(self, free, **kwargs):
+        with self.db_lock:
+            return super()._claim_job(free, **kwargs)
+
+    def _intention(self, job):
+        with self.db_lock:
+            return super()._intention(job)
+
+    def _ran(self, job, completed):
+        with self.db_lock:
+            super()._ran(job, completed)
+
+    def _failed(self, job):
+        with self.db_lock:
+            super()._failed(job)
@@ -0,0 +1,91 @@
+"""Dummy intentions, for testing the scheduler without targets"""
+
+from django.db import connection, models
+
+from ..models import Intention, ArchivedIntention, Job
+
+
+class DummyIntention(Intention):
+    """Intention with no resources, completed as soon as it runs"""
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    @property
+    def process_name(self):
+        return 'Dummy'
+
+    def running_job(self):
+        return None
+
+    @classmethod
+    def next_job(cls, worker):
+        return None
+
+    def run(self, job):
+        return True
+
+    def archive(self, status, arch_job):
+        self.delete()
+
+
+class DummyArchivedIntention(ArchivedIntention):
+    """Archived dummy intention (table created by DummyTablesMixin)"""
+
+    name = models.CharField(max_length=20, default='')
+
+    class Meta:
+        app_label = 'poolsched'
+        managed = False
+
+
+class ArchivedDummyIntention(DummyIntention):
+    """Dummy intention archived in bulk, as DummyArchivedIntention"""
+
+    archived_class = DummyArchivedIntention
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    def archived_fields(self):
+        return {'name': f'dummy-{self.id}'}
+
+    archive = Intention.archive
+
+
+class WaitingDummyIntention(DummyIntention):
+    """Dummy intention whose jobs may be waiting for a worker to resume them"""
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    @classmethod
+    def next_job(cls, worker):
+        job = Job.objects.filter(worker=None, intention__kind=cls._meta.label_lower)\
+            .order_by('created').first()
+        if job is None:
+            return None
+        return job.assign_worker(worker)
+
+
+class DummyTablesMixin:
+    """Create tables for dummy models not managed by migrations"""
+
+    dummy_models = [DummyArchivedIntention]
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.dummy_models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in cls.dummy_models:
+                editor.delete_model(model)
@@ -0,0 +1,100 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.utils.timezone import now
+
+from ..admin import ApproximatePaginator
+from ..models import ArchJob, ArchivedIntention, Intention, Job, Log, Worker
+from .dummy import DummyIntention, DummyArchivedIntention, DummyTablesMixin
+
+User = get_user_model()
+
+
+class TestChangelists(DummyTablesMixin, TestCase):
+    """Test the number of queries of the changelists of the admin"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='admin', first_name='Admin',
+                                        is_staff=True, is_superuser=True)
+        self.client.force_login(self.user)
+
+    def add_rows(self, count):
+        for _ in range(count):
+            worker = Worker.objects.create(machine='machine')
+            job = Job.objects.create(worker=worker, logs=Log.objects.create(location='job.log'))
+            previous = DummyIntention.objects.create(user=self.user)
+            intention = DummyIntention.objects.create(user=self.user, job=job)
+            intention.previous.add(previous)
+            arch_job = ArchJob.objects.create(created=now(), worker=worker, logs=job.logs)
+            DummyArchivedIntention.objects.create(user=self.user, created=now(), arch_job=arch_job)
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_bounded(self):
+        """Changelists run the same queries whatever the number of rows"""
+
+        urls = ['/admin/poolsched/intention/', '/admin/poolsched/archivedintention/',
+                '/admin/poolsched/worker/', '/admin/poolsched/job/', '/admin/poolsched/archjob/']
+        self.add_rows(1)
+        counts = {url: self.queries(url) for url in urls}
+        self.add_rows(10)
+        self.assertEqual({url: self.queries(url) for url in urls}, counts)
+
+    def test_child(self):
+        """Children are shown from the kind, with no queries"""
+
+        self.add_rows(1)
+        response = self.client.get('/admin/poolsched/archivedintention/')
+        self.assertContains(response, 'dummyarchivedintention(')
+        response = self.client.get('/admin/poolsched/intention/')
+        self.assertContains(response, 'dummyintention(')
+
+    def test_previous_count(self):
+        """Previous intentions are counted for each intention"""
+
+        self.add_rows(2)
+        response = self.client.get('/admin/poolsched/intention/')
+        counts = {intention.id: intention.previous_count for intention in response.context['cl'].result_list}
+        self.assertEqual(counts, {intention.id: intention.previous.count() for intention in Intention.objects.all()})
+        self.assertEqual(sorted(counts.values()), [0, 0, 1, 1])
+
+
+class TestBackfillKind(DummyTablesMixin, TestCase):
+    """Test setting kinds of rows saved before they had one"""
+
+    def test_backfill(self):
+        """Rows get the kind of their deepest child table (proxies can't be told)"""
+
+        intentions = [Intention.objects.create(), DummyIntention.objects.create()]
+        arch_job = ArchJob.objects.create(created=now())
+        archived = [ArchivedIntention.objects.create(created=now(), arch_job=arch_job),
+                    DummyArchivedIntention.objects.create(created=now(), arch_job=arch_job)]
+        Intention.objects.update(kind='')
+        ArchivedIntention.objects.update(kind='')
+        migration = import_module('poolsched.migrations.0018_backfill_kind')
+        migration.backfill_kinds(apps, None)
+
+        self.assertEqual([Intention.objects.get(id=intention.id).kind for intention in intentions],
+                         ['poolsched.intention', 'poolsched.intention'])
+        self.assertEqual([ArchivedIntention.objects.get(id=intention.id).kind for intention in archived],
+                         ['poolsched.archivedintention', 'poolsched.dummyarchivedintention'])
+
+
+class TestApproximatePaginator(TestCase):
+    """Test counting rows for paginating changelists"""
+
+    def test_exact(self):
+        """Backends with no estimates, and filtered querysets, are counted"""
+
+        for _ in range(3):
+            Intention.objects.create()
+        self.assertEqual(ApproximatePaginator(Intention.objects.order_by('id'), 2).count, 3)
+        self.assertEqual(ApproximatePaginator(Intention.objects.filter(id__gt=0).order_by('id'), 2).count, 3)
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from .. import joblogs
+from ..aioruntime import AsyncRuntime, database_sync_to_async
+from ..models import Intention, Job, Log, ReadyUser, Worker
+from ..schedworker import SchedWorker
+from ..testing import KindManager, LockedWorker
+from ..wakeup import ChangeFeed
+from .dummy import DummyIntention
+
+
+class AsyncDummyIntention(DummyIntention):
+    """Dummy intention waiting for an API, with a coroutine run()"""
+
+    objects = KindManager()
+    # Threads running run(), and the database calls of run()
+    threads = set()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    async def run(self, job):
+        AsyncDummyIntention.threads.add(threading.current_thread().name)
+        await asyncio.sleep(0.5)
+        count = await database_sync_to_async(Job.objects.filter(id=job.id).count)()
+        return count == 1
+
+
+class SyncDummyIntention(DummyIntention):
+    """Dummy intention with a plain run()"""
+
+    objects = KindManager()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    def run(self, job):
+        AsyncDummyIntention.threads.add(threading.current_thread().name)
+        return True
+
+
+joblog = logging.getLogger('poolsched.tests.joblog')
+
+
+class SyncLoggingIntention(DummyIntention):
+    """Dummy intention writing some lines to the log of its job"""
+
+    objects = KindManager()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    def run(self, job):
+        with LockedWorker.db_lock:
+            handler = self._create_log_handler(job)
+        joblog.addHandler(handler)
+        try:
+            for line in range(5):
+                joblog.info(f"Line {line} of job {job.id}")
+                time.sleep(0.05)
+        finally:
+            joblog.removeHandler(handler)
+            handler.close()
+        return True
+
+
+class AsyncLoggingIntention(DummyIntention):
+    """Dummy intention writing some lines to the log of its job, with a coroutine run()"""
+
+    objects = KindManager()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    def _locked_log_handler(self, job):
+        with LockedWorker.db_lock:
+            return self._create_log_handler(job)
+
+    async def run(self, job):
+        handler = await database_sync_to_async(self._locked_log_handler)(job)
+        joblog.addHandler(handler)
+        try:
+            for line in range(4):
+                joblog.info(f"Line {line} of job {job.id}")
+                await asyncio.sleep(0.05)
+            # Records from the database threads of the coroutine are of the job too
+            await database_sync_to_async(joblog.info)(f"Line 4 of job {job.id}")
+        finally:
+            joblog.removeHandler(handler)
+            handler.close()
+        return True
+
+
+class TestAsyncRuntime(TransactionTestCase):
+    """Test running coroutine run() methods in the event loop of a worker"""
+
+    def setUp(self):
+        AsyncDummyIntention.threads = set()
+
+    def run_worker(self, intention_order, **kwargs):
+        ReadyUser.objects.all().delete()
+        worker = LockedWorker(intention_order=intention_order, **kwargs)
+        # Intentions have no user: get them directly
+        worker._get_users_ready = lambda max=1, kinds=None: [None]
+        worker.feed = ChangeFeed(full_poll=0)
+        worker.dispatcher.dispatch = lambda: None
+        worker.loop(finish=True)
+        return worker
+
+    def test_many(self):
+        """Jobs of coroutines run at the same time, with no thread each"""
+
+        for _ in range(20):
+            AsyncDummyIntention.objects.create()
+        started = time.monotonic()
+        self.run_worker([AsyncDummyIntention], slots=1, async_slots=20, batch=20)
+        self.assertLess(time.monotonic() - started, 20 * 0.5 / 2)
+        self.assertEqual(Intention.objects.count(), 0)
+        self.assertEqual(Job.objects.count(), 0)
+        self.assertEqual(AsyncDummyIntention.threads, {'aio'})
+
+    def test_mixed(self):
+        """Intentions with a plain run() still run in the execution slots"""
+
+        AsyncDummyIntention.objects.create()
+        SyncDummyIntention.objects.create()
+        self.run_worker([SyncDummyIntention, AsyncDummyIntention], slots=1, async_slots=2)
+        self.assertEqual(Intention.objects.count(), 0)
+        self.assertEqual({name.split('_')[0] for name in AsyncDummyIntention.threads}, {'aio', 'slot'})
+
+    def test_job_logs(self):
+        """Logs of jobs running at the same time get only their own records"""
+
+        SyncLoggingIntention.objects.create()
+        AsyncLoggingIntention.objects.create()
+        AsyncLoggingIntention.objects.create()
+        with tempfile.TemporaryDirectory() as logs_dir, override_settings(JOB_LOGS=logs_dir):
+            self.run_worker([SyncLoggingIntention, AsyncLoggingIntention], slots=1, async_slots=2)
+            joblogs.writer.flush()
+            self.assertEqual(Log.objects.count(), 3)
+            for log in Log.objects.all():
+                job_id = log.location.split('.')[0].split('-')[1]
+                lines = [line.split(' - ')[-1] for line in joblogs.LogReader.for_log(log).lines()]
+                self.assertEqual(lines, [f"Line {line} of job {job_id}\n" for line in range(5)])
+
+    def test_claim_orders(self):
+        """Only jobs of kinds with free slots are claimed"""
+
+        worker = SchedWorker(intention_order=[SyncDummyIntention, AsyncDummyIntention], slots=1, async_slots=2)
+        self.assertEqual(worker._free_slots({1, 2}, {2}), {False: 0, True: 1})
+        self.assertEqual(worker._free_slots({1, 2, 3}, set()), {False: 0, True: 2})
+        self.assertEqual(worker._claim_orders({False: 0, True: 1}), [(True, [AsyncDummyIntention])])
+        self.assertEqual(worker._claim_orders({False: 1, True: 0}), [(False, [SyncDummyIntention])])
+        self.assertEqual(worker._claim_orders({False: 0, True: 0}), [])
+
+    def test_archive_error(self):
+        """Jobs whose archive fails after an error are released, not archived again"""
+
+        worker = SchedWorker(intention_order=[AsyncDummyIntention], async_slots=1)
+        intention = AsyncDummyIntention.objects.create()
+        job = intention.create_job(worker.worker)
+        archived = []
+
+        def archive(job, status):
+            archived.append(status)
+            raise RuntimeError('Database error')
+
+        worker.archive = archive
+        worker._ran = archive
+        asyncio.run(worker.run_job_async(job, intention))
+        job.refresh_from_db()
+        self.assertEqual((job.worker, job.lease_expires), (None, None))
+        self.assertEqual(len(archived), 2)
+
+    def test_stop(self):
+        """Coroutines still running are cancelled when the runtime stops"""
+
+        runtime = AsyncRuntime()
+        runtime.start()
+        future = runtime.submit(asyncio.sleep(60))
+        runtime.stop()
+        self.assertTrue(future.cancelled())
+
+
+class TestClaimKinds(TestCase):
+    """Test claiming jobs for the slots of a kind of intentions"""
+
+    def test_other_kinds_ahead(self):
+        """Users with only intentions of other kinds don't block claiming jobs"""
+
+        User = get_user_model()
+        for rank in range(6):
+            user = User.objects.create(username=f'async-{rank}')
+            AsyncDummyIntention.objects.create(user=user)
+            ReadyUser.objects.create(user=user, rank=rank)
+        user = User.objects.create(username='sync')
+        intention = SyncDummyIntention.objects.create(user=user)
+        ReadyUser.objects.create(user=user, rank=6)
+        worker = SchedWorker(intention_order=[SyncDummyIntention, AsyncDummyIntention], slots=1, async_slots=2)
+
+        job = worker._claim_job(1, in_loop=False, intention_order=[SyncDummyIntention])
+        self.assertEqual(job.intention_set.get(), intention)
+        self.assertEqual(list(ReadyUser.objects.filter(user__username__startswith='async')
+                              .order_by('rank').values_list('rank', flat=True)),
+                         list(range(6)))
@@ -0,0 +1,139 @@
+import datetime
+import os
+import tempfile
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+
+from django.utils.timezone import now
+
+from .. import joblogs
+from ..archive import archive_job, compact
+from ..models import Intention, Job, ArchJob, ArchivedIntention, ArchiveSummary, Log, Worker
+from .dummy import DummyIntention, DummyArchivedIntention, ArchivedDummyIntention, DummyTablesMixin
+
+User = get_user_model()
+
+
+class TestArchive(DummyTablesMixin, TestCase):
+    """Test archiving jobs and their intentions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='A')
+        cls.worker = Worker.objects.create()
+
+    def create_job(self, intentions, intention_class=ArchivedDummyIntention):
+        job = Job.objects.create(worker=self.worker)
+        for _ in range(intentions):
+            intention_class.objects.create(user=self.user, job=job)
+        return job
+
+    def test_archive(self):
+        """Intentions are archived in bulk, and deleted with the job"""
+
+        job = self.create_job(3)
+        ids = list(job.intention_set.values_list('id', flat=True))
+        arch_job = archive_job(job, ArchivedIntention.ERROR)
+
+        self.assertEqual(Intention.objects.count(), 0)
+        self.assertEqual(Job.objects.count(), 0)
+        self.assertEqual(ArchJob.objects.get(), arch_job)
+        archived = DummyArchivedIntention.objects.order_by('id')
+        self.assertEqual([a.name for a in archived], [f'dummy-{i}' for i in ids])
+        for a in archived:
+            self.assertEqual(a.status, ArchivedIntention.ERROR)
+            self.assertEqual(a.user, self.user)
+            self.assertEqual(a.arch_job, arch_job)
+
+    def test_next_ready(self):
+        """Intentions after the archived ones are updated"""
+
+        job = self.create_job(2)
+        intention = Intention.objects.create(user=self.user)
+        intention.previous.add(*job.intention_set.all())
+        intention.refresh_from_db()
+        self.assertEqual(intention.pending_previous, 2)
+        archive_job(job, ArchivedIntention.OK)
+        intention.refresh_from_db()
+        self.assertEqual(intention.pending_previous, 0)
+
+    def test_fixed_statements(self):
+        """The number of statements doesn't depend on the number of intentions"""
+
+        counts = []
+        for intentions in (2, 20):
+            job = self.create_job(intentions)
+            with CaptureQueriesContext(connection) as queries:
+                archive_job(job, ArchivedIntention.OK)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_archive_themselves(self):
+        """Intentions with no archived_class archive themselves"""
+
+        job = self.create_job(2, intention_class=DummyIntention)
+        archive_job(job, ArchivedIntention.OK)
+        self.assertEqual(Intention.objects.count(), 0)
+        self.assertEqual(Job.objects.count(), 0)
+
+
+class TestCompact(DummyTablesMixin, TestCase):
+    """Test compacting archived intentions older than the retention period"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='A')
+
+    def archive(self, days, count, status=ArchivedIntention.OK, runtime=10):
+        completed = now() - datetime.timedelta(days=days)
+        arch_job = ArchJob.objects.create(created=completed - datetime.timedelta(seconds=runtime),
+                                          archived=completed)
+        for _ in range(count):
+            archived = DummyArchivedIntention.objects.create(user=self.user, created=arch_job.created,
+                                                             status=status, arch_job=arch_job)
+            ArchivedIntention.objects.filter(id=archived.id).update(completed=completed)
+        return arch_job
+
+    def test_compact(self):
+        """Old archived intentions are summarized by day, and deleted with their jobs"""
+
+        self.archive(100, 2)
+        self.archive(100, 1, status=ArchivedIntention.ERROR)
+        self.archive(100, 3, runtime=20)
+        recent = self.archive(1, 2)
+        self.assertEqual(compact(days=90, batch=2), (6, 3))
+        self.assertEqual(list(ArchJob.objects.all()), [recent])
+        self.assertEqual(DummyArchivedIntention.objects.count(), 2)
+        summaries = {summary.status: summary for summary in ArchiveSummary.objects.all()}
+        self.assertEqual(len(summaries), 2)
+        self.assertEqual(summaries[ArchivedIntention.OK].count, 5)
+        self.assertAlmostEqual(summaries[ArchivedIntention.OK].runtime, 80)
+        self.assertEqual(summaries[ArchivedIntention.ERROR].count, 1)
+        self.assertEqual(summaries[ArchivedIntention.OK].user, self.user)
+
+    def test_logs(self):
+        """Logs of deleted archived jobs are deleted, with their files"""
+
+        with tempfile.TemporaryDirectory() as logs_dir, override_settings(JOB_LOGS=logs_dir):
+            old, recent = self.archive(100, 1), self.archive(1, 1)
+            for arch_job in (old, recent):
+                arch_job.logs = Log.objects.create(location=f'job-{arch_job.id}.log')
+                arch_job.save()
+                for name in (arch_job.logs.location, arch_job.logs.location + joblogs.INDEX_SUFFIX):
+                    with open(os.path.join(logs_dir, name), 'w') as file:
+                        file.write('Some log\n')
+            with self.captureOnCommitCallbacks(execute=True):
+                compact(days=90)
+            self.assertEqual(list(Log.objects.all()), [recent.logs])
+            self.assertEqual(sorted(os.listdir(logs_dir)), [f'job-{recent.id}.log', f'job-{recent.id}.log.idx'])
+
+    def test_add(self):
+        """Summaries of the same day, user and status add up"""
+
+        self.archive(100, 2)
+        compact(days=90)
+        self.archive(100, 1)
+        compact(days=90)
+        self.assertEqual(ArchiveSummary.objects.get().count, 3)
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils.timezone import now
+
+from ..capacity import Capacity, live_workers
+from ..models import Worker, Job
+
+
+class TestCapacity(TestCase):
+    """Test the cached live capacity of workers"""
+
+    def test_beat(self):
+        """Heartbeats make workers live"""
+
+        worker = Worker.objects.create()
+        self.assertEqual(list(live_workers()), [])
+        worker.beat()
+        self.assertEqual(list(live_workers()), [worker])
+        worker.refresh_from_db()
+        self.assertEqual(worker.status, Worker.Status.UP)
+
+    def test_dead_workers(self):
+        """Workers with old heartbeats, or no heartbeat, don't count"""
+
+        Worker.objects.create(slots=2, heartbeat=now())
+        Worker.objects.create(slots=3, heartbeat=now() - timedelta(days=1))
+        Worker.objects.create(slots=4)
+        capacity = Capacity(jobs_per_slot=5)
+        capacity.refresh()
+        self.assertEqual(capacity.slots, 2)
+
+    def test_admits(self):
+        """Admit jobs while there are less than jobs_per_slot per live slot"""
+
+        worker = Worker.objects.create(slots=1, heartbeat=now())
+        capacity = Capacity(jobs_per_slot=2)
+        self.assertTrue(capacity.admits())
+        Job.objects.create(worker=worker)
+        capacity.refresh(force=True)
+        self.assertTrue(capacity.admits())
+        capacity.claimed(1)
+        self.assertFalse(capacity.admits())
+
+    def test_no_workers(self):
+        """No live workers, no room for jobs"""
+
+        self.assertFalse(Capacity().admits())
+
+    def test_cached(self):
+        """The database is not queried until it is time to refresh"""
+
+        Worker.objects.create(slots=1, heartbeat=now())
+        capacity = Capacity(refresh=3600)
+        with self.assertNumQueries(2):
+            capacity.admits()
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                capacity.admits()
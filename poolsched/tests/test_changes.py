@@ -0,0 +1,87 @@
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+from django.utils.timezone import now
+
+from ..models import Intention, Job, ArchJob, Change, ScheduledIntention
+from ..wakeup import Backoff, ChangeFeed
+
+User = get_user_model()
+
+
+class TestChanges(TransactionTestCase):
+    """Test recording changes in the change feed
+
+    Changes are recorded when transactions commit, so we need real ones"""
+
+    def assertChanges(self, kinds):
+        self.assertEqual(list(Change.objects.order_by('id').values_list('kind', flat=True)), kinds)
+
+    def test_intention(self):
+        """New intentions are recorded"""
+
+        Intention.objects.create()
+        self.assertChanges([Change.Kind.INTENTION])
+
+    def test_job(self):
+        """Jobs waiting for a worker are recorded"""
+
+        job = Job.objects.create()
+        self.assertChanges([])
+        job.save()
+        self.assertChanges([Change.Kind.JOB])
+
+    def test_archive(self):
+        """Archived jobs are recorded"""
+
+        ArchJob.objects.create(created=now())
+        self.assertChanges([Change.Kind.ARCHIVE])
+
+    def test_scheduled(self):
+        """Scheduled intentions are recorded"""
+
+        user = User.objects.create(username='A')
+        ScheduledIntention.objects.create(intention_class='a.b', kwargs={}, user=user)
+        self.assertChanges([Change.Kind.SCHEDULED])
+
+    def test_prune(self):
+        """Only the most recent changes are kept"""
+
+        for _ in range(5):
+            Change.objects.create(kind=Change.Kind.JOB)
+        last = Change.objects.last_id()
+        Change.objects.prune(keep=2)
+        self.assertEqual(list(Change.objects.values_list('id', flat=True)), [last - 1, last])
+
+
+class TestChangeFeed(TransactionTestCase):
+    """Test tailing the change feed"""
+
+    def test_changed(self):
+        feed = ChangeFeed(full_poll=3600)
+        self.assertTrue(feed.changed())
+        self.assertFalse(feed.changed())
+        Intention.objects.create()
+        self.assertTrue(feed.changed())
+        self.assertFalse(feed.changed())
+
+    def test_quiet(self):
+        """Claims and renewed leases don't wake up workers"""
+
+        feed = ChangeFeed(full_poll=3600)
+        feed.changed()
+        Change.objects.record(Change.Kind.CLAIM)
+        Change.objects.record(Change.Kind.LEASE)
+        self.assertFalse(feed.changed())
+
+    def test_full_poll(self):
+        """Changed every time, if full_poll is 0"""
+
+        feed = ChangeFeed(full_poll=0)
+        self.assertTrue(feed.changed())
+        self.assertTrue(feed.changed())
+
+    def test_backoff(self):
+        backoff = Backoff(min=1, max=5)
+        self.assertEqual([backoff.next() for _ in range(5)], [1, 2, 4, 5, 5])
+        backoff.reset()
+        self.assertEqual(backoff.next(), 1)
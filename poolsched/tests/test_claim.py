@@ -0,0 +1,97 @@
+import threading
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.contrib.auth import get_user_model
+
+from ..models import Intention, Job, Worker, ReadyUser
+from ..schedworker import SchedWorker
+from .dummy import DummyIntention
+
+User = get_user_model()
+
+
+class TestClaimJobs(TestCase):
+    """Test claiming jobs for several intentions at once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.worker = Worker.objects.create(status=Worker.Status.UP)
+        cls.user = User.objects.create(username='A')
+
+    def test_claim(self):
+        """Claim at most max jobs, each one for an intention"""
+
+        intentions = [Intention.objects.create(user=self.user) for _ in range(5)]
+        jobs = Intention.objects.claim_jobs(intentions, self.worker, max=3)
+        self.assertEqual(len(jobs), 3)
+        self.assertEqual(Job.objects.filter(worker=self.worker).count(), 3)
+        self.assertEqual(Intention.objects.ready().count(), 2)
+
+    def test_claim_twice(self):
+        """Intentions with a job are not claimed again"""
+
+        intentions = [Intention.objects.create(user=self.user) for _ in range(5)]
+        jobs1 = Intention.objects.claim_jobs(intentions, self.worker, max=3)
+        jobs2 = Intention.objects.claim_jobs(intentions, self.worker, max=3)
+        self.assertEqual(len(jobs1), 3)
+        self.assertEqual(len(jobs2), 2)
+        self.assertEqual(Intention.objects.filter(job=None).count(), 0)
+
+    def test_claim_empty(self):
+        """No intentions, no jobs"""
+
+        self.assertEqual(Intention.objects.claim_jobs([], self.worker, max=3), [])
+
+    def test_get_new_jobs(self):
+        """Get a batch of jobs from the worker"""
+
+        for _ in range(5):
+            DummyIntention.objects.create(user=self.user)
+        # Users are marked as ready on commit
+        ReadyUser.objects.mark([self.user.id])
+        worker = SchedWorker(intention_order=[DummyIntention])
+        jobs = worker.get_new_jobs(max_users=4, max_intentions=4, max_jobs=4)
+        self.assertEqual(len(jobs), 4)
+        self.assertTrue(all(job.worker == worker.worker for job in jobs))
+
+
+class TestClaimContention(TransactionTestCase):
+    """Many workers claiming jobs for the same intentions at the same time"""
+
+    claimers = 8
+    intentions = 40
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_concurrent_claims(self):
+        """Every intention gets exactly one job, and no claimer gives up"""
+
+        candidates = [Intention.objects.create() for _ in range(self.intentions)]
+        workers = [Worker.objects.create(status=Worker.Status.UP) for _ in range(self.claimers)]
+        barrier = threading.Barrier(self.claimers)
+        claimed = {}
+
+        def claim(worker):
+            barrier.wait()
+            jobs = []
+            try:
+                while True:
+                    batch = Intention.objects.claim_jobs(candidates, worker, max=3)
+                    if not batch:
+                        break
+                    jobs.extend(batch)
+            finally:
+                connection.close()
+            claimed[worker.id] = jobs
+
+        threads = [threading.Thread(target=claim, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        jobs = [job for jobs in claimed.values() for job in jobs]
+        self.assertEqual(len(jobs), self.intentions)
+        self.assertEqual(Job.objects.count(), self.intentions)
+        self.assertEqual(Intention.objects.filter(job=None).count(), 0)
+        self.assertEqual(Intention.objects.values('job').distinct().count(), self.intentions)
@@ -0,0 +1,96 @@
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from ..models import Intention, Job, ReadyUser, Worker
+from ..models.jobs import DEDUP_KEY_LENGTH, dedup_key
+from ..schedworker import SchedWorker
+from ..testing import KindManager
+from .dummy import DummyIntention
+
+User = get_user_model()
+
+
+class DedupDummyIntention(DummyIntention):
+    """Dummy intention doing the same as others of its user"""
+
+    objects = KindManager()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    def dedup_key(self):
+        return dedup_key(self.kind, self.user_id)
+
+    def running_job(self):
+        raise AssertionError('running_job() should not be needed')
+
+
+class TestDedupKey(TestCase):
+    """Test keys for coalescing jobs"""
+
+    def test_key(self):
+        """Keys are normalized, and hashed if too long"""
+
+        self.assertEqual(dedup_key('kind', ' repo ', 42), 'kind:repo:42')
+        key = dedup_key('kind', 'x' * DEDUP_KEY_LENGTH)
+        self.assertTrue(key.startswith('sha1:'))
+        self.assertEqual(key, dedup_key('kind', 'x' * DEDUP_KEY_LENGTH))
+        self.assertLessEqual(len(key), DEDUP_KEY_LENGTH)
+
+    def test_unique(self):
+        """There is a single job for each key"""
+
+        Job.objects.create(dedup_key='a')
+        Job.objects.create(), Job.objects.create()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(dedup_key='a')
+
+
+class TestCoalesce(TestCase):
+    """Test attaching intentions to jobs doing the same"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='A')
+        self.worker = Worker.objects.create()
+
+    def test_attach(self):
+        """Intentions with the key of an existing job are attached to it"""
+
+        intention1, intention2 = [DedupDummyIntention.objects.create(user=self.user) for _ in range(2)]
+        job = intention1.create_job(self.worker)
+        self.assertEqual(job.dedup_key, intention1.dedup_key())
+        self.assertIsNone(intention2.create_job(self.worker))
+        intention2.refresh_from_db()
+        self.assertEqual(intention2.job, job)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_attach_created(self):
+        """Intentions are attached to jobs created meanwhile by other workers"""
+
+        intention = DedupDummyIntention.objects.create(user=self.user)
+        attach = intention._attach
+
+        def created_meanwhile(key):
+            if not Job.objects.filter(dedup_key=key).exists():
+                Job.objects.create(dedup_key=key)
+                return None
+            return attach(key)
+
+        intention._attach = created_meanwhile
+        self.assertIsNone(intention.create_job(self.worker))
+        intention.refresh_from_db()
+        self.assertEqual(intention.job.dedup_key, intention.dedup_key())
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_new_jobs(self):
+        """Workers don't check running jobs of intentions with keys"""
+
+        for _ in range(3):
+            DedupDummyIntention.objects.create(user=self.user)
+        ReadyUser.objects.mark([self.user.id])
+        worker = SchedWorker(intention_order=[DedupDummyIntention])
+        jobs = worker.get_new_jobs(max_users=1, max_intentions=3, max_jobs=3)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(Intention.objects.filter(job=jobs[0]).count(), 3)
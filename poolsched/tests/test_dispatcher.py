@@ -0,0 +1,115 @@
+import datetime
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.utils.timezone import now
+
+from ..dispatcher import Dispatcher, LEASE_NAME
+from ..models import Intention, Lease, ScheduledIntention, Worker
+
+User = get_user_model()
+
+DUMMY = 'poolsched.tests.dummy.DummyIntention'
+
+
+class TestLease(TestCase):
+    """Test acquiring leases"""
+
+    def setUp(self):
+        self.worker1 = Worker.objects.create()
+        self.worker2 = Worker.objects.create()
+
+    def test_acquire(self):
+        """Only one worker holds a lease, until it expires or it is released"""
+
+        self.assertTrue(Lease.objects.acquire('test', self.worker1, 30))
+        self.assertFalse(Lease.objects.acquire('test', self.worker2, 30))
+        self.assertTrue(Lease.objects.acquire('test', self.worker1, 30))
+        Lease.objects.release('test', self.worker1)
+        self.assertTrue(Lease.objects.acquire('test', self.worker2, 30))
+
+    def test_expired(self):
+        """Expired leases are taken by other workers"""
+
+        Lease.objects.acquire('test', self.worker1, -1)
+        self.assertTrue(Lease.objects.acquire('test', self.worker2, 30))
+
+
+class TestDispatcher(TestCase):
+    """Test dispatching scheduled intentions"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='A')
+        self.worker1 = Worker.objects.create()
+        self.worker2 = Worker.objects.create()
+
+    def schedule(self, scheduled_at, depends_on=None, **kwargs):
+        return ScheduledIntention.objects.create(intention_class=DUMMY,
+                                                 kwargs={'user_id': self.user.id, **kwargs},
+                                                 user=self.user, scheduled_at=scheduled_at,
+                                                 depends_on=depends_on)
+
+    def test_leader(self):
+        """Only the worker holding the lease creates scheduled intentions"""
+
+        self.schedule(now() - datetime.timedelta(minutes=1))
+        leader, other = Dispatcher(self.worker1), Dispatcher(self.worker2)
+        other.leader = True
+        Lease.objects.acquire(LEASE_NAME, self.worker1, 30)
+        other.dispatch()
+        self.assertFalse(other.leader)
+        self.assertEqual(Intention.objects.count(), 0)
+        leader.dispatch()
+        self.assertEqual(Intention.objects.count(), 1)
+
+    def test_not_due(self):
+        """No queries for scheduled intentions until the next one is due"""
+
+        scheduled = self.schedule(now() + datetime.timedelta(hours=1))
+        dispatcher = Dispatcher(self.worker1)
+        dispatcher.dispatch()
+        self.assertEqual(dispatcher.next_due, scheduled.scheduled_at)
+        with self.assertNumQueries(0):
+            dispatcher.dispatch()
+        self.assertEqual(Intention.objects.count(), 0)
+
+    def test_due(self):
+        """Scheduled intentions due are created, with their children, and rescheduled"""
+
+        user_b, user_c = User.objects.create(username='B'), User.objects.create(username='C')
+        scheduled = self.schedule(now() - datetime.timedelta(minutes=1))
+        child = self.schedule(None, depends_on=scheduled, user_id=user_b.id)
+        self.schedule(None, depends_on=child, user_id=user_c.id)
+        dispatcher = Dispatcher(self.worker1)
+        dispatcher.dispatch()
+
+        self.assertEqual(Intention.objects.count(), 3)
+        self.assertEqual(Intention.objects.get(user=user_c).previous.get().user, user_b)
+        scheduled.refresh_from_db()
+        self.assertEqual(dispatcher.next_due, scheduled.scheduled_at)
+        self.assertGreater(scheduled.scheduled_at, now())
+
+    def test_due_error(self):
+        """Scheduled intentions that can't be created don't stop the rest, and are retried later"""
+
+        wrong = self.schedule(now() - datetime.timedelta(minutes=1), wrong_field=1)
+        scheduled = self.schedule(now() - datetime.timedelta(minutes=1))
+        ScheduledIntention.objects.create_intentions(self.worker1)
+
+        self.assertEqual(Intention.objects.get().user, self.user)
+        wrong.refresh_from_db()
+        scheduled.refresh_from_db()
+        self.assertGreater(wrong.scheduled_at, now())
+        self.assertGreater(scheduled.scheduled_at, wrong.scheduled_at)
+        self.assertIsNone(wrong.worker)
+
+    def test_children_tree(self):
+        """The tree of children is fetched with one query per level"""
+
+        roots = [self.schedule(now()) for _ in range(3)]
+        for root in roots:
+            child = self.schedule(None, depends_on=root)
+            self.schedule(None, depends_on=child)
+        with self.assertNumQueries(3):
+            children = ScheduledIntention.objects.children_tree(roots)
+        self.assertEqual(sum(len(level) for level in children.values()), 6)
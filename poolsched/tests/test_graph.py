@@ -0,0 +1,98 @@
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+
+from ..models import Intention, IntentionGraph, ReadyUser, Change, ScheduledIntention
+from .dummy import DummyIntention
+
+User = get_user_model()
+
+
+class TestIntentionGraph(TransactionTestCase):
+    """Test submitting graphs of intentions
+
+    Ready users and changes are updated when transactions commit,
+    so we need real ones"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='A')
+
+    def previous_ids(self, intention):
+        return set(intention.previous.values_list('id', flat=True))
+
+    def test_submit(self):
+        """Intentions and their links are created"""
+
+        graph = IntentionGraph()
+        first = graph.add(DummyIntention, user=self.user)
+        second = graph.add(Intention, previous=[first], user=self.user)
+        created = graph.submit()
+
+        self.assertEqual(len(created), 2)
+        self.assertEqual(Intention.objects.count(), 2)
+        self.assertEqual(first.intention.kind, 'poolsched.dummyintention')
+        self.assertEqual(self.previous_ids(second.intention), {first.intention.id})
+        self.assertEqual(Intention.objects.get(id=first.intention.id).pending_previous, 0)
+        self.assertEqual(Intention.objects.get(id=second.intention.id).pending_previous, 1)
+        self.assertTrue(ReadyUser.objects.filter(user=self.user).exists())
+        self.assertEqual(Change.objects.count(), 1)
+
+    def test_dedup(self):
+        """Intentions in the database, or twice in the graph, are created once"""
+
+        existing = DummyIntention.objects.create(user=self.user)
+        graph = IntentionGraph()
+        first = graph.add(DummyIntention, user=self.user)
+        second = graph.add(Intention, previous=[first], user_id=self.user.id)
+        third = graph.add(Intention, previous=[first], user=self.user)
+        created = graph.submit()
+
+        self.assertEqual(created, [second.intention])
+        self.assertIs(second, third)
+        self.assertFalse(first.created)
+        self.assertEqual(first.intention.id, existing.id)
+        self.assertEqual(self.previous_ids(second.intention), {existing.id})
+
+    def test_link_existing(self):
+        """Intentions in the database get the new previous intentions"""
+
+        existing = Intention.objects.create(user=self.user)
+        graph = IntentionGraph()
+        graph.add(Intention, previous=[graph.add(DummyIntention, user=self.user)], user=self.user)
+        graph.submit()
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.pending_previous, 1)
+        self.assertEqual(len(self.previous_ids(existing)), 1)
+
+    def test_fixed_statements(self):
+        """The number of statements doesn't depend on the size of the graph"""
+
+        counts = []
+        for size in (2, 20):
+            users = [User.objects.create(username=f'{size}-{i}') for i in range(size)]
+            graph = IntentionGraph()
+            for user in users:
+                graph.add(Intention, previous=[graph.add(DummyIntention, user=user)], user=user)
+            with CaptureQueriesContext(connection) as queries:
+                graph.submit()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_scheduled(self):
+        """Scheduled intentions create their children, once"""
+
+        parent = ScheduledIntention.objects.create(intention_class='poolsched.tests.dummy.DummyIntention',
+                                                   kwargs={'user_id': self.user.id}, user=self.user,
+                                                   repeat=None)
+        ScheduledIntention.objects.create(intention_class='poolsched.models.Intention',
+                                          kwargs={'user_id': self.user.id}, user=self.user,
+                                          depends_on=parent)
+        parent.create_intention()
+        parent.create_intention()
+
+        self.assertEqual(Intention.objects.count(), 2)
+        child = Intention.objects.get(kind='poolsched.intention')
+        parent_intention = Intention.objects.get(kind='poolsched.dummyintention')
+        self.assertEqual(self.previous_ids(child), {parent_intention.id})
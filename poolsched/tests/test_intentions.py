@@ -1,6 +1,20 @@
+from django.db.models.signals import post_save, pre_delete
 from django.test import TestCase
+from django.contrib.auth import get_user_model
 
+from ..models import Change, Job
 from ..models.intentions import Intention
+from .dummy import DummyIntention
+
+User = get_user_model()
+
+
+class ProxyIntention(Intention):
+    """Intention of a proxy class"""
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
 
 
 class TestBasic(TestCase):
@@ -112,7 +126,7 @@ class TestDeepPrevious(TestCase):
 
 
 class TestCast(TestCase):
-    """Test _subfields and _subfields_list"""
+    """Test cast and cast_many"""
 
     def test_cast(self):
         """Test cast"""
@@ -120,3 +134,130 @@ class TestCast(TestCase):
         intention = Intention()
         casted = intention.cast()
         self.assertEqual(casted, intention)
+
+    def test_kind(self):
+        """Kind is set when saved"""
+
+        self.assertEqual(Intention.objects.create().kind, 'poolsched.intention')
+        self.assertEqual(DummyIntention.objects.create().kind, 'poolsched.dummyintention')
+
+    def test_cast_child(self):
+        """Cast to the class of the kind, with a single query"""
+
+        intention = Intention.objects.get(id=DummyIntention.objects.create().id)
+        with self.assertNumQueries(1):
+            casted = intention.cast()
+        self.assertIsInstance(casted, DummyIntention)
+        self.assertEqual(casted.id, intention.id)
+        with self.assertNumQueries(0):
+            self.assertIs(casted.cast(), casted)
+
+    def test_cast_no_kind(self):
+        """Intentions with no kind are probed, and get their kind"""
+
+        intention = Intention.objects.create()
+        Intention.objects.filter(id=intention.id).update(kind='')
+        intention = Intention.objects.get(id=intention.id)
+        self.assertEqual(intention.cast(), intention)
+        self.assertEqual(Intention.objects.get(id=intention.id).kind, 'poolsched.intention')
+
+    def test_cast_many(self):
+        """Cast intentions of several kinds, a query per kind"""
+
+        for _ in range(3):
+            Intention.objects.create()
+            DummyIntention.objects.create()
+        with self.assertNumQueries(2):
+            casted = Intention.objects.cast_many(Intention.objects.order_by('id'))
+        self.assertEqual([intention.id for intention in casted],
+                         list(Intention.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual([type(intention) for intention in casted],
+                         [Intention, DummyIntention] * 3)
+
+
+class TestPendingPrevious(TestCase):
+    """Test the counter of pending previous intentions"""
+
+    def assertPending(self, intention, pending):
+        intention.refresh_from_db()
+        self.assertEqual(intention.pending_previous, pending)
+
+    def test_add_remove(self):
+        """Counter follows previous intentions added and removed"""
+
+        intention = Intention.objects.create()
+        previous1 = intention.previous.create()
+        previous2 = Intention.objects.create()
+        intention.previous.add(previous2)
+        self.assertPending(intention, 2)
+        intention.previous.remove(previous1)
+        self.assertPending(intention, 1)
+        intention.previous.clear()
+        self.assertPending(intention, 0)
+
+    def test_add_reverse(self):
+        """Counter follows previous intentions added from the other side"""
+
+        previous = Intention.objects.create()
+        intention1 = Intention.objects.create()
+        intention2 = Intention.objects.create()
+        previous.intention_set.add(intention1, intention2)
+        self.assertPending(intention1, 1)
+        self.assertPending(intention2, 1)
+        previous.intention_set.clear()
+        self.assertPending(intention1, 0)
+        self.assertPending(intention2, 0)
+
+    def test_delete(self):
+        """Deleting (archiving) a previous intention decrements the counter"""
+
+        intention = Intention.objects.create()
+        previous1 = intention.previous.create()
+        previous2 = intention.previous.create()
+        previous1.delete()
+        self.assertPending(intention, 1)
+        Intention.objects.filter(id=previous2.id).delete()
+        self.assertPending(intention, 0)
+
+    def test_delete_proxy(self):
+        """Deleting a previous intention of a proxy class decrements the counter"""
+
+        intention = Intention.objects.create()
+        previous = ProxyIntention.objects.create()
+        intention.previous.add(previous)
+        self.assertPending(intention, 1)
+        previous.delete()
+        self.assertPending(intention, 0)
+
+    def test_receivers(self):
+        """Receivers are connected only to intention classes (other models get fast deletes)"""
+
+        for model in (Intention, DummyIntention, ProxyIntention):
+            self.assertTrue(post_save.has_listeners(model))
+            self.assertTrue(pre_delete.has_listeners(model))
+        self.assertFalse(pre_delete.has_listeners(Change))
+        Change.objects.create(kind=Change.Kind.JOB)
+        with self.assertNumQueries(1):
+            Change.objects.all().delete()
+
+    def test_ready(self):
+        """Ready intentions have no pending previous, and no job"""
+
+        intention = Intention.objects.create()
+        previous = intention.previous.create()
+        self.assertEqual(list(Intention.objects.ready()), [previous])
+        previous.job = Job.objects.create()
+        previous.save()
+        self.assertEqual(list(Intention.objects.ready()), [])
+        previous.delete()
+        self.assertEqual(list(Intention.objects.ready()), [intention])
+
+    def test_selectable_intentions(self):
+        """Default selectable intentions: ready ones for the user, oldest first"""
+
+        user = User.objects.create(username='A')
+        intention1 = Intention.objects.create(user=user)
+        intention2 = Intention.objects.create(user=user)
+        Intention.objects.create()
+        selected = Intention.objects.selectable_intentions(user=user, max=2)
+        self.assertEqual(list(selected), [intention1, intention2])
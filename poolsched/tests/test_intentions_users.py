@@ -1,7 +1,7 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
-from ..models import Intention
+from ..models import Intention, Job
 
 User = get_user_model()
 
@@ -27,3 +27,16 @@ class TestBasic(TestCase):
                          intention1)
         self.assertEqual(user.intention_set.get(pk=intention2.pk),
                          intention2)
+
+    def test_selectable_by_user(self):
+        """Oldest ready intentions of several users, with a single query"""
+
+        users = [User.objects.create(username=name) for name in ('A', 'B', 'C')]
+        expected = {}
+        for user in users + [None]:
+            Intention.objects.create(user=user, job=Job.objects.create())
+            intentions = [Intention.objects.create(user=user) for _ in range(3)]
+            expected[user.id if user else None] = intentions[:2]
+        with self.assertNumQueries(1):
+            selected = Intention.objects.selectable_by_user(users + [None], max=2)
+        self.assertEqual(selected, expected)
@@ -0,0 +1,174 @@
+import gzip
+import logging
+import os
+import tempfile
+import threading
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+
+from .. import joblogs
+from ..archive import archive_job
+from ..models import ArchivedIntention, Job, Log
+
+
+class TestLogWriter(TestCase):
+    """Test writing logs through the log writer"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.writer = joblogs.LogWriter(batch=10)
+
+    def tearDown(self):
+        self.writer.stop()
+        self.dir.cleanup()
+
+    def test_handler(self):
+        """Records are written, in order, once the handler is closed"""
+
+        path = os.path.join(self.dir.name, 'job.log')
+        handler = joblogs.JobLogHandler(path, log_writer=self.writer)
+        test_logger = logging.getLogger('poolsched.test_joblogs')
+        test_logger.addHandler(handler)
+        try:
+            for i in range(100):
+                test_logger.warning(f'Record {i}')
+        finally:
+            test_logger.removeHandler(handler)
+            handler.close()
+        self.writer.flush()
+        with open(path) as file:
+            self.assertEqual(file.read().splitlines(), [f'Record {i}' for i in range(100)])
+        self.assertEqual(self.writer.files, {})
+
+    def test_close_apart(self):
+        """Closing a handler doesn't wait for records of other logs to be written"""
+
+        writing = threading.Event()
+        open_file = self.writer._file
+        self.writer._file = lambda path: writing.wait(10) and open_file(path)
+        other = os.path.join(self.dir.name, 'other.log')
+        self.writer.write(other, 'Record\n')
+        handler = joblogs.JobLogHandler(os.path.join(self.dir.name, 'job.log'), log_writer=self.writer)
+        handler.close()
+        self.assertFalse(writing.is_set())
+        writing.set()
+        self.writer.flush()
+        self.assertEqual(list(self.writer.files), [other])
+
+    def test_finish_apart(self):
+        """Jobs don't wait for logs being finished (compressed), even with the queue full"""
+
+        self.writer = joblogs.LogWriter(maxsize=5, batch=10)
+        finishing = threading.Event()
+        self.writer._finish = lambda log_id: finishing.wait(10)
+        self.writer.finish(1)
+        path = os.path.join(self.dir.name, 'job.log')
+        for i in range(100):
+            self.writer.write(path, f'Record {i}\n')
+        self.writer.close(path)
+        self.assertFalse(finishing.is_set())
+        finishing.set()
+        self.writer.flush()
+        self.assertEqual(self.writer.finishing, set())
+
+    def test_compress_file(self):
+        """Compressed files are made of chunks, with an index"""
+
+        path = os.path.join(self.dir.name, 'job.log')
+        content = ''.join(f'Line {i}\n' for i in range(1000)).encode()
+        with open(path, 'wb') as file:
+            file.write(content)
+        compressed = joblogs.compress_file(path, chunk=1000)
+
+        self.assertFalse(os.path.exists(path))
+        with gzip.open(compressed) as file:
+            self.assertEqual(file.read(), content)
+        index = joblogs.read_index(compressed)
+        self.assertEqual(index[-1][:2], (1000, len(content)))
+        for (line, plain, start), (_, _, end) in zip(index, index[1:]):
+            with open(compressed, 'rb') as file:
+                file.seek(start)
+                chunk = gzip.decompress(file.read(end - start))
+            self.assertTrue(chunk.startswith(f'Line {line}\n'.encode()))
+            self.assertTrue(chunk.endswith(b'\n'))
+            self.assertEqual(chunk, content[plain:plain + len(chunk)])
+
+
+class TestLogReader(TestCase):
+    """Test reading lines of logs"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'job.log')
+        log_file = joblogs.LogFile(self.path, every=10)
+        for i in range(95):
+            log_file.write(f'Line {i}\n'.encode())
+        log_file.close()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def expected(self, start, stop):
+        return [f'Line {i}\n' for i in range(start, stop)]
+
+    def test_index(self):
+        """Plain logs are indexed every few lines"""
+
+        self.assertEqual([line for line, _ in joblogs.read_index(self.path)], list(range(10, 95, 10)))
+        log_file = joblogs.LogFile(self.path, every=10)
+        self.assertEqual(log_file.lines, 95)
+        log_file.close()
+
+    def test_plain(self):
+        """Lines of plain logs"""
+
+        reader = joblogs.LogReader(self.path)
+        self.assertEqual(reader.count(), 95)
+        self.assertEqual(reader.lines(0, 3), self.expected(0, 3))
+        self.assertEqual(reader.lines(37, 20), self.expected(37, 57))
+        self.assertEqual(reader.lines(90, 20), self.expected(90, 95))
+        self.assertEqual(reader.lines(100, 20), [])
+        self.assertEqual(reader.tail(5), (90, self.expected(90, 95)))
+
+    def test_compressed(self):
+        """Lines of compressed logs"""
+
+        reader = joblogs.LogReader(joblogs.compress_file(self.path, chunk=50), codec='gzip')
+        self.assertEqual(reader.count(), 95)
+        self.assertEqual(reader.lines(0, 3), self.expected(0, 3))
+        self.assertEqual(reader.lines(37, 20), self.expected(37, 57))
+        self.assertEqual(reader.lines(100, 20), [])
+        self.assertEqual(reader.tail(5), (90, self.expected(90, 95)))
+
+
+class TestArchiveCompress(TransactionTestCase):
+    """Test compressing logs of archived jobs"""
+
+    def test_archive(self):
+        """Logs are compressed after archiving their jobs"""
+
+        with tempfile.TemporaryDirectory() as logs_dir, override_settings(JOB_LOGS=logs_dir):
+            with open(os.path.join(logs_dir, 'job-1.log'), 'w') as file:
+                file.write('Some log\n')
+            log = Log.objects.create(location='job-1.log')
+            job = Job.objects.create(created=now(), logs=log)
+            archive_job(job, ArchivedIntention.OK)
+            joblogs.writer.flush()
+
+            log.refresh_from_db()
+            self.assertEqual(log.codec, Log.Codec.GZIP)
+            self.assertEqual(log.location, 'job-1.log.gz')
+            self.assertEqual(log.size, os.path.getsize(os.path.join(logs_dir, log.location)))
+
+    def test_plain(self):
+        """Sizes of logs not compressed are recorded"""
+
+        with tempfile.TemporaryDirectory() as logs_dir, override_settings(JOB_LOGS=logs_dir):
+            with open(os.path.join(logs_dir, 'job-1.log'), 'w') as file:
+                file.write('Some log\n')
+            log = Log.objects.create(location='job-1.log')
+            joblogs.finish_log(log.id, compress=False)
+
+            log.refresh_from_db()
+            self.assertEqual((log.codec, log.size), (Log.Codec.NONE, len('Some log\n')))
@@ -0,0 +1,26 @@
+from django.test import TransactionTestCase
+
+from ..benchmarks import load
+from ..models import Intention
+
+
+class TestLoad(TransactionTestCase):
+    """Test the load benchmark (a tiny run of it)"""
+
+    def test_run(self):
+        """All intentions, in all levels, are run by the workers"""
+
+        report = load.run(users=3, types=2, depth=3, workers=2, slots=2, poll_max=0.1)
+        results = report['results']
+        self.assertEqual(report['params']['depth'], 3)
+        self.assertEqual(results['intentions'], 9)
+        self.assertEqual(results['jobs'], 9)
+        self.assertEqual(results['remaining'], 0)
+        self.assertEqual(Intention.objects.count(), 0)
+        self.assertGreater(results['claim_queries_per_job'], 0)
+
+    def test_compare(self):
+        report = {'results': {'claims_per_s': 20.0, 'first_job_s': None}}
+        baseline = {'results': {'claims_per_s': 10.0, 'first_job_s': 0.1}}
+        self.assertEqual(load.compare(report, baseline),
+                         {'claims_per_s': {'value': 20.0, 'baseline': 10.0, 'ratio': 2.0}})
@@ -0,0 +1,115 @@
+import threading
+from urllib.request import urlopen
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.contrib.auth import get_user_model
+
+from .. import metrics
+from ..models import Intention, ReadyUser, Worker
+from .dummy import DummyIntention
+
+User = get_user_model()
+
+
+class TestMetrics(TestCase):
+    """Test metrics, and their exposition"""
+
+    def test_render(self):
+        """Counters and histograms in text exposition format"""
+
+        counter = metrics.Counter('test_total', 'Test counter', ['site'])
+        counter.inc(site='a')
+        counter.inc(2, site='a')
+        self.assertEqual(counter.render(), '# HELP test_total Test counter\n'
+                                           '# TYPE test_total counter\n'
+                                           'test_total{site="a"} 3')
+        histogram = metrics.Histogram('test_seconds', 'Test histogram', buckets=(1, 10))
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(histogram.samples(), ['test_seconds_bucket{le="1"} 1',
+                                               'test_seconds_bucket{le="10"} 2',
+                                               'test_seconds_bucket{le="+Inf"} 2',
+                                               'test_seconds_sum 5.5',
+                                               'test_seconds_count 2'])
+
+    def test_claims(self):
+        """Claims are counted, and their waits observed"""
+
+        def created():
+            return metrics.claim_attempts.values.get(('create_job', 'created'), 0)
+
+        before = created()
+        worker = Worker.objects.create()
+        intention = DummyIntention.objects.create()
+        intention.create_job(worker)
+        self.assertIsNone(intention.create_job(worker))
+        self.assertEqual(created(), before + 1)
+        self.assertIn(('poolsched.dummyintention',), metrics.queue_wait.values)
+
+    def test_view(self):
+        """Queue gauges, from the database, for staff users"""
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        user = User.objects.create(username='A', is_staff=True)
+        self.client.force_login(user)
+        DummyIntention.objects.create(user=user)
+        DummyIntention.objects.create(user=user)
+        Intention.objects.create(user=user)
+        ReadyUser.objects.mark([user.id])
+        metrics.refresh_queue(force=True)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('poolsched_queue_depth{kind="poolsched.dummyintention"} 2\n', content)
+        self.assertIn('poolsched_queue_depth{kind="poolsched.intention"} 1\n', content)
+        self.assertIn('poolsched_ready_users 1\n', content)
+        self.assertNotIn('poolsched_claim_attempts_total', content)
+
+    def test_http_server(self):
+        """Workers serve the metrics of their process"""
+
+        server = metrics.start_http_server(0, addr='127.0.0.1')
+        try:
+            with urlopen(f'http://127.0.0.1:{server.server_port}/metrics') as response:
+                content = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('# TYPE poolsched_claim_attempts_total counter', content)
+        self.assertNotIn('poolsched_queue_depth', content)
+
+
+class TestLockMetrics(TransactionTestCase):
+    """Test counting rows found locked"""
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_skipped(self):
+        """Intentions skipped because they are locked are counted as lock failures"""
+
+        def failures():
+            return metrics.lock_failures.values.get(('create_job',), 0)
+
+        intention = DummyIntention.objects.create()
+        worker = Worker.objects.create()
+        locked, release = threading.Event(), threading.Event()
+
+        def lock():
+            try:
+                with transaction.atomic():
+                    Intention.objects.select_for_update().get(id=intention.id)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=lock)
+        thread.start()
+        locked.wait(10)
+        before = failures()
+        try:
+            self.assertIsNone(intention.create_job(worker))
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(failures(), before + 1)
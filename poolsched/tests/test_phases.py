@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from ..models import Intention
+from ..phases import Phases, Profiler
+
+
+class TestPhases(TestCase):
+    """Test measuring phases of the worker loop"""
+
+    def test_phase(self):
+        """Phases are measured, and aggregated"""
+
+        calls = []
+        phases = Phases(hooks=[lambda *args: calls.append(args)])
+        for _ in range(2):
+            with phases.phase('create'):
+                Intention.objects.create()
+                Intention.objects.create()
+        with phases.phase('update'):
+            Intention.objects.update(pending_previous=1)
+
+        self.assertEqual([call[0] for call in calls], ['create', 'create', 'update'])
+        report = phases.report(reset=True)
+        self.assertEqual(report['create']['count'], 2)
+        self.assertEqual(report['create']['queries'], 4)
+        self.assertEqual(report['update']['rows'], 4)
+        self.assertEqual(phases.report(), {})
+        with phases.phase('update'):
+            pass
+        self.assertTrue(phases.format_report().startswith('update: 1 calls'))
+
+    def test_failing_hook(self):
+        """Errors in hooks don't break the phase"""
+
+        def hook(*args):
+            raise ValueError
+
+        phases = Phases(hooks=[hook])
+        with self.assertLogs('poolsched.phases', 'ERROR'):
+            with phases.phase('test'):
+                pass
+        self.assertEqual(phases.report()['test']['count'], 1)
+
+    def test_profiler(self):
+        """Profiles are written when profiling stops"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = Profiler('test', directory=directory)
+            self.assertIsNone(profiler.toggle())
+            sum(range(1000))
+            path = profiler.toggle()
+            self.assertTrue(os.path.exists(path))
+            self.assertFalse(profiler.running)
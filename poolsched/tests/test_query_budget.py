@@ -0,0 +1,207 @@
+"""Query budgets for the hot paths of the scheduler
+
+Each hot path runs against fixtures of several sizes, and the number
+of queries it runs must stay within its budget: a fixed number of
+queries, plus (for paths working on a batch) a fixed number for each
+item. N+1 patterns make tests fail, with the queries for each size,
+and the statement repeated the most, in the message.
+
+Budgets are the costs intended by the design of each path, not just
+the queries run today: paths known to be over their budget are marked
+as expected failures (with the reason), instead of raising the budget.
+
+Set POOLSCHED_QUERY_REPORT to print the queries for each size.
+"""
+
+import datetime
+import os
+import re
+import sys
+from collections import Counter
+
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.utils.timezone import now
+
+from ..archive import archive_job
+from ..models import Intention, Job, Worker, ReadyUser, ScheduledIntention, ArchivedIntention
+from ..schedworker import SchedWorker
+from .dummy import DummyIntention, ArchivedDummyIntention, WaitingDummyIntention, DummyTablesMixin
+
+User = get_user_model()
+
+DUMMY = 'poolsched.tests.dummy.DummyIntention'
+ARCHIVED_DUMMY = 'poolsched.tests.dummy.ArchivedDummyIntention'
+SIZES = (1, 10, 50)
+REPORT = os.environ.get('POOLSCHED_QUERY_REPORT')
+
+
+def _statement(sql):
+    """Statement, with no literals (to tell repeated statements)"""
+    return re.sub(r"'[^']*'|\b\d+\b", '?', sql)
+
+
+class QueryBudgetTestCase(DummyTablesMixin, TestCase):
+    """Test case checking the queries of hot paths against their budgets"""
+
+    sizes = SIZES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.worker = Worker.objects.create(status=Worker.Status.UP)
+
+    def users(self, count):
+        first = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        User.objects.bulk_create([User(username=f'budget-{first}-{i}') for i in range(count)])
+        return list(User.objects.filter(id__gt=first).order_by('id'))
+
+    def measure(self, setup, size):
+        """Queries run by the hot path, for a fixture of some size
+
+        The fixture is rolled back afterwards.
+        """
+        with transaction.atomic():
+            run = setup(size)
+            with CaptureQueriesContext(connection) as queries:
+                run()
+            transaction.set_rollback(True)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def assertQueryBudget(self, path, setup, base, per_item=0):
+        """Check the queries of a hot path, for fixtures of several sizes
+
+        :param path:     name of the hot path (for messages)
+        :param setup:    callable building a fixture of some size, and
+                         returning a callable running the hot path
+        :param base:     maximum number of queries, whatever the size
+        :param per_item: maximum number of queries for each item of the fixture
+        """
+        # Warm up caches (content types, classes of intentions)
+        self.measure(setup, self.sizes[0])
+        queries = {size: self.measure(setup, size) for size in self.sizes}
+        counts = {size: len(size_queries) for size, size_queries in queries.items()}
+        series = ', '.join(f'{size}: {count}' for size, count in counts.items())
+        if REPORT:
+            print(f'\n{path} (size: queries): {series}', file=sys.stderr)
+        largest = self.sizes[-1]
+        statement, repeated = Counter(map(_statement, queries[largest])).most_common(1)[0]
+        message = (f'{path} queries (size: queries): {series}. '
+                   f'Most repeated for size {largest} ({repeated} times): {statement}')
+        for size, count in counts.items():
+            self.assertLessEqual(count, base + per_item * size, message)
+
+
+class TestQueryBudget(QueryBudgetTestCase):
+    """Query budgets of the hot paths of the scheduler"""
+
+    def setUp(self):
+        self.sched_worker = SchedWorker(intention_order=[DummyIntention])
+
+    def ready_users(self, size, intention_class=DummyIntention):
+        """Users with a ready intention each"""
+        users = self.users(size)
+        for user in users:
+            intention_class.objects.create(user=user)
+        ReadyUser.objects.mark([user.id for user in users])
+        return users
+
+    def test_get_new_job(self):
+        """Getting a new job doesn't depend on the number of ready users"""
+
+        def setup(size):
+            self.ready_users(size)
+            return lambda: self.assertIsNotNone(self.sched_worker.get_new_job(max_users=4))
+
+        self.assertQueryBudget('get_new_job', setup, base=11)
+
+    def test_get_new_jobs(self):
+        """Getting a batch of jobs runs a fixed number of queries for each job
+
+        Intentions are claimed one by one (each intention creates its
+        own job, in a savepoint: 5 queries). Ready intentions are
+        selected for all the users at once.
+        """
+
+        def setup(size):
+            self.ready_users(size)
+            return lambda: self.assertEqual(len(self.sched_worker.get_new_jobs(
+                max_users=size, max_intentions=size, max_jobs=size)), size)
+
+        self.assertQueryBudget('get_new_jobs', setup, base=6, per_item=5)
+
+    def test_next_job(self):
+        """Resuming a waiting job doesn't depend on the number of waiting jobs"""
+
+        self.sched_worker.intention_order = [WaitingDummyIntention, DummyIntention]
+
+        def setup(size):
+            for user in self.users(size):
+                WaitingDummyIntention.objects.create(user=user, job=Job.objects.create())
+            return lambda: self.assertIsNotNone(self.sched_worker.next_job())
+
+        self.assertQueryBudget('next_job', setup, base=5)
+
+    def test_create_job(self):
+        """Creating a job doesn't depend on the number of intentions"""
+
+        def setup(size):
+            users = self.ready_users(size)
+            intention = Intention.objects.filter(user=users[-1]).get()
+            return lambda: self.assertIsNotNone(intention.create_job(self.worker))
+
+        self.assertQueryBudget('create_job', setup, base=5)
+
+    def test_archive(self):
+        """Archiving a job doesn't depend on the number of its intentions,
+        or of those after them
+
+        Recording runtime statistics (creating those missing, and updating
+        them) and releasing the resources of the job (a single delete) are
+        3 queries of the 20 of the archive pipeline.
+        """
+
+        def setup(size):
+            user = self.users(1)[0]
+            job = Job.objects.create(worker=self.worker)
+            for _ in range(size):
+                intention = ArchivedDummyIntention.objects.create(user=user, job=job)
+                DummyIntention.objects.create(user=user).previous.add(intention)
+            return lambda: archive_job(job, ArchivedIntention.OK)
+
+        self.assertQueryBudget('archive', setup, base=20)
+
+    def test_cast(self):
+        """Casting intentions runs a query per kind, not per intention"""
+
+        def setup(size):
+            user = self.users(1)[0]
+            for _ in range(size):
+                DummyIntention.objects.create(user=user)
+                ArchivedDummyIntention.objects.create(user=user)
+            intentions = list(Intention.objects.all())
+            return lambda: self.assertEqual(len(Intention.objects.cast_many(intentions)), 2 * size)
+
+        self.assertQueryBudget('cast_many', setup, base=2)
+
+    def test_create_intentions(self):
+        """Creating scheduled intentions depends on the depth of their trees,
+        not on the number of them
+
+        Backends that can't return the ids of rows inserted in bulk
+        fetch them back after inserting, with a query for each class
+        of intention (see IntentionGraph.submit).
+        """
+
+        def setup(size):
+            due = now() - datetime.timedelta(minutes=1)
+            for user in self.users(size):
+                root = ScheduledIntention.objects.create(intention_class=DUMMY, kwargs={'user_id': user.id},
+                                                         user=user, scheduled_at=due)
+                ScheduledIntention.objects.create(intention_class=ARCHIVED_DUMMY, kwargs={'user_id': user.id},
+                                                  user=user, depends_on=root)
+            return lambda: ScheduledIntention.objects.create_intentions(self.worker)
+
+        base = 12 if connection.features.can_return_rows_from_bulk_insert else 16
+        self.assertQueryBudget('create_intentions', setup, base=base)
@@ -0,0 +1,144 @@
+from collections import Counter
+
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth import get_user_model
+
+from ..models import Intention, Job, ReadyUser, UserShare
+from ..schedworker import SchedWorker
+from .dummy import DummyIntention
+
+User = get_user_model()
+
+
+class TestReadyUsers(TransactionTestCase):
+    """Test the set of users with ready intentions
+
+    Users are marked when transactions commit, so we need real ones"""
+
+    def test_mark_on_create(self):
+        """Users are added when they get a new intention"""
+
+        user = User.objects.create(username='A')
+        Intention.objects.create(user=user)
+        self.assertTrue(ReadyUser.objects.filter(user=user).exists())
+
+    def test_mark_on_delete_previous(self):
+        """Users are added when a previous intention is deleted"""
+
+        user = User.objects.create(username='A')
+        intention = Intention.objects.create(user=user)
+        previous = intention.previous.create()
+        ReadyUser.objects.all().delete()
+        previous.delete()
+        self.assertTrue(ReadyUser.objects.filter(user=user).exists())
+
+    def test_mark_on_delete_job(self):
+        """Users are added when the job of their intention is deleted"""
+
+        user = User.objects.create(username='A')
+        job = Job.objects.create()
+        Intention.objects.create(user=user, job=job)
+        ReadyUser.objects.all().delete()
+        job.delete()
+        self.assertTrue(ReadyUser.objects.filter(user=user).exists())
+
+    def test_discard(self):
+        """Users are only discarded if they have nothing ready"""
+
+        user = User.objects.create(username='A')
+        intention = Intention.objects.create(user=user)
+        ReadyUser.objects.discard(user)
+        self.assertTrue(ReadyUser.objects.filter(user=user).exists())
+
+        intention.job = Job.objects.create()
+        intention.save()
+        ReadyUser.objects.discard(user)
+        self.assertFalse(ReadyUser.objects.filter(user=user).exists())
+
+    def test_pick(self):
+        """Pick several users, all of them picked in turn when charged"""
+
+        users = [User.objects.create(username=str(i)) for i in range(10)]
+        ReadyUser.objects.mark([user.id for user in users])
+        picked = set()
+        for _ in range(4):
+            some = ReadyUser.objects.pick(max=3)
+            self.assertEqual(len(some), 3)
+            self.assertEqual(len(set(some)), 3)
+            ReadyUser.objects.charge(some, {user.id: 1 for user in some})
+            picked.update(some)
+        self.assertEqual(picked, set(users))
+
+    def test_pick_empty(self):
+        """No users with ready intentions"""
+
+        self.assertEqual(ReadyUser.objects.pick(max=3), [])
+
+    def test_users_ready(self):
+        """Only users with ready intentions are returned"""
+
+        user = User.objects.create(username='A')
+        User.objects.create(username='B')
+        Intention.objects.create(user=user)
+        worker = SchedWorker()
+        self.assertEqual(worker._get_users_ready(max=4), [user])
+
+
+class TestFairShare(TestCase):
+    """Test sharing the pool among users (stride scheduling)"""
+
+    def setUp(self):
+        self.worker = SchedWorker(intention_order=[DummyIntention])
+
+    def user(self, name, intentions, **share):
+        user = User.objects.create(username=name)
+        if share:
+            UserShare.objects.create(user=user, **share)
+        for _ in range(intentions):
+            DummyIntention.objects.create(user=user)
+        ReadyUser.objects.mark([user.id])
+        return user
+
+    def get_jobs(self, count):
+        """Users of the intentions of count new jobs"""
+        users = Counter()
+        for _ in range(count):
+            job = self.worker.get_new_job(max_users=4)
+            users[job.intention_set.get().user.username] += 1
+        return users
+
+    def test_weights(self):
+        """Users get jobs in proportion to their weights"""
+
+        self.user('A', 50, weight=3)
+        self.user('B', 50)
+        self.assertEqual(self.get_jobs(40), {'A': 30, 'B': 10})
+
+    def test_new_user(self):
+        """New users get a job in the next round, even if others have many intentions queued"""
+
+        self.user('power', 200)
+        self.get_jobs(20)
+        self.user('new', 1)
+        self.assertEqual(self.get_jobs(2), {'power': 1, 'new': 1})
+
+    def test_cap(self):
+        """Users don't get more jobs than their cap"""
+
+        self.user('A', 3, max_jobs=1)
+        self.user('B', 3)
+        self.assertEqual(self.get_jobs(4), {'A': 1, 'B': 3})
+        self.assertIsNone(self.worker.get_new_job(max_users=4))
+        Job.objects.filter(intention__user__username='A').delete()
+        self.assertEqual(self.get_jobs(1), {'A': 1})
+
+    def test_lag(self):
+        """Users leaving the set keep their lag when they come back"""
+
+        user = self.user('A', 0)
+        self.user('B', 5)
+        ReadyUser.objects.filter(user=user).update(rank=2)
+        ReadyUser.objects.discard(user)
+        self.assertEqual(UserShare.objects.get(user=user).lag, 2)
+        ReadyUser.objects.mark([user.id])
+        self.assertEqual(ReadyUser.objects.get(user=user).rank, 2)
@@ -0,0 +1,145 @@
+import datetime
+
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.utils.timezone import now
+
+from ..archive import archive_job
+from ..models import ArchivedIntention, Intention, Job, ReadyUser, Resource, Worker
+from ..models.resources import ResourceHold, earliest_cache
+from ..schedworker import SchedWorker
+from ..testing import KindManager
+from .dummy import DummyIntention
+
+User = get_user_model()
+
+
+class TokenDummyIntention(DummyIntention):
+    """Dummy intention needing a token of its user"""
+
+    objects = KindManager()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    def resource_pools(self):
+        return [f'token:{self.user_id}']
+
+
+class TestResources(TestCase):
+    """Test reserving resources"""
+
+    def setUp(self):
+        earliest_cache.clear()
+        self.job1, self.job2 = Job.objects.create(), Job.objects.create()
+
+    def reserve(self, pools, job):
+        with transaction.atomic():
+            resources = Resource.objects.reserve(pools)
+            if resources is not None:
+                Resource.objects.hold(resources, job)
+        return resources
+
+    def test_capacity(self):
+        """Resources are held by no more jobs than their capacity"""
+
+        resource = Resource.objects.create(pool='a', capacity=1)
+        self.assertEqual(self.reserve(['a'], self.job1), [resource])
+        self.assertIsNone(self.reserve(['a'], self.job2))
+        self.job1.delete()
+        self.assertEqual(self.reserve(['a'], self.job2), [resource])
+
+    def test_bucket(self):
+        """Resources with no tokens are available when their bucket is refilled"""
+
+        reset = now() + datetime.timedelta(hours=1)
+        resource = Resource.objects.create(pool='a', capacity=5, limit=10, remaining=1, reset=reset)
+        self.assertEqual(self.reserve(['a'], self.job1), [resource])
+        resource.refresh_from_db()
+        self.assertEqual((resource.remaining, resource.available_at), (0, reset))
+        self.assertIsNone(self.reserve(['a'], self.job2))
+
+        resource.update_bucket(0, now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.reserve(['a'], self.job2), [resource])
+        resource.refresh_from_db()
+        self.assertEqual(resource.remaining, 9)
+
+    def test_exhausted(self):
+        """Only pools with resources found, but not available, are cached as exhausted"""
+
+        Resource.objects.create(pool='a', capacity=1)
+        Resource.objects.create(pool='b', available_at=now() + datetime.timedelta(hours=1))
+        self.reserve(['a'], self.job1)
+        self.assertIsNone(self.reserve(['a', 'b'], self.job2))
+        self.assertEqual(set(earliest_cache.get(['a', 'b'])), {'a'})
+
+    def test_all_or_nothing(self):
+        """Resources of several pools are reserved all of them, or none"""
+
+        Resource.objects.create(pool='a')
+        Resource.objects.create(pool='b', limit=10, remaining=0, reset=now() + datetime.timedelta(hours=1))
+        self.assertIsNone(self.reserve(['a', 'b'], self.job1))
+        self.assertEqual(self.job1.resources.count(), 0)
+
+    def test_available(self):
+        """Intentions with exhausted resources are skipped, with cached times"""
+
+        user1, user2 = User.objects.create(username='A'), User.objects.create(username='B')
+        Resource.objects.create(pool=f'token:{user1.id}')
+        Resource.objects.create(pool=f'token:{user2.id}', available_at=now() + datetime.timedelta(hours=1))
+        intentions = [TokenDummyIntention(user=user1), TokenDummyIntention(user=user2),
+                      TokenDummyIntention(user=User.objects.create(username='C'))]
+        self.assertEqual(Resource.objects.available(intentions), intentions[:1])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Resource.objects.available(intentions), intentions[:1])
+        self.assertEqual(len(queries), 0)
+
+
+class TestCreateJob(TestCase):
+    """Test reserving resources when creating jobs"""
+
+    def setUp(self):
+        earliest_cache.clear()
+        self.user = User.objects.create(username='A')
+        self.resource = Resource.objects.create(pool=f'token:{self.user.id}')
+        self.worker = Worker.objects.create()
+
+    def test_create_job(self):
+        """Jobs are created only if their resources are available"""
+
+        intention1, intention2 = [TokenDummyIntention.objects.create(user=self.user) for _ in range(2)]
+        job = intention1.create_job(self.worker)
+        self.assertEqual(list(job.resources.all()), [self.resource])
+        self.assertIsNone(intention2.create_job(self.worker))
+        self.assertEqual(Job.objects.count(), 1)
+        job.delete()
+        self.assertIsNotNone(intention2.create_job(self.worker))
+
+    def test_archive(self):
+        """Archiving a job releases its resources, with a single statement"""
+
+        job = TokenDummyIntention.objects.create(user=self.user).create_job(self.worker)
+        with CaptureQueriesContext(connection) as queries:
+            archive_job(job, ArchivedIntention.OK)
+        self.assertEqual(ResourceHold.objects.count(), 0)
+        holds = [query['sql'] for query in queries.captured_queries
+                 if ResourceHold._meta.db_table in query['sql']]
+        self.assertEqual(len(holds), 1)
+        self.assertTrue(holds[0].startswith('DELETE'))
+
+    def test_skip_user(self):
+        """Users waiting for resources let others go first"""
+
+        self.resource.update_bucket(0, now() + datetime.timedelta(hours=1))
+        TokenDummyIntention.objects.create(user=self.user)
+        other = User.objects.create(username='B')
+        Resource.objects.create(pool=f'token:{other.id}')
+        intention = TokenDummyIntention.objects.create(user=other)
+        ReadyUser.objects.mark([self.user.id, other.id])
+        worker = SchedWorker(intention_order=[TokenDummyIntention])
+        self.assertEqual(worker.get_new_job(max_users=1), None)
+        self.assertEqual(worker.get_new_job(max_users=1).intention_set.get(), intention)
+        self.assertTrue(Intention.objects.filter(user=self.user, job=None).exists())
@@ -0,0 +1,134 @@
+import datetime
+import statistics
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.utils.timezone import now
+
+from ..archive import archive_job
+from ..models import Intention, Job, ReadyUser, RuntimeStat, ArchivedIntention
+from ..models.runtimes import RUNTIME_ALPHA
+from ..schedworker import SchedWorker
+from ..testing import KindManager
+from .dummy import DummyIntention
+
+User = get_user_model()
+
+KIND = 'poolsched.dummyintention'
+
+
+class KeyedDummyIntention(DummyIntention):
+    """Dummy intention with runtime statistics for each intention"""
+
+    objects = KindManager()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+    def runtime_key(self):
+        return f'intention-{self.id}'
+
+
+class LateDummyIntention(DummyIntention):
+    """Dummy intention of a later phase"""
+
+    phase = 1
+    objects = KindManager()
+
+    class Meta:
+        proxy = True
+        app_label = 'poolsched'
+
+
+class TestRuntimeStat(TestCase):
+    """Test the statistics of runtimes"""
+
+    def test_record(self):
+        """First samples give their mean and variance"""
+
+        samples = [3, 5, 10, 2, 7]
+        RuntimeStat.objects.record([(KIND, 'repo', seconds) for seconds in samples[:2]])
+        RuntimeStat.objects.record([(KIND, 'repo', seconds) for seconds in samples[2:]])
+        for key in ('repo', ''):
+            stat = RuntimeStat.objects.get(kind=KIND, key=key)
+            self.assertEqual(stat.count, 5)
+            self.assertAlmostEqual(stat.mean, statistics.mean(samples))
+            self.assertAlmostEqual(stat.variance, statistics.pvariance(samples))
+
+    def test_rolling(self):
+        """Old samples are eventually forgotten"""
+
+        RuntimeStat.objects.record([(KIND, '', 1000)] * 10)
+        RuntimeStat.objects.record([(KIND, '', 10)] * int(10 / RUNTIME_ALPHA))
+        self.assertLess(RuntimeStat.objects.get(kind=KIND, key='').mean, 20)
+
+    def test_predict(self):
+        """Predictions for keys with few samples come from their kind"""
+
+        RuntimeStat.objects.record([(KIND, 'intention-1', 100)] * 3 + [(KIND, 'intention-2', 200)])
+        known, other = KeyedDummyIntention(id=1, kind=KIND), KeyedDummyIntention(id=2, kind=KIND)
+        unknown = Intention(id=3, kind='poolsched.other')
+        self.assertEqual(RuntimeStat.objects.predict([known, other, unknown]), [100, 125, None])
+
+    def test_long_key(self):
+        """Keys too long are truncated, when recording and when predicting"""
+
+        known = KeyedDummyIntention(id=1, kind=KIND)
+        known.runtime_key = lambda: 'x' * 300
+        RuntimeStat.objects.record([(KIND, known.runtime_key(), 100)] * 3 + [(KIND, '', 200)])
+        self.assertEqual(RuntimeStat.objects.predict([known]), [100])
+
+    def test_archive(self):
+        """Runtimes of jobs completed are recorded when they are archived"""
+
+        job = Job.objects.create(created=now() - datetime.timedelta(seconds=30))
+        DummyIntention.objects.create(job=job)
+        archive_job(job, ArchivedIntention.OK)
+        self.assertAlmostEqual(RuntimeStat.objects.get(kind=KIND, key='').mean, 30, delta=5)
+
+        job = Job.objects.create()
+        DummyIntention.objects.create(job=job)
+        archive_job(job, ArchivedIntention.ERROR)
+        self.assertEqual(RuntimeStat.objects.get(kind=KIND, key='').count, 1)
+
+
+class TestOrder(TestCase):
+    """Test ordering the candidate intentions of a user"""
+
+    def setUp(self):
+        self.worker = SchedWorker(intention_order=[LateDummyIntention, KeyedDummyIntention])
+        self.user = User.objects.create(username='A')
+        ReadyUser.objects.mark([self.user.id])
+
+    def ready(self, model, runtime=None, waiting=0):
+        intention = model.objects.create(user=self.user)
+        Intention.objects.filter(id=intention.id)\
+            .update(created=now() - datetime.timedelta(seconds=waiting))
+        if runtime is not None:
+            RuntimeStat.objects.record([(intention.kind, intention.runtime_key(), runtime)] * 3)
+        return intention
+
+    def next_intention(self):
+        return self.worker.get_new_job(max_users=4).intention_set.get()
+
+    def test_shortest(self):
+        """Intentions predicted to be shorter go first"""
+
+        self.ready(KeyedDummyIntention, runtime=3600, waiting=60)
+        short = self.ready(KeyedDummyIntention, runtime=10, waiting=30)
+        self.assertEqual(self.next_intention(), short)
+
+    def test_waiting(self):
+        """Long intentions go first when they have waited long enough"""
+
+        long = self.ready(KeyedDummyIntention, runtime=3600, waiting=24 * 3600)
+        self.ready(KeyedDummyIntention, runtime=10, waiting=30)
+        self.assertEqual(self.next_intention(), long)
+
+    def test_phase(self):
+        """Intentions of later phases go first"""
+
+        self.ready(KeyedDummyIntention, runtime=10, waiting=60)
+        late = self.ready(LateDummyIntention, runtime=3600)
+        self.assertEqual(self.next_intention(), late)
@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+
+from django.test import TransactionTestCase
+
+from ..models import Job, ReadyUser
+from ..schedworker import SchedWorker
+from ..testing import LockedWorker
+from ..wakeup import ChangeFeed
+from .dummy import DummyIntention
+
+
+class SlowWorker(LockedWorker):
+    """Worker whose jobs just wait for a while, and then are deleted"""
+
+    def run_job(self, job):
+        with self.db_lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.threads.add(threading.get_ident())
+        time.sleep(0.2)
+        with self.db_lock:
+            job.intention_set.all().delete()
+            job.delete()
+            self.running -= 1
+        return job
+
+
+class TestSlots(TransactionTestCase):
+    """Test running several jobs at the same time in a worker"""
+
+    def run_worker(self, slots, intentions=4, stale=0):
+        for _ in range(intentions):
+            DummyIntention.objects.create()
+        ReadyUser.objects.all().delete()
+        worker = SlowWorker(intention_order=[DummyIntention], slots=slots, batch=slots)
+        # Jobs claimed meanwhile, as seen by the cached capacity
+        worker.capacity.refresh(force=True)
+        worker.capacity.claimed(stale)
+        worker.running = worker.max_running = 0
+        worker.threads = set()
+        # Intentions have no user: get them directly
+        worker._get_users_ready = lambda max=1, kinds=None: [None]
+        # Jobs are not archived, so there are no changes to wait for
+        worker.feed = ChangeFeed(full_poll=0)
+        worker.loop(finish=True)
+        return worker
+
+    def test_slots(self):
+        """Jobs run at the same time, all of them for the same worker"""
+
+        worker = self.run_worker(slots=4)
+        self.assertEqual(worker.max_running, 4)
+        self.assertEqual(len(worker.threads), 4)
+        self.assertEqual(Job.objects.count(), 0)
+        self.assertEqual(DummyIntention.objects.count(), 0)
+
+    def test_one_slot(self):
+        """With a single slot, jobs run one after the other"""
+
+        worker = self.run_worker(slots=1, intentions=2)
+        self.assertEqual(worker.max_running, 1)
+        self.assertEqual(DummyIntention.objects.count(), 0)
+        self.assertEqual(worker.phases.report()['run_job']['count'], 2)
+
+    def test_finish_ready(self):
+        """Workers don't finish while there are ready intentions"""
+
+        self.run_worker(slots=1, intentions=1, stale=100)
+        self.assertEqual(DummyIntention.objects.count(), 0)
+
+    def test_logging(self):
+        """Workers in the same process share a single handler"""
+
+        SchedWorker()
+        SchedWorker()
+        handlers = [handler for handler in logging.getLogger('poolsched').handlers
+                    if getattr(handler, 'worker_handler', False)]
+        self.assertEqual(len(handlers), 1)
@@ -0,0 +1,137 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+
+from django.utils.timezone import now
+
+from .. import joblogs, metrics
+from ..models import ArchJob, Job, Log, Worker
+from .dummy import DummyIntention, DummyArchivedIntention, DummyTablesMixin
+
+User = get_user_model()
+
+
+class TestShowLog(TestCase):
+    """Test the view showing logs"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(JOB_LOGS=self.dir.name)
+        self.settings.enable()
+        with open(os.path.join(self.dir.name, 'job-1.log'), 'w') as file:
+            file.writelines(f'Line {i}\n' for i in range(100))
+        self.log = Log.objects.create(location='job-1.log')
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+
+    def tearDown(self):
+        self.settings.disable()
+        self.dir.cleanup()
+
+    def test_page(self):
+        response = self.client.get(f'/logs/{self.log.id}', {'offset': 10, 'limit': 2})
+        self.assertEqual(response.content, b'Line 10\nLine 11\n')
+        self.assertEqual(response['X-Log-Next'], '12')
+
+    def test_tail_compressed(self):
+        joblogs.compress_log(self.log.id)
+        response = self.client.get(f'/logs/{self.log.id}', {'tail': 2})
+        self.assertEqual(response.content, b'Line 98\nLine 99\n')
+        self.assertEqual(response['X-Log-Offset'], '98')
+
+    def test_bad_request(self):
+        response = self.client.get(f'/logs/{self.log.id}', {'offset': -1})
+        self.assertEqual(response.status_code, 400)
+
+    def test_staff(self):
+        self.client.force_login(User.objects.create(username='user'))
+        response = self.client.get(f'/logs/{self.log.id}')
+        self.assertEqual(response.status_code, 302)
+
+
+class TestApi(DummyTablesMixin, TestCase):
+    """Test the JSON API"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='admin', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_pages(self):
+        """Intentions of a user, by pages following the next links"""
+
+        worker = Worker.objects.create()
+        intentions = [DummyIntention.objects.create(user=self.user) for _ in range(5)]
+        intentions[0].job = Job.objects.create(worker=worker)
+        intentions[0].save()
+        intentions[4].previous.add(intentions[3])
+        url, results = f'/api/users/{self.user.id}/intentions?limit=2', []
+        while url:
+            page = self.client.get(url).json()
+            results += page['results']
+            url = page['next']
+        self.assertEqual([row['id'] for row in results], [intention.id for intention in intentions])
+        self.assertEqual([row['state'] for row in results], ['running', 'ready', 'ready', 'ready', 'pending'])
+
+    def test_not_modified(self):
+        """Pollers get 304 until something changes"""
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DummyIntention.objects.create(user=self.user)
+        url = f'/api/users/{self.user.id}/intentions'
+        etag = self.client.get(url)['ETag']
+        # Session and user, and the last change
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            DummyIntention.objects.create(user=self.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_jobs_not_modified(self):
+        """Jobs change when their leases are renewed"""
+
+        worker = Worker.objects.create()
+        with self.captureOnCommitCallbacks(execute=True):
+            DummyIntention.objects.create(user=self.user).create_job(worker)
+        etag = self.client.get('/api/jobs')['ETag']
+        self.assertEqual(self.client.get('/api/jobs', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Job.objects.renew_leases(worker)
+        self.assertEqual(self.client.get('/api/jobs', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_jobs(self):
+        """Jobs of a worker, with their intentions"""
+
+        worker = Worker.objects.create(machine='machine')
+        job = Job.objects.create(worker=worker)
+        intention = DummyIntention.objects.create(user=self.user, job=job)
+        Job.objects.create(worker=Worker.objects.create())
+        results = self.client.get('/api/jobs', {'worker': worker.id}).json()['results']
+        self.assertEqual([(row['id'], row['machine'], row['intentions']) for row in results],
+                         [(job.id, 'machine', [intention.id])])
+        self.assertEqual(self.client.get('/api/jobs', {'worker': 'x'}).status_code, 400)
+
+    def test_archives(self):
+        """Archived intentions, newest first, with their last modification"""
+
+        arch_job = ArchJob.objects.create(created=now())
+        archived = [DummyArchivedIntention.objects.create(user=self.user, created=now(), arch_job=arch_job)
+                    for _ in range(3)]
+        response = self.client.get('/api/archives', {'limit': 2, 'before': archived[2].id + 1})
+        self.assertEqual([row['id'] for row in response.json()['results']], [archived[2].id, archived[1].id])
+        self.assertEqual(response.json()['results'][0]['kind'], 'poolsched.dummyarchivedintention')
+        response = self.client.get('/api/archives', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_summary(self):
+        """Summary from the cached gauges"""
+
+        DummyIntention.objects.create(user=self.user)
+        metrics.refresh_queue(force=True)
+        response = self.client.get('/api/summary')
+        self.assertEqual(response.json()['queue_depth'], {'poolsched.dummyintention': 1})
+        self.assertEqual(response.json()['jobs'], {'running': 0, 'waiting': 0})
+
+    def test_forbidden(self):
+        self.client.force_login(User.objects.create(username='user'))
+        self.assertEqual(self.client.get('/api/summary').status_code, 403)
@@ -1,6 +1,9 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils.timezone import now
 
-from ..models import Worker, Job
+from ..models import Worker, Job, Intention
 
 
 class TestBasic(TestCase):
@@ -51,3 +54,46 @@ class TestBasicActions(TestCase):
             self.assertEqual(len(jobs), round - 1)
 
         self.assertEqual(Worker.objects.all()[0], worker)
+
+
+class TestLeases(TestCase):
+    """Test job leases, and reaping jobs of dead workers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.worker = Worker.objects.create(status=Worker.Status.UP)
+
+    def test_create_job(self):
+        """Jobs created for a worker get a lease"""
+
+        job = Intention.objects.create().create_job(self.worker)
+        self.assertGreater(job.lease_expires, now())
+
+    def test_renew(self):
+        """Leases of the jobs of a worker are renewed"""
+
+        job = Job.objects.create(worker=self.worker, lease_expires=now())
+        other = Job.objects.create(worker=Worker.objects.create(), lease_expires=now())
+        Job.objects.renew_leases(self.worker)
+        job.refresh_from_db()
+        other.refresh_from_db()
+        self.assertGreater(job.lease_expires, other.lease_expires)
+
+    def test_reap(self):
+        """Jobs with expired leases return to the pool, their workers are down"""
+
+        live = Worker.objects.create(status=Worker.Status.UP)
+        expired = Job.objects.create(worker=self.worker, lease_expires=now() - timedelta(seconds=1))
+        leased = Job.objects.create(worker=live, lease_expires=now() + timedelta(minutes=1))
+        self.assertEqual(Job.objects.reap(), 1)
+
+        expired.refresh_from_db()
+        self.assertIsNone(expired.worker)
+        self.assertIsNone(expired.lease_expires)
+        leased.refresh_from_db()
+        self.assertEqual(leased.worker, live)
+        self.assertEqual(Worker.objects.get(id=self.worker.id).status, Worker.Status.DOWN)
+        self.assertEqual(Worker.objects.get(id=live.id).status, Worker.Status.UP)
+
+    def test_reap_nothing(self):
+        self.assertEqual(Job.objects.reap(), 0)
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('logs/<int:log_id>', views.show_log, name='show_log'),
+    path('metrics', views.metrics, name='metrics'),
+    path('api/users/<int:user_id>/intentions', views.api_user_intentions, name='api_user_intentions'),
+    path('api/jobs', views.api_jobs, name='api_jobs'),
+    path('api/archives', views.api_archives, name='api_archives'),
+    path('api/summary', views.api_summary, name='api_summary'),
+]
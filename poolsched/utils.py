@@ -1,5 +1,9 @@
+import contextvars
 import logging
 import time
+from contextlib import contextmanager
+
+from django.db import connection
 
 
 def file_formatter(filename, level=logging.INFO):
@@ -12,5 +16,66 @@ def file_formatter(filename, level=logging.INFO):
     return fh
 
 
+def job_log_handler(filename, level=logging.INFO):
+    """Handler for the log of a job, like file_formatter()
+
+    Records are written by a background thread (see joblogs), so
+    that the job doesn't wait for them to be written.
+    """
+    from .joblogs import JobLogHandler
+
+    fmt = "[%(asctime)s - %(levelname)s - %(name)s] - %(message)s"
+    formatter = logging.Formatter(fmt)
+    formatter.converter = time.gmtime
+    handler = JobLogHandler(filename)
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    return handler
+
+
+# Id of the job running in the current context: the thread of an
+# execution slot, or the task of a coroutine in the event loop
+current_job = contextvars.ContextVar('poolsched_current_job', default=None)
+
+
+@contextmanager
+def running_job(job):
+    """Context manager marking job as the job running in the current context
+
+    Database threads of a coroutine (see aioruntime) get the context
+    of the coroutine, so they are marked too.
+    """
+    token = current_job.set(job.id)
+    try:
+        yield
+    finally:
+        current_job.reset(token)
+
+
+class JobFilter(logging.Filter):
+    """Filter out records not logged while running a job
+
+    Several jobs may be running in this process, in execution slots
+    or in the event loop, and records from any other context (other
+    jobs, the loop of the worker, the event loop itself) are filtered out.
+    """
+
+    def __init__(self, job, name=''):
+        super().__init__(name)
+        self.job_id = job.id
+
+    def filter(self, record):
+        return current_job.get() == self.job_id
+
+
 def mordred_not_imported(*args, **kwargs):
     raise Exception("Mordred was not imported. There was a previous exception.")
+
+
+def skip_locked():
+    """Arguments for select_for_update(), skipping locked rows if possible
+
+    Backends not supporting SKIP LOCKED (MySQL < 8.0.1, MariaDB < 10.6)
+    will wait for locked rows instead.
+    """
+    return {'skip_locked': connection.features.has_select_for_update_skip_locked}
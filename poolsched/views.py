@@ -1 +1,250 @@
-# Create your views here.
+import functools
+import hashlib
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import BadRequest
+from django.db.models import F, Max, Min
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import condition, require_GET
+
+from . import metrics as scheduler_metrics
+from .joblogs import LogReader
+from .models import ArchivedIntention, Change, Intention, Job, Log
+
+# Lines returned by default, and at most
+LOG_PAGE = 1000
+LOG_MAX_PAGE = 10000
+# Token for scraping metrics (Authorization: Bearer <token>), besides staff sessions
+METRICS_TOKEN = getattr(settings, 'POOLSCHED_METRICS_TOKEN', None)
+# Rows returned by the API by default, and at most
+API_PAGE = 100
+API_MAX_PAGE = 1000
+# Token for the API (Authorization: Bearer <token>), besides staff sessions
+API_TOKEN = getattr(settings, 'POOLSCHED_API_TOKEN', None)
+
+
+def _int_param(request, name, default):
+    value = int(request.GET.get(name, default))
+    if value < 0:
+        raise ValueError(name)
+    return value
+
+
+@staff_member_required
+def show_log(request, log_id):
+    """Show lines of the log of a job, as plain text
+
+    Query parameters: tail (number of last lines), or offset (first
+    line, starting with 0) and limit (number of lines). The headers
+    X-Log-Offset and X-Log-Next tell the first line returned, and the
+    first line of the next page.
+    """
+    try:
+        tail = _int_param(request, 'tail', -1) if request.GET.get('tail') else None
+        offset = _int_param(request, 'offset', 0)
+        limit = min(_int_param(request, 'limit', tail or LOG_PAGE), LOG_MAX_PAGE)
+    except ValueError:
+        return HttpResponseBadRequest("offset, limit and tail should be positive integers")
+
+    for retry in (True, False):
+        reader = LogReader.for_log(get_object_or_404(Log, id=log_id))
+        try:
+            if tail is not None:
+                offset, lines = reader.tail(min(tail, LOG_MAX_PAGE))
+            else:
+                lines = reader.lines(offset, limit)
+            break
+        except FileNotFoundError:
+            # Maybe compressed meanwhile: read the log again
+            if not retry:
+                raise Http404("Log file not found")
+
+    response = HttpResponse(''.join(lines), content_type='text/plain; charset=utf-8')
+    response['X-Log-Offset'] = offset
+    response['X-Log-Next'] = offset + len(lines)
+    return response
+
+
+def _authorized(request, token):
+    """Whether the request is from a staff user, or has the token (if any)"""
+    user = request.user
+    if user.is_active and user.is_staff:
+        return True
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''),
+                                                 f'Bearer {token}')
+
+
+def metrics(request):
+    """Gauges about the queue, in Prometheus text format (see metrics)
+
+    For staff users, or requests with the metrics token. Counters and
+    histograms are aggregated in each worker, so they are served by
+    the workers (see metrics.start_http_server), not here.
+    """
+    if not _authorized(request, METRICS_TOKEN):
+        return HttpResponseForbidden()
+    return HttpResponse(scheduler_metrics.render(process=False), content_type=scheduler_metrics.CONTENT_TYPE)
+
+
+def api_view(view):
+    """View of the API (GET only): for staff users, or requests with the API token
+
+    Bad query parameters (BadRequest) get a 400 response.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _authorized(request, API_TOKEN):
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as error:
+            return JsonResponse({'error': str(error)}, status=400)
+    return require_GET(wrapper)
+
+
+def _api_param(request, name):
+    """Positive integer query parameter (None if missing)"""
+    if not request.GET.get(name):
+        return None
+    try:
+        return _int_param(request, name, 0)
+    except ValueError:
+        raise BadRequest(f"{name} should be a positive integer")
+
+
+def _etag(state):
+    """ETag for the state of a resource (a dict of values fingerprinting it)"""
+    return hashlib.sha1(repr(sorted(state.items())).encode()).hexdigest()
+
+
+def _page(request, queryset, descending=False):
+    """Page of rows of a queryset, by keyset pagination on id
+
+    Rows after (or before, if descending) the id in the query parameter
+    after (before) are returned, using the primary key index whatever
+    the page, instead of skipping rows with OFFSET. Ids grow with the
+    creation time, so pages are in order of creation too.
+
+    :param queryset:   queryset of dicts (values()), with id
+    :param descending: newest rows first
+    :returns:          {'results': rows, 'next': URL of the next page, or None}
+    """
+    cursor = 'before' if descending else 'after'
+    limit = min(max(_api_param(request, 'limit') or API_PAGE, 1), API_MAX_PAGE)
+    start = _api_param(request, cursor)
+    if start is not None:
+        queryset = queryset.filter(id__lt=start) if descending else queryset.filter(id__gt=start)
+    rows = list(queryset.order_by('-id' if descending else 'id')[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params[cursor] = rows[-1]['id']
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return {'results': rows, 'next': next_url}
+
+
+def _intention_state(row):
+    if row['pending_previous']:
+        return 'pending'
+    if row['job'] is None:
+        return 'ready'
+    return 'waiting' if row['worker'] is None else 'running'
+
+
+def _changes_etag(request, *args, **kwargs):
+    """ETag for intentions and jobs in flight: the last change recorded
+
+    Intentions and jobs don't change without recording a change (see
+    Change), so this is a single indexed lookup, whatever their number.
+    """
+    return _etag({'change': Change.objects.last_id()})
+
+
+@api_view
+@condition(etag_func=_changes_etag)
+def api_user_intentions(request, user_id):
+    """Intentions of a user, with their state
+
+    States: pending (previous intentions not done yet), ready (no
+    job yet), waiting (job waiting for a worker), running. Paginated
+    (see _page), oldest first.
+    """
+    intentions = Intention.objects.filter(user_id=user_id)\
+        .values('id', 'kind', 'created', 'pending_previous', 'job', worker=F('job__worker'))
+    page = _page(request, intentions)
+    for row in page['results']:
+        row['state'] = _intention_state(row)
+    return JsonResponse(page)
+
+
+def _jobs(request):
+    jobs = Job.objects.all()
+    worker = _api_param(request, 'worker')
+    if worker is not None:
+        jobs = jobs.filter(worker_id=worker)
+    return jobs
+
+
+@api_view
+@condition(etag_func=_changes_etag)
+def api_jobs(request):
+    """Jobs in flight (optionally, those of a worker), with their intentions
+
+    Paginated (see _page), oldest first.
+    """
+    jobs = _jobs(request).values('id', 'created', 'worker', 'lease_expires', machine=F('worker__machine'))
+    page = _page(request, jobs)
+    by_id = {row['id']: row for row in page['results']}
+    for row in by_id.values():
+        row['intentions'] = []
+    for job_id, intention_id in Intention.objects.filter(job__in=by_id)\
+            .order_by('id').values_list('job', 'id'):
+        by_id[job_id]['intentions'].append(intention_id)
+    return JsonResponse(page)
+
+
+def _archives(request):
+    archives = ArchivedIntention.objects.all()
+    user = _api_param(request, 'user')
+    if user is not None:
+        archives = archives.filter(user_id=user)
+    if request.GET.get('status'):
+        archives = archives.filter(status=request.GET['status'])
+    return archives
+
+
+def _archives_state(request):
+    """Fingerprint of the archived intentions requested (computed once per request)"""
+    if not hasattr(request, '_poolsched_archives'):
+        request._poolsched_archives = _archives(request).order_by()\
+            .aggregate(first=Min('id'), last=Max('id'), completed=Max('completed'))
+    return request._poolsched_archives
+
+
+@api_view
+@condition(etag_func=lambda request: _etag(_archives_state(request)),
+           last_modified_func=lambda request: _archives_state(request)['completed'])
+def api_archives(request):
+    """Archived intentions (optionally, those of a user, or with a status)
+
+    Paginated (see _page), newest first.
+    """
+    archives = _archives(request).values('id', 'kind', 'user', 'status', 'created', 'completed', 'arch_job')
+    return JsonResponse(_page(request, archives, descending=True))
+
+
+@api_view
+@condition(etag_func=lambda request: _etag(scheduler_metrics.queue_summary()[0]),
+           last_modified_func=lambda request: scheduler_metrics.queue_summary()[1])
+def api_summary(request):
+    """Summary of the queue: intentions waiting by kind, users ready, jobs by state
+
+    Read from the gauges of the metrics, refreshed every few seconds
+    (see metrics.refresh_queue), instead of counting rows each time.
+    """
+    summary, refreshed = scheduler_metrics.queue_summary()
+    return JsonResponse(dict(summary, refreshed=refreshed))
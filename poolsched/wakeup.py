@@ -0,0 +1,63 @@
+"""Waking up idle workers only when something changed
+
+Idle workers check the change feed (see models.Change), which is cheap,
+before running the queries for finding new jobs. While nothing changes,
+they sleep for increasing periods of time.
+"""
+
+from time import monotonic
+
+from django.conf import settings
+
+from .models import Change
+
+# Minimum and maximum time (seconds) idle workers sleep between checks
+POLL_MIN = getattr(settings, 'POOLSCHED_POLL_MIN', 0.1)
+POLL_MAX = getattr(settings, 'POOLSCHED_POLL_MAX', 2)
+# Look for new jobs at least this often (seconds), even with no changes,
+# since some jobs may become ready just with time (eg, tokens reset)
+FULL_POLL = getattr(settings, 'POOLSCHED_FULL_POLL', 30)
+
+
+class Backoff:
+    """Exponential backoff, for sleeping while idle"""
+
+    def __init__(self, min=POLL_MIN, max=POLL_MAX):
+        self.min = min
+        self.max = max
+        self.current = min
+
+    def reset(self):
+        self.current = self.min
+
+    def next(self):
+        """Time to sleep now (seconds), doubling it for the next time"""
+        current = self.current
+        self.current = min(self.current * 2, self.max)
+        return current
+
+
+class ChangeFeed:
+    """Tail the change feed, with a high-water mark (last change seen)"""
+
+    def __init__(self, full_poll=FULL_POLL):
+        self.full_poll = full_poll
+        self.seen = None
+        self.last_full = None
+
+    def changed(self):
+        """Check if something changed since the last check
+
+        Also True the first time, and if full_poll seconds passed
+        since the last time it was True (old changes are pruned then).
+        """
+        last = Change.objects.last_id(exclude=Change.QUIET)
+        now = monotonic()
+        timeout = self.last_full is None or now - self.last_full >= self.full_poll
+        changed = timeout or last != self.seen
+        self.seen = last
+        if changed:
+            self.last_full = now
+        if timeout:
+            Change.objects.prune()
+        return changed
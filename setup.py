@@ -19,7 +19,8 @@ setup(
     url='https://gitlab.com/cauldronio/cauldron-pool-scheduler',
     packages=['poolsched',
               'poolsched.models',
-              'poolsched.migrations',],
+              'poolsched.migrations',
+              'poolsched.benchmarks',],
     include_package_data=True,
     keywords="django scheduler cauldron",
     classifiers=[
@@ -29,11 +30,11 @@ setup(
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Topic :: Database :: Database Engines/Servers',
     ],
+    python_requires='>=3.7',
     install_requires=[
         "django>=3.0",
         "mysqlclient"